@@ -0,0 +1,88 @@
+"""
+Micro-benchmark for flatten_sources.
+
+Compares the single-pass rewrite against the previous algorithm, which ran one
+freshly formatted re.sub per (file x path) pair. Run from the api/ folder:
+
+    python -m benchmarks.bench_flatten --files 10 50 200
+"""
+import argparse
+import re
+import time
+
+from models.models import SourceFile
+from routers.chat import flatten_sources
+
+
+def legacy_flatten_sources(sources):
+    # The old O(files^2 x content) loop, with its look-behind turned into a
+    # capture group so it runs on Python's re module
+    path_map = {}
+    for file in sources:
+        path_map[file.path] = "/" + file.path.split("/")[-1]
+    updated_sources = []
+    for file in sources:
+        content = file.content
+        for orig, flat in path_map.items():
+            if orig != flat:
+                content = re.sub(
+                    rf'(\b(?:include|use)\s*<)/?{re.escape(orig.lstrip("/"))}(?=>)',
+                    lambda m, flat=flat: m.group(1) + flat.lstrip("/"),
+                    content
+                )
+        updated_sources.append(SourceFile(path=flat_path(file.path), content=content))
+    return updated_sources
+
+
+def flat_path(path):
+    return "/" + path.split("/")[-1]
+
+
+def synthetic_project(n_files: int, body_lines: int = 40):
+    # main.scad uses every helper, each helper includes the next one
+    helpers = [f"/lib/part_{i:03d}.scad" for i in range(n_files - 1)]
+    sources = [SourceFile(
+        path="/main.scad",
+        content="".join(f"use <{h.lstrip('/')}>;\n" for h in helpers) + "assembly();\n",
+    )]
+    for i, path in enumerate(helpers):
+        nxt = helpers[(i + 1) % len(helpers)]
+        body = "".join(f"    translate([{j}, 0, 0]) cube([1, 2, 3]);\n" for j in range(body_lines))
+        sources.append(SourceFile(
+            path=path,
+            content=f"include <{nxt.split('/')[-1]}>;\nmodule part_{i:03d}() {{\n{body}}}\n",
+        ))
+    return sources
+
+
+def best_of(fn, arg, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(file_counts, repeat: int = 5):
+    results = []
+    for n in file_counts:
+        sources = synthetic_project(n)
+        legacy = best_of(legacy_flatten_sources, sources, repeat)
+        single = best_of(flatten_sources, sources, repeat)
+        results.append({"files": n, "legacy_s": legacy, "single_pass_s": single, "speedup": legacy / single})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[5, 20, 50, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(f"{'files':>6} {'legacy ms':>10} {'single-pass ms':>15} {'speedup':>8}")
+    for r in run(args.files, args.repeat):
+        print(f"{r['files']:>6} {r['legacy_s'] * 1e3:>10.2f} {r['single_pass_s'] * 1e3:>15.2f} {r['speedup']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Offline benchmark of the whole request pipeline.
+
+Per project of the corpus (recorded answers, the threads.scad bolt and
+synthetic many-file projects) it times flatten_sources, the playground URL
+encoding, the OpenSCAD compile, loading the mesh, reducing it to the
+preview face budget and rendering each view from the reduced mesh.
+Then it drives the app in-process through httpx at increasing numbers of
+concurrent clients, with the LLM replaced by recorded answers, and reports
+throughput and latency. Results are written as JSON so runs can be diffed:
+
+    python -m benchmarks.bench_pipeline --output before.json
+    python -m benchmarks.bench_pipeline --output after.json --compare before.json
+
+The compile stage and the render scenario need OPENSCAD_BIN; without it the
+mesh stages use a synthetic sphere instead and say so in the results.
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import services.openscad_render as render
+import services.render_cache as render_cache
+from benchmarks.corpus import corpus, recorded_llm
+from routers import chat as chat_router
+from routers import openscad_render as render_router
+from routers.chat import flatten_sources
+from services.chat import ChatEngine, get_chat_engine
+from services.payload_store import PayloadStore, get_payload_store
+from services.render_cache import RenderCache
+from services.sessions import SessionStore, get_session_store
+from services.response_cache import MemoryBackend, ResponseCache, get_response_cache
+
+
+def summarize(samples_s):
+    samples = sorted(samples_s)
+    return {
+        "runs": len(samples),
+        "min_ms": samples[0] * 1e3,
+        "median_ms": statistics.median(samples) * 1e3,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e3,
+    }
+
+
+def timed(fn, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples), result
+
+
+def openscad_available() -> bool:
+    return shutil.which(render.OPENSCAD_BIN) is not None
+
+
+def synthetic_stl(path: str):
+    import trimesh
+    trimesh.creation.icosphere(subdivisions=5, radius=10).export(path)
+
+
+def bench_project(name, prefs, workdir: str, repeat: int, resolution: int):
+    import trimesh
+    from services.mesh_lod import make_lod
+    from services.mesh_render import SoftwareRenderer, hex_to_rgb
+
+    result = {"files": len(prefs.sources), "bytes": sum(len(f.content) for f in prefs.sources)}
+    result["flatten"], _ = timed(lambda: flatten_sources(prefs.sources), repeat)
+    result["encode_url"], url = timed(prefs.playground_url, repeat)
+    result["url_bytes"] = len(url)
+
+    stl_path = os.path.join(workdir, name, "out.stl")
+    os.makedirs(os.path.dirname(stl_path), exist_ok=True)
+    if openscad_available():
+        try:
+            result["compile"], stl_path = timed(
+                lambda: asyncio.run(render.compile_stl(prefs, os.path.dirname(stl_path), timeout=600)), 1
+            )
+            result["mesh"] = "compiled"
+        except render.OpenSCADError as e:
+            result["compile"] = {"error": e.stderr[-500:]}
+    if not os.path.exists(stl_path):
+        synthetic_stl(stl_path)
+        result["mesh"] = "synthetic"
+    result["stl_bytes"] = os.path.getsize(stl_path)
+
+    result["mesh_load"], mesh = timed(lambda: trimesh.load_mesh(stl_path, file_type="stl"), repeat)
+    result["faces"] = len(mesh.faces)
+    result["lod"], mesh = timed(lambda: make_lod(mesh.copy(), render.PREVIEW_FACE_BUDGET), repeat)
+    result["lod_faces"] = len(mesh.faces)
+    renderer = SoftwareRenderer.from_mesh(mesh, color=hex_to_rgb(prefs.color))
+    per_view = []
+    for direction in render.get_cube_view_dirs():
+        start = time.perf_counter()
+        renderer.render_png(direction, resolution)
+        per_view.append(time.perf_counter() - start)
+    result["view_render"] = summarize(per_view)
+    result["view_render"]["resolution"] = resolution
+    return result
+
+
+def build_app(llm_latency: float) -> FastAPI:
+    app = FastAPI()
+    app.include_router(chat_router.router)
+    app.include_router(render_router.router)
+    engine = ChatEngine(llm=recorded_llm(llm_latency))
+    cache = ResponseCache(MemoryBackend())
+    store = PayloadStore(":memory:")
+    sessions = SessionStore(":memory:")
+    app.dependency_overrides[get_chat_engine] = lambda: engine
+    app.dependency_overrides[get_response_cache] = lambda: cache
+    app.dependency_overrides[get_payload_store] = lambda: store
+    app.dependency_overrides[get_session_store] = lambda: sessions
+    return app
+
+
+async def drive(app, clients: int, per_client: int, make_request):
+    """
+    `clients` concurrent loops each sending `per_client` requests; returns throughput and latency.
+    """
+    latencies = []
+    errors = 0
+
+    async def client_loop(client, c):
+        nonlocal errors
+        for i in range(per_client):
+            method, url, body = make_request(c * per_client + i)
+            start = time.perf_counter()
+            resp = await client.request(method, url, json=body)
+            await resp.aread()
+            latencies.append(time.perf_counter() - start)
+            if resp.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, c) for c in range(clients)))
+        wall = time.perf_counter() - start
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_s": wall,
+        "req_per_s": len(latencies) / wall,
+        **{k: v for k, v in summarize(latencies).items() if k != "runs"},
+    }
+
+
+def bench_throughput(client_counts, per_client: int, llm_latency: float, projects, workdir: str):
+    app = build_app(llm_latency)
+
+    def chat_request(i):
+        return "POST", "/chat/ask_for_object", {"request_text": f"part {i}", "use_cache": False}
+
+    scenarios = {"chat": chat_request}
+    if openscad_available():
+        # Every request changes the active file so it misses the render cache and really compiles
+        prefs = dict(projects)["fork"] if "fork" in dict(projects) else projects[0][1]
+        body = prefs.model_dump()
+        numbers = itertools.count()
+
+        def render_request(_):
+            # Numbered across all client counts, the next run must not hit the previous one's cache
+            i = next(numbers)
+            sources = [
+                {**f, "content": f"{f['content']}\n// request {i}\n"} if f["path"] == body["active_path"] else f
+                for f in body["sources"]
+            ]
+            return "POST", "/openscad_render/rendershots_zip/?views=0&resolution=128", {**body, "sources": sources}
+
+        scenarios["render"] = render_request
+
+    async def drive_all():
+        return {
+            name: [await drive(app, n, per_client, make_request) for n in client_counts]
+            for name, make_request in scenarios.items()
+        }
+
+    previous_cache, previous_pool = render_cache._render_cache, render.render_pool
+    render_cache._render_cache = RenderCache(root=os.path.join(workdir, "render-cache"))
+    # asyncio primitives bind to the loop they first wait in: every run shares one loop,
+    # and a pool of its own that no earlier loop in this process has touched
+    render.render_pool = render.RenderPool(previous_pool.workers, previous_pool.queue_size)
+    try:
+        return asyncio.run(drive_all())
+    finally:
+        render_cache._render_cache, render.render_pool = previous_cache, previous_pool
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat: int = 5, resolution: int = 256, clients=(1, 4, 16), per_client: int = 5,
+        llm_latency: float = 0.05, synthetic_sizes=(20, 100)):
+    projects = corpus(synthetic_sizes)
+    with tempfile.TemporaryDirectory(prefix="foundry-bench-") as workdir:
+        stages = {name: bench_project(name, prefs, workdir, repeat, resolution) for name, prefs in projects}
+        throughput = bench_throughput(clients, per_client, llm_latency, projects, workdir)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "openscad": openscad_available(),
+            "settings": {
+                "repeat": repeat, "resolution": resolution, "clients": list(clients),
+                "per_client": per_client, "llm_latency_s": llm_latency,
+            },
+        },
+        "stages": stages,
+        "throughput": throughput,
+    }
+
+
+def flatten_metrics(results):
+    # {"stages.fork.flatten.median_ms": 0.12, ...} for comparing two runs
+    metrics = {}
+    for project, stages in results["stages"].items():
+        for stage, value in stages.items():
+            if isinstance(value, dict) and "median_ms" in value:
+                metrics[f"stages.{project}.{stage}.median_ms"] = value["median_ms"]
+    for scenario, rows in results["throughput"].items():
+        for row in rows:
+            metrics[f"throughput.{scenario}.{row['clients']}_clients.req_per_s"] = row["req_per_s"]
+            metrics[f"throughput.{scenario}.{row['clients']}_clients.p95_ms"] = row["p95_ms"]
+    return metrics
+
+
+def compare(baseline, current):
+    old, new = flatten_metrics(baseline), flatten_metrics(current)
+    print(f"{'metric':<60} {'before':>10} {'after':>10} {'ratio':>7}")
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key] / old[key] if old[key] else float("nan")
+        print(f"{key:<60} {old[key]:>10.2f} {new[key]:>10.2f} {ratio:>6.2f}x")
+
+
+def print_summary(results):
+    print(f"{'project':<15} {'files':>5} {'flatten ms':>11} {'encode ms':>10} {'compile ms':>11} "
+          f"{'load ms':>8} {'view p50 ms':>12} {'mesh':>10}")
+    for name, r in results["stages"].items():
+        compile_ms = r.get("compile", {}).get("median_ms")
+        print(
+            f"{name:<15} {r['files']:>5} {r['flatten']['median_ms']:>11.2f} {r['encode_url']['median_ms']:>10.2f} "
+            f"{compile_ms if compile_ms is not None else float('nan'):>11.1f} {r['mesh_load']['median_ms']:>8.2f} "
+            f"{r['view_render']['median_ms']:>12.2f} {r['mesh']:>10}"
+        )
+    for scenario, rows in results["throughput"].items():
+        print(f"\n{scenario}: {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+        for row in rows:
+            print(f"{'':<{len(scenario) + 1}} {row['clients']:>7} {row['req_per_s']:>8.1f} "
+                  f"{row['median_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['errors']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--resolution", type=int, default=256)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--per-client", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds the stub LLM waits per answer")
+    parser.add_argument("--synthetic", type=int, nargs="*", default=[20, 100], help="Sizes of the synthetic projects")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare against")
+    args = parser.parse_args()
+    results = run(args.repeat, args.resolution, args.clients, args.per_client, args.llm_latency, args.synthetic)
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print()
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Cold start benchmark: how long importing the app takes and which modules cost the most.
+
+Each run imports the target in a fresh interpreter with `python -X importtime`
+and reports the median times, the import cost summed per top-level package and
+the slowest single modules.
+Run from the api/ folder:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --targets main langchain_openai trimesh --runs 5
+    ENABLED_ROUTERS=chat,payloads python -m benchmarks.bench_startup --json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# import time: self [us] | cumulative | imported package, nested imports are indented
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def parse_importtime(stderr: str):
+    """
+    Returns {module: (self_us, cumulative_us, depth)} from -X importtime output.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+
+def import_once(target: str):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=API_DIR,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+    return elapsed, parse_importtime(proc.stderr)
+
+
+def run(targets, runs: int = 3, top: int = 15):
+    results = []
+    for target in targets:
+        walls = []
+        samples = []
+        for _ in range(runs):
+            wall, modules = import_once(target)
+            walls.append(wall)
+            samples.append(modules)
+        # Per-module median over the runs, modules missing from a run count as 0
+        names = set().union(*samples)
+        self_us = {n: statistics.median(s.get(n, (0, 0, 0))[0] for s in samples) for n in names}
+        cumulative_us = {n: statistics.median(s.get(n, (0, 0, 0))[1] for s in samples) for n in names}
+        by_package = {}
+        for n, us in self_us.items():
+            by_package[n.split(".")[0]] = by_package.get(n.split(".")[0], 0) + us
+        results.append({
+            "target": target,
+            "wall_s": statistics.median(walls),
+            "modules": len(names),
+            "import_ms": cumulative_us.get(target, 0) / 1e3,
+            "top_packages": sorted(
+                ({"package": n, "ms": us / 1e3} for n, us in by_package.items()),
+                key=lambda r: -r["ms"],
+            )[:top],
+            "top_self": sorted(
+                ({"module": n, "self_ms": self_us[n] / 1e3} for n in names),
+                key=lambda r: -r["self_ms"],
+            )[:top],
+            "heavy_loaded": sorted(
+                p for p in ("numpy", "trimesh", "langchain_core", "langchain_openai", "openai", "httpx") if p in names
+            ),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=["main"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+    results = run(args.targets, args.runs, args.top)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"import {r['target']}: {r['import_ms']:.0f} ms importing, {r['wall_s'] * 1e3:.0f} ms wall"
+            f" (median of {args.runs}), {r['modules']} modules"
+        )
+        print(f"  heavy packages loaded: {', '.join(r['heavy_loaded']) or 'none'}")
+        print(f"  {'package':<40} {'total self ms':>14}")
+        for m in r["top_packages"]:
+            print(f"  {m['package']:<40} {m['ms']:>14.1f}")
+        print(f"  {'module':<40} {'self ms':>14}")
+        for m in r["top_self"]:
+            print(f"  {m['module']:<40} {m['self_ms']:>14.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Recorded LLM answers and SCAD projects of increasing size, shared by the benchmarks.
+"""
+import asyncio
+import glob
+import json
+import os
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from benchmarks.bench_flatten import synthetic_project
+from models.models import PlaygroundPreferences, RawChatResponse, SourceFile
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THREADS_SCAD = os.path.join(API_DIR, "library", "threads.scad")
+SYNTHETIC_SIZES = (20, 100)
+
+
+def load_fixtures():
+    # {name: RawChatResponse} recorded from real answers, sorted by name
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            fixtures[os.path.basename(path)[:-5]] = RawChatResponse.model_validate(json.load(f))
+    return fixtures
+
+
+def corpus(synthetic_sizes=SYNTHETIC_SIZES):
+    """
+    [(name, PlaygroundPreferences)] from smallest to largest: the recorded
+    answers, the bolt with the real library/threads.scad next to
+    it, then synthetic many-file projects.
+    """
+    projects = []
+    for name, raw in load_fixtures().items():
+        sources = list(raw.sources)
+        if name == "bolt":
+            with open(THREADS_SCAD, encoding="utf-8") as f:
+                sources.append(SourceFile(path="/threads.scad", content=f.read()))
+        projects.append((name, PlaygroundPreferences(sources=sources, active_path=raw.active_path)))
+    for n in synthetic_sizes:
+        projects.append((f"synthetic_{n}", PlaygroundPreferences(sources=synthetic_project(n))))
+    return sorted(projects, key=lambda p: sum(len(f.content) for f in p[1].sources))
+
+
+class RecordedChatModel(FakeListChatModel):
+    """
+    Replays recorded answers after `latency` seconds, without holding a thread
+    the way FakeListChatModel's sleep does, so many concurrent clients can wait at once.
+    """
+
+    latency: float = 0.0
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._call(messages, stop=stop)))])
+
+
+def recorded_llm(latency: float = 0.0) -> RecordedChatModel:
+    return RecordedChatModel(
+        responses=[raw.model_dump_json() for raw in load_fixtures().values()],
+        latency=latency,
+    )
@@ -1,11 +1,42 @@
-from fastapi import FastAPI
+import asyncio
+import importlib
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from routers.openscad_playground import router as openscad_playground_router
-from routers.openscad_render import router as openscad_render_router
-from routers.chat import router as chat_router 
+from services.metrics import ServerTimingMiddleware
+from services.static_files import PrecompressedStaticFiles, StaticPage
+
+# Routers to serve, e.g. ENABLED_ROUTERS="chat,payloads" for a chat-only node.
+# Heavy libraries (LangChain, trimesh, NumPy) are imported on first use, not here.
+ENABLED_ROUTERS = [
+    name.strip()
+    for name in os.getenv("ENABLED_ROUTERS", "openscad_playground,openscad_render,chat,live,payloads,metrics").split(",")
+    if name.strip()
+]
+UI_DIR = os.getenv("UI_DIR", "/static/ui")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared clients are built once here and closed on shutdown
+    warmup = None
+    if "chat" in ENABLED_ROUTERS:
+        from services.chat import warm_chat_engine, close_chat_engine
+        # Imports LangChain off the startup path, the server is up meanwhile
+        warmup = asyncio.ensure_future(asyncio.to_thread(warm_chat_engine))
+    if "openscad_render" in ENABLED_ROUTERS:
+        from services.render_jobs import get_job_manager
+        # Render job workers, queued jobs from before a restart are picked up here
+        await get_job_manager().start()
+    yield
+    if "openscad_render" in ENABLED_ROUTERS:
+        await get_job_manager().stop()
+    if warmup is not None:
+        await warmup
+        await close_chat_engine()
 
 
 app = FastAPI(
@@ -16,6 +47,7 @@ app = FastAPI(
     <a href="/" style="font-size:1em;">&larr; Go Back Home</a>
 </div>
 """,
+    lifespan=lifespan,
 )
 
 origins = ["http://localhost:3000"]
@@ -25,20 +57,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Per-stage timings in a Server-Timing header, visible in the browser's network panel
+app.add_middleware(ServerTimingMiddleware)
 
-app.include_router(openscad_playground_router)
-app.include_router(openscad_render_router)
-app.include_router(chat_router)
+for name in ENABLED_ROUTERS:
+    app.include_router(importlib.import_module(f"routers.{name}").router)
+
+# Read once; served from memory with a gzip variant and an ETag
+linktree = StaticPage(os.path.join(os.path.dirname(os.path.abspath(__file__)), "linktree.html"))
 
 @app.get("/", response_class=HTMLResponse)
-def root():
-    with open("linktree.html", "r", encoding="utf-8") as f:
-        html = f.read()
-    return HTMLResponse(content=html)
-
-app.mount(
-    "/ui",
-    StaticFiles(directory="/static/ui", html=True),
-    name="parts-maker-chat"
-)
+def root(request: Request):
+    return linktree.response(request)
+
+# The UI build only exists in the full image, API-only nodes skip it.
+# Its .br/.gz variants are built with it, see the Dockerfile.
+if os.path.isdir(UI_DIR):
+    app.mount(
+        "/ui",
+        PrecompressedStaticFiles(directory=UI_DIR, html=True),
+        name="parts-maker-chat"
+    )
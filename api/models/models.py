@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List, Optional, Union
 import json
 import gzip
 import base64
@@ -67,17 +67,83 @@ class RawChatResponse(BaseModel):
         description="A summary or friendly description for the user."
     )
 
+class SourceHunk(BaseModel):
+    search: str = Field(..., description="Exact text of the current file, unique within it.")
+    replace: str = Field(..., description="Text that replaces it.")
+
+class FileEdit(BaseModel):
+    path: str
+    content: Optional[str] = Field(None, description="Full new content, for new or rewritten files.")
+    hunks: List[SourceHunk] = Field(default_factory=list, description="Search/replace edits of the current file.")
+    delete: bool = Field(False, description="Set to true to remove the file.")
+
+class RawEditResponse(BaseModel):
+    edits: List[FileEdit] = Field(..., description="Only the files that change.")
+    active_path: Optional[str] = Field(None, description="New primary file, if it changes.")
+    reply_text: str = Field(
+        "Here is the updated object!",
+        description="A summary of the changes for the user."
+    )
+
+class ValidationReport(BaseModel):
+    compiled: Optional[bool] = Field(..., description="Whether OpenSCAD compiled the sources, null if it could not be checked.")
+    attempts: int = Field(..., description="LLM answers tried for the returned candidate, repairs included.")
+    candidates: int = Field(1, description="Candidates generated concurrently.")
+    stderr: Optional[str] = None
+
 class EnrichedChatResponse(BaseModel):
     chat_response: RawChatResponse
     encoded_url: str
+    short_url: Optional[str] = Field(None, description="Short /p/{id} link that redirects to the playground.")
+    validation: Optional[ValidationReport] = None
+    session_id: Optional[str] = Field(None, description="Pass it back with the next request to edit this project.")
+    changed_paths: List[str] = Field(default_factory=list, description="Files a follow-up added, edited or removed.")
+    recompile_paths: List[str] = Field(default_factory=list, description="Files whose compiled output a follow-up invalidates.")
 
 class ChatRequest(BaseModel):
     request_text: str
+    use_cache: bool = Field(True, description="Set to false to always ask the LLM.")
+    inline_url: bool = Field(True, description="Set to false to get the short link in encoded_url too, instead of the full payload URL.")
+    validate_code: bool = Field(False, description="Compile the answer and have the LLM fix any errors.")
+    candidates: int = Field(1, ge=1, le=4, description="Answers generated concurrently; the first that compiles wins.")
+    max_repairs: int = Field(2, ge=0, le=5, description="Repair rounds per candidate when it does not compile.")
+    session_id: Optional[str] = Field(None, description="Edit the project of an earlier answer instead of starting over; validation only applies to new projects.")
 
 class PlaygroundEncodeResponse(BaseModel):
     base64string: str
     playground_url: str
 
+class ShortLinkResponse(BaseModel):
+    id: str
+    short_url: str
+
+class RenderJob(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, done, failed or cancelled.")
+    stage: Optional[str] = None
+    progress: float = Field(0.0, description="Fraction of the job finished, from 0 to 1.")
+    error: Optional[str] = None
+    stderr: Optional[str] = None
+    created_at: float
+    updated_at: float
+    artifacts: List[str] = Field(default_factory=list, description="Files of a finished job, e.g. model.stl and view_00.png.")
+
+# Value of an OpenSCAD customizer variable, passed to the compile as -D name=value
+ParameterValue = Union[bool, int, float, str]
+
+class ParameterSweep(BaseModel):
+    prefs: PlaygroundPreferences
+    grid: Dict[str, List[ParameterValue]] = Field(default_factory=dict, description="Every combination of these values is rendered, e.g. {\"length\": [10, 20], \"holes\": [2, 3]}.")
+    variants: List[Dict[str, ParameterValue]] = Field(default_factory=list, description="Explicit configurations, each combined with every grid point.")
+
+# Render request sent over the live WebSocket, same options as /openscad_render/rendershots_zip/
+class LiveRenderRequest(BaseModel):
+    prefs: PlaygroundPreferences
+    resolution: Optional[int] = Field(None, ge=64, le=2048, description="Width and height of each view in pixels; the server default when unset.")
+    views: Optional[List[int]] = Field(None, description="Subset of the 14 view indices to render, all by default.")
+    face_budget: Optional[int] = Field(None, ge=0, description="Faces kept in the mesh the views are rendered from, 0 for the full mesh; the server default when unset.")
+    formats: Optional[List[str]] = Field(None, description="Meshes of the render; glb and qmesh previews are sent over the socket, the full STL is not.")
+
 if __name__ == "__main__":
     # Minimal cube test
     cube_files = [
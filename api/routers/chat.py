@@ -1,7 +1,5 @@
-from fastapi import APIRouter, HTTPException
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from models.models import (
     ChatRequest,
     RawChatResponse,
@@ -9,7 +7,16 @@ from models.models import (
     PlaygroundPreferences,
     SourceFile
 )
-import re
+from services.chat import ChatEngine, IncrementalResponseParser, count_tokens, get_chat_engine
+from services.metrics import span
+from services.payload_store import PayloadStore, get_payload_store, short_url
+from services.response_cache import ResponseCache, get_response_cache
+from services.scad_validate import generate_validated
+from services.scad_deps import DependencyGraph, changed_paths, flat_names, normalize_path, rewrite_references
+from services.sessions import EditError, SessionStore, apply_edits, get_session_store
+from services.snippet_library import get_snippet_library
+import asyncio
+import json
 
 router = APIRouter(prefix="/chat")
 
@@ -17,96 +24,293 @@ def flatten_sources(sources):
     """
     Moves all files to the top level, e.g. /utils/foo.scad => /foo.scad
     Updates include/use statements accordingly in file contents.
+    Basename collisions get distinct names, see flat_names().
     """
-    # Map old path to new top-level path
-    path_map = {}
-    for file in sources:
-        basename = "/" + file.path.split("/")[-1]
-        path_map[file.path] = basename
-
-    # Now update includes/uses inside each file's content
-    updated_sources = []
-    for file in sources:
-        content = file.content
-        for orig, flat in path_map.items():
-            if orig != flat:
-                # Replace include/use statements addressing utils/ (with/without leading slash)
-                orig_clean = orig.lstrip("/")
-                flat_clean = flat.lstrip("/")
-                # Regex targets both include and use with angle brackets, with or without /
-                content = re.sub(
-                    rf'(?<=\b(?:include|use)\s*<)(/?{re.escape(orig_clean)})(?=>)',
-                    flat_clean,
-                    content
-                )
-        # Set new top-level path
-        updated_sources.append(SourceFile(
-            path="/" + file.path.split("/")[-1],
-            content=content
-        ))
-    return updated_sources
-
-@router.post("/ask_for_object", response_model=EnrichedChatResponse)
-async def chat_scad_endpoint(req: ChatRequest):
-    parser = PydanticOutputParser(pydantic_object=RawChatResponse)
-
-    prompt = PromptTemplate(
-        template=(
-            "You are an expert OpenSCAD assistant.\n"
-            "Strictly reply ONLY in a JSON matching this schema (no commentary, no explanations):\n"
-            "{format_instructions}\n"
-            "\n"
-            "For EACH user request:\n"
-            "- Organize the project with MULTIPLE OpenSCAD files, in modular style.\n"
-            "- IMPORTANT: Put ALL files at the project ROOT (e.g. /main.scad, /helpers.scad). NEVER use subfolders or utils/ or directories.\n"
-            "- In all 'include <...>;' or 'use <...>;' statements, reference only top-level files, matching the given source file 'path'.\n"
-            "- Never output ../, /utils/, or subdirectory paths.\n"
-            "- The main logic is in /main.scad and demonstrates how to use helpers.\n"
-            "- Always use at least two files unless impossible.\n"
-            "- At the end of /main.scad, ensure any test/demo code or preview is included; for simplicity, just call the main module directly (e.g., 'my_object();').\n"
-            "- The response MUST be VALID JSON matching the schema. No comments or extra output.\n"
-            "- Make the object pass all the parameters down from the top object, so that all the vars are defined at the top. This will make it easily customizeable by the user."
-            "- Summarize your design and file structure in 'reply_text'.\n"
-            "\n"
-            "EXAMPLE USER REQUEST: make a simple cube\n"
-            "EXAMPLE RESPONSE:\n"
-            "{{\n"
-            "  \"sources\": [\n"
-            "    {{\"path\": \"/main.scad\", \"content\": \"include <common.scad>\\nmy_cube();\\n\"}},\n"
-            "    {{\"path\": \"/common.scad\", \"content\": \"module my_cube() {{ cube([10,10,10]); }}\"}}\n"
-            "  ],\n"
-            "  \"active_path\": \"/main.scad\",\n"
-            "  \"reply_text\": \"This divides the simple cube project into a main file and a helper module at the root.\""
-            "}}\n"
-            "\n"
-            "USER REQUEST:\n"
-            "{input}\n"
-        ),
-        input_variables=["input"],
-        partial_variables={"format_instructions": parser.get_format_instructions()},
-    )
-
-    llm = ChatOpenAI(model="gpt-4.1")
-    chain = prompt | llm | parser
+    path_map = flat_names(f.path for f in sources)
+    return [
+        SourceFile(
+            path=path_map[normalize_path(f.path)],
+            content=rewrite_references(f.content, f.path, path_map)
+        )
+        for f in sources
+    ]
 
-    try:
-        # 1. LLM raw response as model
-        raw: RawChatResponse = await chain.ainvoke({"input": req.request_text})
+def enrich_response(raw: RawChatResponse) -> EnrichedChatResponse:
+    # 1. Add the library files the answer uses, the LLM only writes the include
+    with span("attach_library"):
+        raw.sources = get_snippet_library().attach(raw.sources)
 
-        # 2. Ensure safety: flatten all sources to root and fix includes
+    # 2. Ensure safety: flatten all sources to root and fix includes
+    with span("flatten"):
+        path_map = flat_names(f.path for f in raw.sources)
+        active_path = normalize_path(raw.active_path)
         raw.sources = flatten_sources(raw.sources)
-        raw.active_path = "/" + raw.active_path.split("/")[-1] # flatten active path to root
+        # flatten active path to root
+        raw.active_path = path_map.get(active_path, "/" + active_path.split("/")[-1])
 
-        # 3. Use model for playground URL
+    # 3. Use model for playground URL
+    with span("encode"):
         playground_prefs = PlaygroundPreferences(
             sources=raw.sources,
             active_path=raw.active_path
         )
         url = playground_prefs.playground_url()
-        return EnrichedChatResponse(chat_response=raw, encoded_url=url)
+    return EnrichedChatResponse(chat_response=raw, encoded_url=url)
+
+async def with_short_link(enriched: dict, store: PayloadStore, inline_url: bool = True) -> dict:
+    # Stores the project (once per content) and adds its /p/ link; with inline_url off it replaces encoded_url too
+    resp = enriched["chat_response"]
+    prefs = PlaygroundPreferences(sources=resp["sources"], active_path=resp["active_path"])
+    with span("short_link"):
+        # gzip and SQLite commit off the event loop, which serves every other stream meanwhile
+        link = short_url(await asyncio.to_thread(store.put, prefs.to_payload()))
+    return {**enriched, "short_url": link, "encoded_url": enriched["encoded_url"] if inline_url else link}
+
+async def start_session(enriched: dict, sessions: SessionStore, request_text: str) -> dict:
+    # Every new project gets a session, so the user's next message can edit it
+    resp = enriched["chat_response"]
+    sid = await asyncio.to_thread(sessions.create, resp["sources"], resp["active_path"], request_text, resp["reply_text"])
+    return {**enriched, "session_id": sid}
+
+async def find_session(sessions: SessionStore, session_id):
+    # Session store calls run in a thread like the payload store's, SQLite commits included
+    if session_id is None:
+        return None
+    session = await asyncio.to_thread(sessions.get, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return session
+
+async def follow_up(engine: ChatEngine, sessions: SessionStore, session: dict, request_text: str) -> dict:
+    """
+    Applies a follow-up to the session's project: the LLM answers with the
+    changed files or search/replace hunks only, which are applied here.
+    Edits that don't apply are sent back once with the reason.
+    """
+    edit = await engine.aedit(request_text, session)
+    with span("apply_edits"):
+        try:
+            sources = apply_edits(session["sources"], edit.edits)
+        except EditError as e:
+            error = str(e)
+            sources = None
+    if sources is None:
+        edit = await engine.aedit(request_text, session, errors=error)
+        with span("apply_edits"):
+            sources = apply_edits(session["sources"], edit.edits)
+    raw = RawChatResponse(
+        sources=sources,
+        active_path=edit.active_path or session["active_path"],
+        reply_text=edit.reply_text,
+    )
+    enriched = enrich_response(raw)
+    new_sources = enriched.chat_response.sources
+    changed = changed_paths(session["sources"], new_sources)
+    enriched.session_id = session["id"]
+    enriched.changed_paths = sorted(changed)
+    # Only these files' closures changed, every other part is still in the render cache
+    enriched.recompile_paths = sorted(DependencyGraph(new_sources).affected_by(changed))
+    await asyncio.to_thread(sessions.update, session["id"], new_sources, enriched.chat_response.active_path, {
+        "request_text": request_text,
+        "reply_text": edit.reply_text,
+        "changed_paths": enriched.changed_paths,
+    })
+    return enriched.model_dump()
+
+async def cached_answer(cache: ResponseCache, req: ChatRequest):
+    # (cached EnrichedChatResponse dict, tier), or (None, None) when the request can't use one
+    if not req.use_cache:
+        return None, None
+    cached, tier = await cache.aget(req.request_text)
+    # A validated request only reuses answers that are known to compile
+    if cached is None or (req.validate_code and not (cached.get("validation") or {}).get("compiled")):
+        return None, None
+    return cached, tier
+
+async def cache_answer(cache: ResponseCache, req: ChatRequest, enriched: dict):
+    # Answers known not to compile are never served again
+    if enriched["validation"] is None or enriched["validation"]["compiled"] is not False:
+        await cache.aset(req.request_text, enriched)
+
+async def generate_answer(engine: ChatEngine, req: ChatRequest) -> dict:
+    # A new answer as an EnrichedChatResponse dict, compiled and repaired first if the request asks for it
+    if req.validate_code:
+        enriched = await generate_validated(
+            engine, req.request_text, enrich_response,
+            candidates=req.candidates, max_repairs=req.max_repairs,
+        )
+    else:
+        # LLM raw response as model
+        raw: RawChatResponse = await engine.ainvoke(req.request_text)
+        enriched = enrich_response(raw)
+    return enriched.model_dump()
+
+@router.post("/ask_for_object", response_model=EnrichedChatResponse)
+async def chat_scad_endpoint(
+    req: ChatRequest,
+    response: Response,
+    engine: ChatEngine = Depends(get_chat_engine),
+    cache: ResponseCache = Depends(get_response_cache),
+    store: PayloadStore = Depends(get_payload_store),
+    sessions: SessionStore = Depends(get_session_store),
+):
+    session = await find_session(sessions, req.session_id)
+    if session is not None:
+        # Follow-ups depend on the project so far, they are never cached
+        response.headers["X-Response-Cache"] = "bypass"
+        try:
+            return await with_short_link(await follow_up(engine, sessions, session, req.request_text), store, req.inline_url)
+        except Exception as e:
+            print(f"Error during LLM edit: {e}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to apply the requested changes: {str(e)}"
+            )
+    cached, tier = await cached_answer(cache, req)
+    if cached is not None:
+        response.headers["X-Response-Cache"] = tier
+        return await with_short_link(await start_session(cached, sessions, req.request_text), store, req.inline_url)
+    response.headers["X-Response-Cache"] = "miss" if req.use_cache else "bypass"
+    try:
+        enriched = await generate_answer(engine, req)
+        await cache_answer(cache, req, enriched)
+        return await with_short_link(await start_session(enriched, sessions, req.request_text), store, req.inline_url)
     except Exception as e:
         print(f"Error during LLM chain execution: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to produce/validate EnrichedChatResponse: {str(e)}"
         )
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def replay_events(cached: dict, req: ChatRequest, store: PayloadStore, sessions: SessionStore):
+    # Same event sequence as a live answer, straight from the response cache
+    for source in cached["chat_response"]["sources"]:
+        yield "source", source
+    yield "reply_text", {"reply_text": cached["chat_response"]["reply_text"]}
+    yield "done", await with_short_link(await start_session(cached, sessions, req.request_text), store, req.inline_url)
+
+async def edit_events(engine: ChatEngine, req: ChatRequest, store: PayloadStore, sessions: SessionStore, session: dict):
+    try:
+        enriched = await follow_up(engine, sessions, session, req.request_text)
+        changed = set(enriched["changed_paths"])
+        for source in enriched["chat_response"]["sources"]:
+            if normalize_path(source["path"]) in changed:
+                yield "source", source
+        yield "reply_text", {"reply_text": enriched["chat_response"]["reply_text"]}
+        yield "done", await with_short_link(enriched, store, req.inline_url)
+    except Exception as e:
+        print(f"Error during LLM edit: {e}")
+        yield "error", {"detail": f"Failed to apply the requested changes: {str(e)}"}
+
+async def answer_events(engine: ChatEngine, req: ChatRequest, cache: ResponseCache, store: PayloadStore,
+                        sessions: SessionStore):
+    scanner = IncrementalResponseParser()
+    text = ""
+    message = None
+    try:
+        with span("llm") as attrs:
+            async for chunk in engine.astream(req.request_text):
+                message = chunk if message is None else message + chunk
+                piece = chunk.content if isinstance(chunk.content, str) else ""
+                text += piece
+                if piece:
+                    yield "token", {"text": piece}
+                for kind, value in scanner.feed(piece):
+                    if kind == "source":
+                        yield "source", value
+                    elif value[0] == "reply_text":
+                        yield "reply_text", {"reply_text": value[1]}
+            attrs.update(count_tokens(message))
+        with span("parse"):
+            raw: RawChatResponse = engine.parser.parse(text)
+        enriched = enrich_response(raw).model_dump()
+        await cache_answer(cache, req, enriched)
+        yield "done", await with_short_link(await start_session(enriched, sessions, req.request_text), store, req.inline_url)
+    except Exception as e:
+        print(f"Error during LLM chain streaming: {e}")
+        yield "error", {"detail": f"Failed to produce/validate EnrichedChatResponse: {str(e)}"}
+
+async def validated_events(engine: ChatEngine, req: ChatRequest, cache: ResponseCache, store: PayloadStore,
+                           sessions: SessionStore):
+    # Candidates are compiled and repaired before anything is sent, so there are no tokens
+    try:
+        enriched = await generate_answer(engine, req)
+        await cache_answer(cache, req, enriched)
+        for source in enriched["chat_response"]["sources"]:
+            yield "source", source
+        yield "reply_text", {"reply_text": enriched["chat_response"]["reply_text"]}
+        yield "done", await with_short_link(await start_session(enriched, sessions, req.request_text), store, req.inline_url)
+    except Exception as e:
+        print(f"Error during LLM chain execution: {e}")
+        yield "error", {"detail": f"Failed to produce/validate EnrichedChatResponse: {str(e)}"}
+
+async def chat_events(req: ChatRequest, engine: ChatEngine, cache: ResponseCache, store: PayloadStore,
+                sessions: SessionStore):
+    """
+    Resolves a chat request to (cache_tier, events), events being an async
+    generator of (event, data): "token" for each piece of LLM output, "source"
+    as each file of the reply completes, then "reply_text", then "done" carrying
+    the full EnrichedChatResponse, or "error". Cached answers replay the same
+    sequence without tokens; a follow-up in a session only emits the files it changed.
+    With validate_code the answer is compiled (and repaired) first, then sent
+    the same way as a cached one, its "done" carrying the validation report.
+    Raises HTTPException(404) for an unknown session.
+    """
+    session = await find_session(sessions, req.session_id)
+    if session is not None:
+        return "bypass", edit_events(engine, req, store, sessions, session)
+    cached, tier = await cached_answer(cache, req)
+    if cached is not None:
+        return tier, replay_events(cached, req, store, sessions)
+    events = validated_events if req.validate_code else answer_events
+    return "miss" if req.use_cache else "bypass", events(engine, req, cache, store, sessions)
+
+@router.post("/ask_for_object_stream")
+async def chat_scad_stream_endpoint(
+    req: ChatRequest,
+    engine: ChatEngine = Depends(get_chat_engine),
+    cache: ResponseCache = Depends(get_response_cache),
+    store: PayloadStore = Depends(get_payload_store),
+    sessions: SessionStore = Depends(get_session_store),
+):
+    """
+    Server-Sent Events variant of /ask_for_object, with the events of chat_events()
+    except "token" (the live WebSocket sends those too).
+    """
+    tier, events = await chat_events(req, engine, cache, store, sessions)
+
+    async def stream():
+        # Flush headers right away so the client sees the first byte immediately
+        yield ": stream open\n\n"
+        async for event, data in events:
+            if event != "token":
+                yield sse(event, data)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Response-Cache": tier,
+        }
+    )
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str, sessions: SessionStore = Depends(get_session_store)):
+    # The session's current project and the requests that shaped it
+    session = await find_session(sessions, session_id)
+    return {
+        "session_id": session_id,
+        "sources": session["sources"],
+        "active_path": session["active_path"],
+        "history": session["history"],
+        "updated_at": session["updated_at"],
+    }
+
+@router.get("/cache_stats")
+async def cache_stats(cache: ResponseCache = Depends(get_response_cache)):
+    return cache.stats()
@@ -0,0 +1,200 @@
+import asyncio
+import base64
+import json
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from models.models import ChatRequest, LiveRenderRequest
+from routers.chat import chat_events
+from services.chat import get_chat_engine
+from services.openscad_render import (
+    open_shots,
+    OpenSCADError,
+    RenderQueueFull,
+    RenderTimeout,
+    RENDER_TIMEOUT,
+    PREVIEW_FACE_BUDGET,
+    VIEW_RESOLUTION,
+)
+from services.payload_store import PayloadStore, get_payload_store
+from services.response_cache import ResponseCache, get_response_cache
+from services.sessions import SessionStore, get_session_store
+
+router = APIRouter(prefix="/live", tags=["Live"])
+
+# Requests one socket may have in flight at once
+LIVE_MAX_TASKS = int(os.getenv("LIVE_MAX_TASKS", "4"))
+
+
+def error_data(e: Exception) -> dict:
+    # Same status codes and bodies as the HTTP endpoints give for these errors
+    if isinstance(e, HTTPException):
+        return {"status": e.status_code, "detail": e.detail}
+    if isinstance(e, (ValueError, ValidationError)):
+        return {"status": 400, "detail": str(e)}
+    if isinstance(e, RenderQueueFull):
+        return {"status": 429, "detail": "Render queue is full, try again later"}
+    if isinstance(e, RenderTimeout):
+        return {"status": 504, "detail": f"OpenSCAD did not finish within {RENDER_TIMEOUT:g}s"}
+    if isinstance(e, OpenSCADError):
+        # Not a request error over HTTP either: a 200 whose body reports the failed compile
+        return {"status": 200, "error": "OpenSCAD failed", "stderr": e.stderr}
+    return {"status": 500, "detail": str(e)}
+
+
+def chat_engine_for(websocket: WebSocket):
+    # Resolved per chat request, honouring the app's dependency overrides like Depends would
+    provider = websocket.app.dependency_overrides.get(get_chat_engine, get_chat_engine)
+    return provider()
+
+
+async def run_chat(req: ChatRequest, emit, websocket: WebSocket, cache, store, sessions):
+    # The engine is only built for chat: render-only nodes have no API key and need no LangChain
+    try:
+        engine = await asyncio.to_thread(chat_engine_for, websocket)
+    except Exception as e:
+        emit("error", {"status": 503, "detail": f"Chat is not available: {e}"})
+        return
+    tier, events = await chat_events(req, engine, cache, store, sessions)
+    emit("started", {"cache": tier})
+    async for event, data in events:
+        emit(event, data)
+
+
+async def run_render(req: LiveRenderRequest, emit):
+    """
+    A rendershots request whose progress goes to the client as it happens:
+    "queued", "compile_started", each OpenSCAD "stderr" line, "compile_finished",
+    then a "view" per rendered PNG and a "mesh" per preview mesh, base64 encoded.
+    """
+    resolution = VIEW_RESOLUTION if req.resolution is None else req.resolution
+    face_budget = PREVIEW_FACE_BUDGET if req.face_budget is None else req.face_budget
+    stream = await open_shots(
+        req.prefs, resolution=resolution, views=req.views, face_budget=face_budget,
+        formats=req.formats, progress=emit,
+    )
+    try:
+        emit("started", {"cache": stream.cache_status})
+        views = 0
+        async for name, data in stream.items():
+            encoded = base64.b64encode(data).decode("ascii")
+            if name.endswith(".png"):
+                views += 1
+                emit("view", {"name": name, "index": int(name[len("view_"):-len(".png")]), "png": encoded})
+            else:
+                emit("mesh", {"name": name, "format": name.rsplit(".", 1)[-1], "data": encoded})
+    finally:
+        await stream.aclose()
+    emit("done", {"cache": stream.cache_status, "views": views})
+
+
+class LiveConnection:
+    """
+    The work of one WebSocket. Each request runs as its own task under the
+    client's id, and all events go out through one writer in the order they
+    happen. Cancelling an id, or closing the socket, cancels its task, which
+    kills OpenSCAD and frees the render worker.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.outbox = asyncio.Queue()
+        self.tasks = {}  # id -> task
+
+    def emitter(self, op_id: str):
+        def emit(event: str, data=None):
+            self.outbox.put_nowait({"id": op_id, "event": event, "data": data or {}})
+        return emit
+
+    def start(self, op_id: str, coro):
+        self.tasks[op_id] = asyncio.ensure_future(self._run(op_id, coro))
+
+    def cancel(self, op_id: str):
+        task = self.tasks.get(op_id)
+        if task is not None:
+            task.cancel()
+
+    async def _run(self, op_id: str, coro):
+        emit = self.emitter(op_id)
+        try:
+            await coro
+        except asyncio.CancelledError:
+            emit("cancelled")
+        except Exception as e:
+            emit("error", error_data(e))
+        finally:
+            self.tasks.pop(op_id, None)
+
+    async def write(self):
+        try:
+            while True:
+                await self.websocket.send_json(await self.outbox.get())
+        except (WebSocketDisconnect, RuntimeError):
+            # The client is gone, whatever is still running is cancelled by close()
+            pass
+
+    async def close(self):
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.websocket("/ws")
+async def live_socket(
+    websocket: WebSocket,
+    cache: ResponseCache = Depends(get_response_cache),
+    store: PayloadStore = Depends(get_payload_store),
+    sessions: SessionStore = Depends(get_session_store),
+):
+    """
+    One socket multiplexes a client's chat and render requests. Client messages:
+      {"type": "chat", "id": "1", ...ChatRequest fields}
+      {"type": "render", "id": "2", ...LiveRenderRequest fields}
+      {"type": "cancel", "id": "1"}
+    Server messages are {"id", "event", "data"}; every request ends with one of
+    "done", "error" or "cancelled". Chat events are those of /chat/ask_for_object_stream
+    plus a "token" for each piece of LLM output; render events are described in run_render().
+    """
+    await websocket.accept()
+    conn = LiveConnection(websocket)
+    writer = asyncio.ensure_future(conn.write())
+    try:
+        while True:
+            try:
+                msg = json.loads(await websocket.receive_text())
+                op_id = str(msg.get("id", ""))
+                kind = msg.get("type")
+            except (ValueError, AttributeError):
+                conn.emitter("")("error", {"status": 400, "detail": "Messages are JSON objects with a type and an id"})
+                continue
+            emit = conn.emitter(op_id)
+            if kind == "cancel":
+                conn.cancel(op_id)
+                continue
+            if kind not in ("chat", "render"):
+                emit("error", {"status": 400, "detail": f"Unknown message type: {kind!r}"})
+                continue
+            if op_id in conn.tasks:
+                emit("error", {"status": 409, "detail": f"Request {op_id!r} is already running"})
+                continue
+            if len(conn.tasks) >= LIVE_MAX_TASKS:
+                emit("error", {"status": 429, "detail": f"At most {LIVE_MAX_TASKS} requests per connection"})
+                continue
+            try:
+                if kind == "chat":
+                    coro = run_chat(ChatRequest.model_validate(msg), emit, websocket, cache, store, sessions)
+                else:
+                    coro = run_render(LiveRenderRequest.model_validate(msg), emit)
+            except ValidationError as e:
+                emit("error", error_data(e))
+                continue
+            conn.start(op_id, coro)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Abandoned work stops here instead of running to completion for nobody
+        await conn.close()
+        writer.cancel()
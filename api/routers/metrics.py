@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services.metrics import exposition
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text format: stage histograms, request latency, token counters, render queue gauges
+    return PlainTextResponse(exposition(), media_type="text/plain; version=0.0.4")
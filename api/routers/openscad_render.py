@@ -1,72 +1,244 @@
-from fastapi import APIRouter
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List
-import trimesh
-import numpy as np
-import io
-import zipfile
+import json
 import os
-import tempfile
-import subprocess
-from models.models import PlaygroundPreferences
+from typing import List, Optional
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from models.models import ParameterSweep, PlaygroundPreferences, RenderJob
+from services.openscad_render import (
+    render_pool,
+    open_shots,
+    compile_part,
+    analyze_project,
+    cancel_on_disconnect,
+    render_options,
+    RenderQueueFull,
+    RenderTimeout,
+    OpenSCADError,
+    RENDER_TIMEOUT,
+    VIEW_RESOLUTION,
+    PREVIEW_FACE_BUDGET,
+)
+from services.render_cache import get_render_cache
+from services.render_jobs import JobManager, get_job_manager
+from services.render_sweep import THUMBNAIL_RESOLUTION, expand_sweep, run_sweep
+from services.sandbox import get_workspace_pool
+from services.scad_deps import DependencyGraph
 
 router = APIRouter(prefix="/openscad_render", tags=["OpenSCAD Render"])
 
-def get_cube_view_dirs():
-    dirs = [
-        [1,0,0], [-1,0,0], [0,1,0], [0,-1,0], [0,0,1], [0,0,-1],
-        [1,1,1], [1,1,-1], [1,-1,1], [1,-1,-1],
-        [-1,1,1], [-1,1,-1], [-1,-1,1], [-1,-1,-1]
-    ]
-    return [np.array(v)/np.linalg.norm(v) for v in dirs]
+STL_CHUNK_BYTES = 256 * 1024
+
+def render_http_error(e: Exception) -> HTTPException:
+    if isinstance(e, RenderQueueFull):
+        return HTTPException(
+            status_code=429,
+            detail="Render queue is full, try again later",
+            headers={"Retry-After": "5"}
+        )
+    return HTTPException(
+        status_code=504,
+        detail=f"OpenSCAD did not finish within {RENDER_TIMEOUT:g}s"
+    )
 
 @router.post("/rendershots_zip/")
-async def rendershots_zip(prefs: PlaygroundPreferences):
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        # Write all source files to tempdir
-        for f in prefs.sources:
-            full_path = os.path.join(tmpdirname, os.path.normpath(f.path).lstrip("/"))
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            with open(full_path, "w", encoding="utf-8") as ff:
-                ff.write(f.content)
-        main_path = os.path.join(tmpdirname, os.path.normpath(prefs.active_path).lstrip("/"))
-        stl_path = os.path.join(tmpdirname, "out.stl")
-        # OpenSCAD CLI to STL
-        result = subprocess.run(
-            ["openscad", "-o", stl_path, main_path],
-            capture_output=True,
-            cwd=tmpdirname,
-            timeout=30
+async def rendershots_zip(
+    prefs: PlaygroundPreferences,
+    request: Request,
+    resolution: int = Query(VIEW_RESOLUTION, ge=64, le=2048, description="Width and height of each view in pixels."),
+    views: Optional[List[int]] = Query(None, description="Subset of the 14 view indices to render, all by default."),
+    face_budget: int = Query(
+        PREVIEW_FACE_BUDGET, ge=0, description="Faces kept in the mesh the views are rendered from, 0 for the full mesh."
+    ),
+    formats: List[str] = Query(
+        ["stl"], description="Meshes to include: stl (full resolution), glb and qmesh (reduced preview)."
+    ),
+):
+    try:
+        stream = await cancel_on_disconnect(
+            request, open_shots(prefs, resolution=resolution, views=views, face_budget=face_budget, formats=formats)
         )
-        if result.returncode != 0:
-            return {"error": "OpenSCAD failed", "stderr": result.stderr.decode()}
-        # Load STL into trimesh
-        with open(stl_path, "rb") as sf:
-            stl_data = sf.read()
-        mesh = trimesh.load_mesh(file_obj=io.BytesIO(stl_data), file_type='stl')
-        mesh.apply_translation(-mesh.centroid)
-        # Render 14 views into a zip in-memory
-        mem_zip = io.BytesIO()
-        with zipfile.ZipFile(mem_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for idx, direction in enumerate(get_cube_view_dirs()):
-                camera_distance = mesh.extents.max() * 1.5 + 0.01
-                camera_pose = trimesh.scene.cameras.look_at(
-                    points=[np.zeros(3)],
-                    eye=[direction * camera_distance],
-                    up=[0,0,1],
-                )
-                scene = mesh.scene()
-                png_bytes = scene.save_image(
-                    resolution=[512,512],
-                    visible=True,
-                    camera_transform=camera_pose
-                )
-                zipf.writestr(f"view_{idx:02d}.png", png_bytes)
-            zipf.writestr("model.stl", stl_data)
-        mem_zip.seek(0)
-        return StreamingResponse(
-            mem_zip,
-            media_type="application/zip",
-            headers={"Content-Disposition": 'attachment; filename="rendershots.zip"'}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (RenderQueueFull, RenderTimeout) as e:
+        raise render_http_error(e)
+    except OpenSCADError as e:
+        return {"error": "OpenSCAD failed", "stderr": e.stderr}
+    # The zip is written while it is sent: views as they render, then the meshes, the STL in chunks
+    return StreamingResponse(
+        stream.chunks(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": 'attachment; filename="rendershots.zip"',
+            "X-Render-Cache": stream.cache_status,
+        },
+        # Frees the render if the response never got to read it
+        background=BackgroundTask(stream.aclose),
+    )
+
+@router.post("/part_stl/")
+async def part_stl(prefs: PlaygroundPreferences, path: str, request: Request, module: Optional[str] = None):
+    # STL of one file of the project, e.g. path=/tines.scad&module=tines
+    try:
+        stl_file, cache_status = await cancel_on_disconnect(request, compile_part(prefs, path, module))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (RenderQueueFull, RenderTimeout) as e:
+        raise render_http_error(e)
+    except OpenSCADError as e:
+        return {"error": "OpenSCAD failed", "stderr": e.stderr}
+    filename = quote(path.split("/")[-1].rsplit(".", 1)[0] + ".stl")
+
+    def chunks():
+        # From the open file: the cache may evict the entry before the response is sent
+        with stl_file:
+            while block := stl_file.read(STL_CHUNK_BYTES):
+                yield block
+
+    return StreamingResponse(
+        chunks(),
+        media_type="model/stl",
+        headers={
+            "Content-Length": str(os.fstat(stl_file.fileno()).st_size),
+            "Content-Disposition": f"attachment; filename*=utf-8''{filename}",
+            "X-Render-Cache": cache_status,
+        },
+    )
+
+@router.post("/analysis/")
+async def analysis(
+    prefs: PlaygroundPreferences,
+    request: Request,
+    response: Response,
+    overhang_angle: float = Query(45.0, ge=0, le=90, description="Steepest printable slope from vertical, in degrees."),
+    min_wall: float = Query(0.8, gt=0, description="Thinnest printable wall, in model units (mm)."),
+    resolution: int = Query(64, ge=8, le=256, description="Voxels along the longest side for volume and wall estimates."),
+):
+    # Volume, area, bounding box, watertightness, overhangs and thin walls of the active file's mesh
+    try:
+        report, cache_status = await cancel_on_disconnect(
+            request, analyze_project(prefs, overhang_angle=overhang_angle, min_wall=min_wall, resolution=resolution)
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (RenderQueueFull, RenderTimeout) as e:
+        raise render_http_error(e)
+    except OpenSCADError as e:
+        return {"error": "OpenSCAD failed", "stderr": e.stderr}
+    response.headers["X-Render-Cache"] = cache_status
+    return report
+
+@router.post("/sweep/")
+async def sweep(
+    body: ParameterSweep,
+    resolution: int = Query(THUMBNAIL_RESOLUTION, ge=64, le=1024, description="Width and height of each thumbnail."),
+    include_stl: bool = Query(True, description="Set to false to only get the thumbnails and stats."),
+):
+    # One compile per distinct configuration, spread over the render workers; results stream as they finish
+    try:
+        configs = expand_sweep(body.grid, body.variants)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        async for result in run_sweep(body.prefs, configs, resolution=resolution, include_stl=include_stl):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"X-Sweep-Variants": str(len(configs))},
+    )
+
+@router.post("/dependencies/")
+async def dependencies(prefs: PlaygroundPreferences):
+    # The include/use graph, in compile order, with the closure hash that keys each file's artifact
+    graph = DependencyGraph(prefs.sources)
+    return {
+        "order": graph.topological_order(),
+        "files": {
+            path: {
+                "depends_on": sorted(graph.deps[path]),
+                "dependents": sorted(graph.dependents[path]),
+                "external": sorted(graph.external[path]),
+                "closure_hash": graph.closure_hash(path),
+            }
+            for path in graph.files
+        },
+    }
+
+@router.get("/stats")
+async def render_stats():
+    # Queue depth, wait times and outcome counters for the render worker pool, cache and workspace usage
+    return {**render_pool.stats(), "cache": get_render_cache().stats(), "workspaces": get_workspace_pool().stats()}
+
+def job_status(jobs: JobManager, job_id: str) -> RenderJob:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    artifacts = jobs.artifacts(job_id) if job["status"] == "done" else []
+    return RenderJob(
+        job_id=job_id,
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        error=job["error"],
+        stderr=job["stderr"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        artifacts=artifacts,
+    )
+
+def job_artifact(jobs: JobManager, job_id: str, name: str, media_type: str) -> StreamingResponse:
+    job = job_status(jobs, job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    if name not in job.artifacts:
+        raise HTTPException(status_code=404, detail=f"Job has no {name}")
+    return StreamingResponse(
+        jobs.iter_artifact(job_id, name),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+@router.post("/jobs", response_model=RenderJob, status_code=202)
+async def create_job(
+    prefs: PlaygroundPreferences,
+    resolution: int = Query(VIEW_RESOLUTION, ge=64, le=2048),
+    views: Optional[List[int]] = Query(None),
+    face_budget: int = Query(PREVIEW_FACE_BUDGET, ge=0),
+    formats: List[str] = Query(["stl"]),
+    jobs: JobManager = Depends(get_job_manager),
+):
+    # Same input as /rendershots_zip/, but returns at once; poll the job for the result
+    try:
+        render_options(resolution, views, prefs.color, face_budget, formats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job_id = jobs.submit(prefs, resolution=resolution, views=views, face_budget=face_budget, formats=formats)
+    return job_status(jobs, job_id)
+
+@router.get("/jobs/{job_id}", response_model=RenderJob)
+async def get_job(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    return job_status(jobs, job_id)
+
+@router.delete("/jobs/{job_id}", response_model=RenderJob)
+async def cancel_job(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    if jobs.cancel(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job_status(jobs, job_id)
+
+@router.get("/jobs/{job_id}/zip")
+async def job_zip(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    if job_status(jobs, job_id).status != "done":
+        raise HTTPException(status_code=409, detail="Job is not done")
+    return FileResponse(jobs.zip_path(job_id), media_type="application/zip", filename="rendershots.zip")
+
+@router.get("/jobs/{job_id}/stl")
+async def job_stl(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    return job_artifact(jobs, job_id, "model.stl", "model/stl")
+
+@router.get("/jobs/{job_id}/views/{index}")
+async def job_view(job_id: str, index: int, jobs: JobManager = Depends(get_job_manager)):
+    return job_artifact(jobs, job_id, f"view_{index:02d}.png", "image/png")
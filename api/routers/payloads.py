@@ -0,0 +1,28 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import RedirectResponse
+from models.models import PlaygroundPreferences, ShortLinkResponse
+from services.payload_store import PayloadStore, get_payload_store, short_url
+
+router = APIRouter(prefix="/p", tags=["Short links"])
+
+@router.post("", response_model=ShortLinkResponse)
+async def create_link(prefs: PlaygroundPreferences, store: PayloadStore = Depends(get_payload_store)):
+    pid = await asyncio.to_thread(store.put, prefs.to_payload())
+    return ShortLinkResponse(id=pid, short_url=short_url(pid))
+
+@router.get("/{pid}")
+async def open_link(pid: str, store: PayloadStore = Depends(get_payload_store)):
+    # Sends the browser on to the playground with the full payload in the URL hash
+    url = await asyncio.to_thread(store.playground_url, pid)
+    if url is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired link")
+    return RedirectResponse(url, status_code=302)
+
+@router.get("/{pid}/json")
+async def link_payload(pid: str, store: PayloadStore = Depends(get_payload_store)):
+    payload = await asyncio.to_thread(store.get_payload, pid)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired link")
+    return payload
@@ -0,0 +1,306 @@
+import importlib
+import json
+import os
+import threading
+
+from models.models import RawChatResponse, RawEditResponse
+from services.metrics import LLM_TOKENS, span
+from services.snippet_library import get_snippet_library
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4.1")
+CHAT_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", "120"))
+CHAT_MAX_CONNECTIONS = int(os.getenv("CHAT_MAX_CONNECTIONS", "100"))
+CHAT_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("CHAT_MAX_KEEPALIVE_CONNECTIONS", "20"))
+CHAT_KEEPALIVE_EXPIRY = float(os.getenv("CHAT_KEEPALIVE_EXPIRY", "60"))
+# "package.module:factory" returning a ChatEngine, to swap the engine without code changes
+CHAT_ENGINE_FACTORY = os.getenv("CHAT_ENGINE_FACTORY", "")
+
+PROMPT_TEMPLATE = (
+    "You are an expert OpenSCAD assistant.\n"
+    "Strictly reply ONLY in a JSON matching this schema (no commentary, no explanations):\n"
+    "{format_instructions}\n"
+    "\n"
+    "For EACH user request:\n"
+    "- Organize the project with MULTIPLE OpenSCAD files, in modular style.\n"
+    "- IMPORTANT: Put ALL files at the project ROOT (e.g. /main.scad, /helpers.scad). NEVER use subfolders or utils/ or directories.\n"
+    "- In all 'include <...>;' or 'use <...>;' statements, reference only top-level files, matching the given source file 'path'.\n"
+    "- Never output ../, /utils/, or subdirectory paths.\n"
+    "- The main logic is in /main.scad and demonstrates how to use helpers.\n"
+    "- Always use at least two files unless impossible.\n"
+    "- At the end of /main.scad, ensure any test/demo code or preview is included; for simplicity, just call the main module directly (e.g., 'my_object();').\n"
+    "- The response MUST be VALID JSON matching the schema. No comments or extra output.\n"
+    "- Make the object pass all the parameters down from the top object, so that all the vars are defined at the top. This will make it easily customizeable by the user."
+    "- Summarize your design and file structure in 'reply_text'.\n"
+    "{library}"
+    "\n"
+    "EXAMPLE USER REQUEST: make a simple cube\n"
+    "EXAMPLE RESPONSE:\n"
+    "{{\n"
+    "  \"sources\": [\n"
+    "    {{\"path\": \"/main.scad\", \"content\": \"include <common.scad>\\nmy_cube();\\n\"}},\n"
+    "    {{\"path\": \"/common.scad\", \"content\": \"module my_cube() {{ cube([10,10,10]); }}\"}}\n"
+    "  ],\n"
+    "  \"active_path\": \"/main.scad\",\n"
+    "  \"reply_text\": \"This divides the simple cube project into a main file and a helper module at the root.\""
+    "}}\n"
+    "\n"
+    "USER REQUEST:\n"
+    "{input}\n"
+)
+
+# Same rules as the first answer, plus the failing project and what OpenSCAD said about it
+REPAIR_TEMPLATE = PROMPT_TEMPLATE + (
+    "\n"
+    "YOUR PREVIOUS ANSWER DOES NOT COMPILE:\n"
+    "{previous}\n"
+    "\n"
+    "OPENSCAD OUTPUT:\n"
+    "{errors}\n"
+    "\n"
+    "Fix the errors and reply with the complete corrected project, all files included.\n"
+)
+
+
+# Follow-ups in a session: the current project goes in, only the changed files come out
+EDIT_TEMPLATE = (
+    "You are an expert OpenSCAD assistant, iterating on an existing project with the user.\n"
+    "Strictly reply ONLY in a JSON matching this schema (no commentary, no explanations):\n"
+    "{format_instructions}\n"
+    "\n"
+    "For the user request below:\n"
+    "- List ONLY the files that change in 'edits'; files you leave out are kept as they are.\n"
+    "- For small changes give 'hunks': each 'search' is copied exactly from the current file and is long enough to be unique in it, 'replace' is its new text.\n"
+    "- For a new file, or when most of a file changes, give its full 'content' instead of hunks.\n"
+    "- To remove a file, give its path with 'delete' set to true.\n"
+    "- Keep all files at the project ROOT and include/use statements pointing at them.\n"
+    "- Keep all the parameters defined at the top and passed down from the top object.\n"
+    "- The response MUST be VALID JSON matching the schema. No comments or extra output.\n"
+    "- Summarize your changes in 'reply_text'.\n"
+    "{library}"
+    "\n"
+    "EARLIER REQUESTS:\n"
+    "{history}\n"
+    "\n"
+    "CURRENT PROJECT (primary file {active_path}):\n"
+    "{project}\n"
+    "{errors}"
+    "USER REQUEST:\n"
+    "{input}\n"
+)
+
+
+def format_project(sources, library=None) -> str:
+    # Library files are only named, the LLM has no reason to read or resend them
+    return "\n".join(
+        f"=== {f.path} ===\n{library.describe(f) if library and library.is_library_file(f) else f.content}\n"
+        for f in sources
+    )
+
+
+class IncrementalResponseParser:
+    """
+    Scans the LLM's JSON reply as it streams in, without re-parsing the buffer.
+    feed() returns the events completed by the new text:
+      ("source", {"path": ..., "content": ...}) for each finished entry of "sources"
+      ("field", (key, value)) for each finished top-level string field
+    Anything before the first "{" (e.g. a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.expect_key = False
+        self.key = None
+        self.item_start = None
+
+    def feed(self, text: str):
+        self.buffer += text
+        events = []
+        buf = self.buffer
+        for i in range(self.pos, len(buf)):
+            ch = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1:
+                        value = json.loads(buf[self.string_start:i + 1])
+                        if self.expect_key:
+                            self.key = value
+                        else:
+                            events.append(("field", (self.key, value)))
+                continue
+            if not self.stack and ch != "{":
+                continue
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+            elif ch in "{[":
+                if ch == "{" and self.stack == ["{", "["] and self.key == "sources":
+                    self.item_start = i
+                self.stack.append(ch)
+                if len(self.stack) == 1:
+                    self.expect_key = True
+            elif ch in "}]":
+                if self.stack:
+                    self.stack.pop()
+                if ch == "}" and self.stack == ["{", "["] and self.item_start is not None:
+                    events.append(("source", json.loads(buf[self.item_start:i + 1])))
+                    self.item_start = None
+            elif len(self.stack) == 1:
+                if ch == ",":
+                    self.expect_key = True
+                elif ch == ":":
+                    self.expect_key = False
+        self.pos = len(buf)
+        return events
+
+
+class ChatEngine:
+    """
+    The prompt, output parser and LLM client, built once per process and
+    shared by all requests. The OpenAI client gets a keep-alive connection
+    pool, so concurrent requests reuse TLS connections instead of opening new ones.
+    Pass `llm` to use any other LangChain chat model. Prompts offer the
+    `library` modules that fit the request (the shared snippet library by default).
+    """
+
+    def __init__(self, llm=None, model: str = CHAT_MODEL, library=None):
+        # LangChain and the OpenAI SDK take seconds to import, so only chat nodes pay for them
+        import httpx
+        from langchain_core.prompts import PromptTemplate
+        from langchain_core.output_parsers import PydanticOutputParser
+        from langchain_openai import ChatOpenAI
+
+        self.parser = PydanticOutputParser(pydantic_object=RawChatResponse)
+        self.prompt = PromptTemplate(
+            template=PROMPT_TEMPLATE,
+            input_variables=["input", "library"],
+            partial_variables={"format_instructions": self.parser.get_format_instructions()},
+        )
+        self.repair_prompt = PromptTemplate(
+            template=REPAIR_TEMPLATE,
+            input_variables=["input", "library", "previous", "errors"],
+            partial_variables={"format_instructions": self.parser.get_format_instructions()},
+        )
+        self.edit_parser = PydanticOutputParser(pydantic_object=RawEditResponse)
+        self.edit_prompt = PromptTemplate(
+            template=EDIT_TEMPLATE,
+            input_variables=["input", "library", "history", "active_path", "project", "errors"],
+            partial_variables={"format_instructions": self.edit_parser.get_format_instructions()},
+        )
+        self.library = library if library is not None else get_snippet_library()
+        self.http_client = None
+        if llm is None:
+            self.http_client = httpx.AsyncClient(
+                timeout=CHAT_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=CHAT_MAX_CONNECTIONS,
+                    max_keepalive_connections=CHAT_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=CHAT_KEEPALIVE_EXPIRY,
+                ),
+            )
+            llm = ChatOpenAI(model=model, http_async_client=self.http_client)
+        self.llm = llm
+        self.stream_chain = self.prompt | self.llm
+        self.repair_chain = self.repair_prompt | self.llm
+        self.edit_chain = self.edit_prompt | self.llm
+
+    async def ainvoke(self, request_text: str) -> RawChatResponse:
+        return await self._call(self.stream_chain, self.inputs(request_text))
+
+    async def arepair(self, request_text: str, previous: RawChatResponse, errors: str) -> RawChatResponse:
+        # Asks again with the answer that failed to compile and the compiler output
+        own_files = [f for f in previous.sources if not self.library.is_library_file(f)]
+        return await self._call(self.repair_chain, {
+            **self.inputs(request_text),
+            "previous": previous.model_copy(update={"sources": own_files}).model_dump_json(),
+            "errors": errors,
+        })
+
+    async def aedit(self, request_text: str, session: dict, errors: str = None) -> RawEditResponse:
+        """
+        Asks for the changes a follow-up makes to the session's project.
+        `errors` explains why the previous edits did not apply, for a retry.
+        """
+        history = "\n".join(f"- {turn['request_text']}" for turn in session["history"]) or "(none)"
+        return await self._call(self.edit_chain, {
+            **self.inputs(request_text),
+            "history": history,
+            "active_path": session["active_path"],
+            "project": format_project(session["sources"], self.library),
+            "errors": f"\nYOUR PREVIOUS EDITS COULD NOT BE APPLIED:\n{errors}\n\n" if errors else "\n",
+        }, self.edit_parser)
+
+    async def _call(self, chain, inputs, parser=None):
+        # Same as `chain | parser`, timing the LLM call and the parsing separately
+        with span("llm") as attrs:
+            message = await chain.ainvoke(inputs)
+            attrs.update(count_tokens(message))
+        with span("parse"):
+            return (parser or self.parser).parse(message.content)
+
+    def astream(self, request_text: str):
+        # Raw message chunks; parse the joined text with self.parser at the end
+        return self.stream_chain.astream(self.inputs(request_text))
+
+    def inputs(self, request_text: str) -> dict:
+        return {"input": request_text, "library": self.library.prompt_section(request_text)}
+
+    async def aclose(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+
+
+def count_tokens(message) -> dict:
+    # Token usage reported by the provider, if any, added to the token counters
+    usage = getattr(message, "usage_metadata", None) or {}
+    tokens = {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+    for kind, count in tokens.items():
+        if count:
+            LLM_TOKENS.inc(count, kind.split("_")[0])
+    return tokens
+
+
+def build_chat_engine() -> ChatEngine:
+    if CHAT_ENGINE_FACTORY:
+        module_name, _, attr = CHAT_ENGINE_FACTORY.partition(":")
+        return getattr(importlib.import_module(module_name), attr)()
+    return ChatEngine()
+
+
+_chat_engine = None
+_chat_engine_lock = threading.Lock()
+
+
+def get_chat_engine() -> ChatEngine:
+    # FastAPI dependency; tests swap it through app.dependency_overrides
+    global _chat_engine
+    if _chat_engine is None:
+        # The startup warmup thread and a first request may race to build it
+        with _chat_engine_lock:
+            if _chat_engine is None:
+                _chat_engine = build_chat_engine()
+    return _chat_engine
+
+
+def warm_chat_engine():
+    # Run in the background after startup; a missing API key must not stop render-only deployments from booting
+    try:
+        get_chat_engine()
+    except Exception as e:
+        print(f"Chat engine not ready, will retry on first request: {e}")
+
+
+async def close_chat_engine():
+    global _chat_engine
+    if _chat_engine is not None:
+        await _chat_engine.aclose()
+        _chat_engine = None
@@ -0,0 +1,192 @@
+import numpy as np
+
+# Column offsets in voxels, irrational-ish so rays never run exactly along a triangle edge
+_RAY_JITTER = (0.5 + 1.2345e-4, 0.5 + 2.7183e-4)
+
+
+def analyze_mesh(mesh, overhang_angle: float = 45.0, min_wall: float = 0.8, resolution: int = 64):
+    """
+    Printability report of a trimesh mesh, in the mesh's units (mm for OpenSCAD).
+    Overhangs are downward faces sloping more than `overhang_angle` degrees
+    from vertical, not counting faces resting on the build plate.
+    Material use and thin walls come from a voxel grid with `resolution`
+    cells along the longest side: walls thinner than about `min_wall` are the
+    voxels that disappear under a morphological opening.
+    Everything is vectorized over faces, vertices and voxels.
+    A mesh without faces, e.g. a model that renders to nothing, reports zeros.
+    """
+    if len(mesh.faces) == 0:
+        return _empty_report(mesh, overhang_angle, min_wall)
+    vertices, faces, triangles, cross, double_areas = _face_geometry(mesh)
+    lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+    areas = double_areas / 2
+    area = float(areas.sum())
+
+    normals_z = np.divide(cross[:, 2], double_areas, out=np.zeros(len(faces)), where=double_areas > 0)
+    on_plate = (triangles[:, :, 2] - lo[2] < 1e-6 * max(float((hi - lo).max()), 1.0)).all(axis=1)
+    overhang = (-normals_z > np.sin(np.radians(overhang_angle))) & ~on_plate
+    overhang_area = float(areas[overhang].sum())
+
+    voxels = voxel_report(triangles, lo, hi, resolution, min_wall)
+    return {
+        **geometry_stats(mesh),
+        "overhang": {
+            "angle": overhang_angle,
+            "area": overhang_area,
+            "fraction": overhang_area / area if area else 0.0,
+            "faces": int(overhang.sum()),
+        },
+        **voxels,
+    }
+
+
+def geometry_stats(mesh):
+    # The cheap part of the report: counts, bounding box, volume, area and watertightness
+    vertices, faces, triangles, cross, double_areas = _face_geometry(mesh)
+    if len(faces) == 0:
+        lo = hi = np.zeros(3)
+    else:
+        lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+    # Signed volume of the tetrahedra from the origin to each face
+    volume = float(np.einsum("ij,ij->i", triangles[:, 0], cross).sum() / 6)
+    return {
+        "faces": len(faces),
+        "vertices": len(vertices),
+        "bounding_box": {
+            "min": lo.tolist(),
+            "max": hi.tolist(),
+            "size": (hi - lo).tolist(),
+        },
+        "volume": abs(volume),
+        "surface_area": float(double_areas.sum() / 2),
+        "watertight": is_watertight(faces),
+    }
+
+
+def _empty_report(mesh, overhang_angle: float, min_wall: float):
+    return {
+        **geometry_stats(mesh),
+        "overhang": {"angle": overhang_angle, "area": 0.0, "fraction": 0.0, "faces": 0},
+        "voxels": {"pitch": 0.0, "shape": [0, 0, 0], "filled": 0, "material_volume": 0.0},
+        "thin_walls": {"min_wall": min_wall, "reliable": False, "volume": 0.0, "fraction": 0.0},
+    }
+
+
+def _face_geometry(mesh):
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces, dtype=np.int64)
+    triangles = vertices[faces]
+    cross = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    return vertices, faces, triangles, cross, np.linalg.norm(cross, axis=1)
+
+
+def is_watertight(faces) -> bool:
+    # Closed and consistently wound: every directed edge is matched by exactly one reversed edge
+    if len(faces) == 0:
+        return False
+    n = int(faces.max()) + 1
+    # Each directed edge as one int64, sorting scalars is far faster than unique rows
+    forward = np.sort(np.concatenate([faces[:, 0] * n + faces[:, 1], faces[:, 1] * n + faces[:, 2],
+                                      faces[:, 2] * n + faces[:, 0]]))
+    if (forward[1:] == forward[:-1]).any():
+        return False
+    reverse = np.sort((forward % n) * n + forward // n)
+    return bool((forward == reverse).all())
+
+
+def voxel_report(triangles, lo, hi, resolution: int, min_wall: float):
+    pitch = float((hi - lo).max()) / resolution or 1.0
+    occupied = voxelize(triangles, lo, hi, pitch)
+    # An opening with a cross of radius r removes structures under about 2r + 1 voxels thick
+    radius = max(1, int(round((min_wall / pitch - 1) / 2)))
+    thin = occupied & ~_dilate(_erode(occupied, radius), radius)
+    filled = int(occupied.sum())
+    return {
+        "voxels": {
+            "pitch": pitch,
+            "shape": list(occupied.shape),
+            "filled": filled,
+            "material_volume": filled * pitch ** 3,
+        },
+        "thin_walls": {
+            "min_wall": min_wall,
+            # Below two voxels per wall the grid is too coarse to tell
+            "reliable": pitch * 2 <= min_wall,
+            "volume": int(thin.sum()) * pitch ** 3,
+            "fraction": int(thin.sum()) / filled if filled else 0.0,
+        },
+    }
+
+
+def voxelize(triangles, lo, hi, pitch: float):
+    """
+    Solid voxel grid by ray parity: one ray per (x, y) column along +z, a
+    voxel is inside when an odd number of surface crossings lie below its center.
+    Triangle/column pairs are enumerated from each triangle's xy bounding box.
+    """
+    shape = np.maximum(np.ceil((hi - lo) / pitch).astype(np.int64), 1)
+    nx, ny, nz = (int(n) for n in shape)
+    xy = (triangles[:, :, :2] - lo[:2]) / pitch - np.array(_RAY_JITTER)
+    first = np.clip(np.ceil(xy.min(axis=1)), 0, [nx, ny]).astype(np.int64)
+    last = np.clip(np.floor(xy.max(axis=1)), -1, [nx - 1, ny - 1]).astype(np.int64)
+    spans = np.maximum(last - first + 1, 0)
+    counts = spans[:, 0] * spans[:, 1]
+
+    tri = np.repeat(np.arange(len(triangles)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    width = spans[tri, 0]
+    i = first[tri, 0] + offset % np.maximum(width, 1)
+    j = first[tri, 1] + offset // np.maximum(width, 1)
+    p = np.stack([i, j], axis=1) + np.array(_RAY_JITTER)
+
+    a, b, c = (xy[tri, k] + np.array(_RAY_JITTER) for k in range(3))
+    det = _cross2(b - a, c - a)
+    valid = np.abs(det) > 1e-12
+    det = np.where(valid, det, 1.0)
+    w0 = _cross2(b - p, c - p) / det
+    w1 = _cross2(c - p, a - p) / det
+    w2 = 1 - w0 - w1
+    hit = valid & (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+
+    zs = triangles[tri, :, 2]
+    z = (w0 * zs[:, 0] + w1 * zs[:, 1] + w2 * zs[:, 2])[hit]
+    column = (i * ny + j)[hit]
+    # A crossing at height z flips every voxel center above it
+    start = np.clip(np.ceil((z - lo[2]) / pitch - 0.5), 0, nz).astype(np.int64)
+    flips = np.zeros((nx * ny, nz + 1), dtype=np.int32)
+    np.add.at(flips, (column, start), 1)
+    return (np.cumsum(flips, axis=1)[:, :nz] % 2 == 1).reshape(nx, ny, nz)
+
+
+def _cross2(u, v):
+    return u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+
+
+def _erode(grid, radius: int):
+    for _ in range(radius):
+        out = grid.copy()
+        for axis in range(3):
+            out &= _shift(grid, axis, 1, False) & _shift(grid, axis, -1, False)
+        grid = out
+    return grid
+
+
+def _dilate(grid, radius: int):
+    for _ in range(radius):
+        out = grid.copy()
+        for axis in range(3):
+            out |= _shift(grid, axis, 1, False) | _shift(grid, axis, -1, False)
+        grid = out
+    return grid
+
+
+def _shift(grid, axis: int, step: int, fill):
+    out = np.full_like(grid, fill)
+    src = [slice(None)] * 3
+    dst = [slice(None)] * 3
+    if step > 0:
+        src[axis], dst[axis] = slice(None, -step), slice(step, None)
+    else:
+        src[axis], dst[axis] = slice(-step, None), slice(None, step)
+    out[tuple(dst)] = grid[tuple(src)]
+    return out
@@ -0,0 +1,124 @@
+import struct
+import zlib
+
+import numpy as np
+
+QMESH_MAGIC = b"FQM1"
+QMESH_HEADER = struct.Struct("<4sIIB3f3f")
+
+
+def make_lod(mesh, face_budget: int):
+    """
+    Preview version of a trimesh mesh: duplicate vertices merged, then
+    decimated to at most `face_budget` faces. Quadric decimation is used when
+    fast_simplification is installed, vertex clustering otherwise.
+    Meshes already within budget are returned as they are.
+    """
+    import trimesh
+
+    mesh.merge_vertices()
+    if not face_budget or len(mesh.faces) <= face_budget:
+        return mesh
+    try:
+        lod = mesh.simplify_quadric_decimation(face_count=face_budget)
+        if len(lod.faces) <= face_budget:
+            return lod
+    except ImportError:
+        pass
+    vertices, faces = cluster_decimate(mesh.vertices, mesh.faces, face_budget)
+    return trimesh.Trimesh(vertices=vertices, faces=faces, process=True)
+
+
+def cluster_decimate(vertices, faces, face_budget: int, steps: int = 12):
+    """
+    Vertex clustering in NumPy: snaps vertices to a grid, merges each cell to
+    its mean and drops the faces that collapse. The finest grid that fits the
+    budget is found by bisection on the number of cells per axis.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    lo = vertices.min(axis=0)
+    extent = float((vertices.max(axis=0) - lo).max()) or 1.0
+    best = None
+    low, high = 1, 2048
+    for _ in range(steps):
+        if low > high:
+            break
+        cells = (low + high) // 2
+        candidate = _cluster(vertices, faces, lo, extent / cells)
+        if len(candidate[1]) <= face_budget:
+            best = candidate
+            low = cells + 1
+        else:
+            high = cells - 1
+    return best if best is not None else _cluster(vertices, faces, lo, extent)
+
+
+def _cluster(vertices, faces, lo, cell_size: float):
+    cells = np.floor((vertices - lo) / cell_size).astype(np.int64)
+    _, inverse = np.unique(cells, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    count = inverse.max() + 1
+    sums = np.zeros((count, 3))
+    np.add.at(sums, inverse, vertices)
+    merged = sums / np.bincount(inverse, minlength=count)[:, None]
+    new_faces = inverse[faces]
+    keep = (
+        (new_faces[:, 0] != new_faces[:, 1])
+        & (new_faces[:, 1] != new_faces[:, 2])
+        & (new_faces[:, 0] != new_faces[:, 2])
+    )
+    new_faces = new_faces[keep]
+    # Two triangles collapsing onto the same three cells would draw twice
+    _, first = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+    return merged, new_faces[np.sort(first)]
+
+
+def export_glb(mesh) -> bytes:
+    return mesh.export(file_type="glb")
+
+
+def _position_type(bits: int) -> str:
+    return "<u1" if bits <= 8 else "<u2"
+
+
+def encode_qmesh(mesh, bits: int = 16) -> bytes:
+    """
+    Compact binary mesh in the spirit of Draco: positions quantized to `bits`
+    (1 to 16) per axis over the bounding box, then positions and indices deflated.
+    Layout: header (magic "FQM1", vertex count, face count, bits, float32
+    min xyz, float32 step xyz) followed by a zlib stream holding uint8 (up to
+    8 bits) or uint16 xyz per vertex and uint16 (under 65536 vertices) or
+    uint32 indices per face.
+    """
+    if not 1 <= bits <= 16:
+        raise ValueError(f"qmesh positions take 1 to 16 bits, got {bits}")
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces, dtype=np.int64)
+    lo = vertices.min(axis=0) if len(vertices) else np.zeros(3)
+    levels = (1 << bits) - 1
+    step = (vertices.max(axis=0) - lo) / levels if len(vertices) else np.zeros(3)
+    step[step == 0] = 1.0
+    quantized = np.rint((vertices - lo) / step).astype(_position_type(bits))
+    index_type = "<u2" if len(vertices) < 65536 else "<u4"
+    body = quantized.tobytes() + faces.astype(index_type).tobytes()
+    header = QMESH_HEADER.pack(QMESH_MAGIC, len(vertices), len(faces), bits, *lo, *step)
+    return header + zlib.compress(body, 9)
+
+
+def decode_qmesh(data: bytes):
+    """
+    Returns (vertices float32 (n, 3), faces (m, 3)) from encode_qmesh() output.
+    """
+    magic, n_vertices, n_faces, bits, *rest = QMESH_HEADER.unpack_from(data)
+    if magic != QMESH_MAGIC:
+        raise ValueError("Not a qmesh buffer")
+    lo, step = np.array(rest[:3]), np.array(rest[3:])
+    body = zlib.decompress(data[QMESH_HEADER.size:])
+    position_type = np.dtype(_position_type(bits))
+    positions = np.frombuffer(body, dtype=position_type, count=n_vertices * 3).reshape(-1, 3)
+    index_type = "<u2" if n_vertices < 65536 else "<u4"
+    faces = np.frombuffer(
+        body, dtype=index_type, offset=n_vertices * 3 * position_type.itemsize, count=n_faces * 3
+    ).reshape(-1, 3)
+    return (positions * step + lo).astype(np.float32), faces
@@ -0,0 +1,169 @@
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+RENDER_VIEW_THREADS = int(os.getenv("RENDER_VIEW_THREADS", str(os.cpu_count() or 1)))
+# Upper bound on candidate pixels rasterized at once, keeps memory flat on big meshes
+RASTER_CHUNK_PIXELS = 4_000_000
+
+BACKGROUND = np.array([255, 255, 255], dtype=np.uint8)
+DEFAULT_COLOR = (0xf9, 0xd7, 0x2c)
+
+
+def hex_to_rgb(color: str):
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def encode_png(rgb: np.ndarray, compresslevel: int = 6) -> bytes:
+    # Minimal RGB8 PNG writer, no Pillow needed
+    height, width, _ = rgb.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), compresslevel))
+        + chunk(b"IEND", b"")
+    )
+
+
+class SoftwareRenderer:
+    """
+    Headless z-buffer rasterizer written in NumPy, for boxes without a GPU or display.
+    The mesh is centered and uploaded once; render() then draws it from any
+    direction with flat shading and a headlight, using only vectorized array ops.
+    """
+
+    def __init__(self, vertices, faces, color=DEFAULT_COLOR, fov_degrees: float = 60.0):
+        vertices = np.asarray(vertices, dtype=np.float64)
+        self.faces = np.asarray(faces, dtype=np.int64)
+        center = (vertices.min(axis=0) + vertices.max(axis=0)) / 2 if len(vertices) else np.zeros(3)
+        self.vertices = vertices - center
+        tri = self.vertices[self.faces]
+        normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        self.normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+        extents = self.vertices.max(axis=0) - self.vertices.min(axis=0) if len(vertices) else np.zeros(3)
+        self.distance = float(extents.max()) * 1.5 + 0.01
+        self.color = np.asarray(color, dtype=np.float64)
+        self.tan_half_fov = np.tan(np.radians(fov_degrees) / 2)
+
+    @classmethod
+    def from_mesh(cls, mesh, **kwargs):
+        return cls(mesh.vertices, mesh.faces, **kwargs)
+
+    def camera(self, direction):
+        # Orthonormal basis looking at the origin from `direction`, z up where possible
+        direction = np.asarray(direction, dtype=np.float64)
+        direction = direction / np.linalg.norm(direction)
+        eye = direction * self.distance
+        forward = -direction
+        up = np.array([0.0, 0.0, 1.0])
+        if abs(forward @ up) > 0.999:
+            up = np.array([0.0, 1.0, 0.0])
+        right = np.cross(forward, up)
+        right /= np.linalg.norm(right)
+        true_up = np.cross(right, forward)
+        return eye, forward, right, true_up
+
+    def render(self, direction, resolution: int = 512) -> np.ndarray:
+        """
+        Returns a (resolution, resolution, 3) uint8 image.
+        """
+        size = resolution
+        image = np.empty((size * size, 3), dtype=np.uint8)
+        image[:] = BACKGROUND
+        if len(self.faces) == 0:
+            return image.reshape(size, size, 3)
+        eye, forward, right, up = self.camera(direction)
+
+        rel = self.vertices - eye
+        depth = rel @ forward
+        depth = np.maximum(depth, 1e-6)
+        scale = (size / 2) / (depth * self.tan_half_fov)
+        sx = (rel @ right) * scale + size / 2
+        sy = size / 2 - (rel @ up) * scale
+
+        f = self.faces
+        x0, x1, x2 = sx[f[:, 0]], sx[f[:, 1]], sx[f[:, 2]]
+        y0, y1, y2 = sy[f[:, 0]], sy[f[:, 1]], sy[f[:, 2]]
+        inv_d = 1.0 / depth[f]
+        area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+
+        xmin = np.clip(np.floor(np.minimum(np.minimum(x0, x1), x2)), 0, size - 1).astype(np.int64)
+        xmax = np.clip(np.ceil(np.maximum(np.maximum(x0, x1), x2)), 0, size - 1).astype(np.int64)
+        ymin = np.clip(np.floor(np.minimum(np.minimum(y0, y1), y2)), 0, size - 1).astype(np.int64)
+        ymax = np.clip(np.ceil(np.maximum(np.maximum(y0, y1), y2)), 0, size - 1).astype(np.int64)
+        widths = xmax - xmin + 1
+        counts = widths * (ymax - ymin + 1)
+        visible = np.nonzero((np.abs(area) > 1e-12) & (depth[f].min(axis=1) > 1e-6))[0]
+
+        zbuf = np.zeros(size * size)
+        face_at = np.full(size * size, -1, dtype=np.int64)
+        for chunk in _chunks(visible, counts, RASTER_CHUNK_PIXELS):
+            n = counts[chunk]
+            tri = np.repeat(chunk, n)
+            starts = np.repeat(np.cumsum(n) - n, n)
+            offset = np.arange(len(tri)) - starts
+            px = xmin[tri] + offset % widths[tri]
+            py = ymin[tri] + offset // widths[tri]
+            cx = px + 0.5
+            cy = py + 0.5
+            w0 = ((x1[tri] - cx) * (y2[tri] - cy) - (x2[tri] - cx) * (y1[tri] - cy)) / area[tri]
+            w1 = ((x2[tri] - cx) * (y0[tri] - cy) - (x0[tri] - cx) * (y2[tri] - cy)) / area[tri]
+            w2 = 1.0 - w0 - w1
+            inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+            tri, pix = tri[inside], (py * size + px)[inside]
+            z = (w0[inside] * inv_d[tri, 0] + w1[inside] * inv_d[tri, 1] + w2[inside] * inv_d[tri, 2])
+            # Nearest fragment per pixel: sort by pixel, then by 1/depth descending
+            order = np.lexsort((-z, pix))
+            pix, z, tri = pix[order], z[order], tri[order]
+            first = np.ones(len(pix), dtype=bool)
+            first[1:] = pix[1:] != pix[:-1]
+            pix, z, tri = pix[first], z[first], tri[first]
+            closer = z > zbuf[pix]
+            zbuf[pix[closer]] = z[closer]
+            face_at[pix[closer]] = tri[closer]
+
+        covered = face_at >= 0
+        # Two-sided key light just above and right of the camera, so meshes with
+        # flipped normals still look solid and faces at equal angles still differ
+        light_dir = -forward + 0.6 * up + 0.35 * right
+        light_dir /= np.linalg.norm(light_dir)
+        shade = 0.35 + 0.65 * np.abs(self.normals @ light_dir)
+        face_colors = np.clip(shade[:, None] * self.color[None, :], 0, 255).astype(np.uint8)
+        image[covered] = face_colors[face_at[covered]]
+        return image.reshape(size, size, 3)
+
+    def render_png(self, direction, resolution: int = 512) -> bytes:
+        return encode_png(self.render(direction, resolution))
+
+    def render_many_png(self, directions, resolution: int = 512, threads: int = RENDER_VIEW_THREADS):
+        # NumPy releases the GIL in its inner loops, so views render in parallel on threads
+        if threads <= 1 or len(directions) <= 1:
+            return [self.render_png(d, resolution) for d in directions]
+        with ThreadPoolExecutor(max_workers=min(threads, len(directions))) as pool:
+            return list(pool.map(lambda d: self.render_png(d, resolution), directions))
+
+
+def _chunks(indices, counts, budget: int):
+    # Groups triangle indices so each group covers at most `budget` candidate pixels
+    if len(indices) == 0:
+        return
+    cum = np.cumsum(counts[indices])
+    start = 0
+    while start < len(indices):
+        base = cum[start - 1] if start else 0
+        end = int(np.searchsorted(cum, base + budget, side="right"))
+        end = max(end, start + 1)
+        yield indices[start:end]
+        start = end
@@ -0,0 +1,245 @@
+import bisect
+import contextvars
+import importlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# "package.module:function" hooks called as hook(stage, seconds, attrs) after every span,
+# e.g. METRICS_HOOKS="services.metrics:log_span" prints one JSON line per stage
+METRICS_HOOKS = os.getenv("METRICS_HOOKS", "")
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (0, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+MEMORY_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(4, 14))  # 16 MiB to 8 GiB
+
+
+class Histogram:
+    """
+    Prometheus-style histogram, one series per label set.
+    """
+
+    def __init__(self, name: str, help: str, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for label_values, series in items:
+            base = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+            lines.append(f"{self.name}_sum{base} {series[-1]:g}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labels, values)} {value:g}" for values, value in items]
+        return lines
+
+
+class Gauge:
+    # Read from a callback at scrape time, e.g. the render queue depth
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def exposition(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.read():g}"]
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+_metrics = {}
+
+
+def register(metric):
+    # Idempotent, so modules can register their metrics at import time
+    return _metrics.setdefault(metric.name, metric)
+
+
+def exposition() -> str:
+    lines = []
+    for name in sorted(_metrics):
+        lines += _metrics[name].exposition()
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = register(Histogram(
+    "foundry_stage_duration_seconds", "Time spent in each pipeline stage.", labels=("stage",)
+))
+REQUEST_SECONDS = register(Histogram(
+    "foundry_http_request_duration_seconds", "HTTP request latency until the response is fully sent.",
+    labels=("method", "route", "status"),
+))
+LLM_TOKENS = register(Counter("foundry_llm_tokens_total", "Tokens used by LLM calls.", labels=("kind",)))
+OPENSCAD_STDERR_BYTES = register(Histogram(
+    "foundry_openscad_stderr_bytes", "Size of OpenSCAD's stderr per run.", buckets=BYTES_BUCKETS
+))
+OPENSCAD_CPU_SECONDS = register(Histogram(
+    "foundry_openscad_cpu_seconds", "CPU time (user + system) of each OpenSCAD run."
+))
+OPENSCAD_MAX_RSS_BYTES = register(Histogram(
+    "foundry_openscad_max_rss_bytes", "Peak resident memory of each OpenSCAD run.", buckets=MEMORY_BUCKETS
+))
+
+# Spans finished during the current request, for its Server-Timing header
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+_hooks = []
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def log_span(stage: str, seconds: float, attrs: dict):
+    print(json.dumps({"stage": stage, "ms": round(seconds * 1e3, 3), **attrs}))
+
+
+def record_span(stage: str, seconds: float, **attrs):
+    STAGE_SECONDS.observe(seconds, stage)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+    for hook in _hooks:
+        try:
+            hook(stage, seconds, attrs)
+        except Exception as e:
+            # A broken exporter must never fail the request it measures
+            print(f"Metrics hook {hook!r} failed: {e}")
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """
+    Times the block as `stage`. The yielded dict can take extra attributes
+    (e.g. token counts) that are passed to the hooks.
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        record_span(stage, time.perf_counter() - start, **attrs)
+
+
+def server_timing(spans) -> str:
+    # Same-named spans (e.g. one per view) are summed: "view_render;dur=41.2;desc=x14"
+    totals = {}
+    for stage, seconds in spans:
+        total, count = totals.get(stage, (0.0, 0))
+        totals[stage] = (total + seconds, count + 1)
+    return ", ".join(
+        f"{stage};dur={total * 1e3:.1f}" + (f";desc=x{count}" if count > 1 else "")
+        for stage, (total, count) in totals.items()
+    )
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that collects the spans of each request into a
+    Server-Timing header and records the request latency histogram.
+    Streaming responses report the spans finished before their headers; when
+    the server supports response trailers, the spans recorded while the body
+    was sent (e.g. one per rendered view) follow in a Server-Timing trailer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        spans = []
+        token = _request_spans.set(spans)
+        start = time.perf_counter()
+        status = 500
+        can_trail = "http.response.trailers" in scope.get("extensions", {})
+        trailing = False
+        sent = 0  # spans already in the header
+
+        async def send_with_timing(message):
+            nonlocal status, trailing, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                sent = len(spans)
+                timing = server_timing(spans + [("total", time.perf_counter() - start)])
+                headers = list(message.get("headers", [])) + [(b"server-timing", timing.encode("latin-1"))]
+                # Leave responses that send their own trailers alone
+                trailing = can_trail and not message.get("trailers", False)
+                if trailing:
+                    headers.append((b"trailer", b"server-timing"))
+                    message = {**message, "trailers": True}
+                message = {**message, "headers": headers}
+            await send(message)
+            if trailing and message["type"] == "http.response.body" and not message.get("more_body", False):
+                late = spans[sent:]
+                await send({
+                    "type": "http.response.trailers",
+                    "headers": [(b"server-timing", server_timing(late).encode("latin-1"))] if late else [],
+                    "more_trailers": False,
+                })
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+            route = scope.get("route")
+            # Route templates, not raw paths, keep the number of series bounded
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start, scope["method"], getattr(route, "path", "unmatched"), str(status)
+            )
+
+
+def load_hooks():
+    for spec in filter(None, (s.strip() for s in METRICS_HOOKS.split(","))):
+        module_name, _, attr = spec.partition(":")
+        add_hook(getattr(importlib.import_module(module_name), attr))
+
+
+load_hooks()
@@ -0,0 +1,815 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import io
+import os
+import re
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from models.models import PlaygroundPreferences
+from services.metrics import (
+    OPENSCAD_CPU_SECONDS,
+    OPENSCAD_MAX_RSS_BYTES,
+    OPENSCAD_STDERR_BYTES,
+    Gauge,
+    record_span,
+    register,
+    span,
+)
+from services.render_cache import get_render_cache, render_key
+from services.sandbox import exit_reason, get_workspace_pool, run_sandboxed, workspace_path
+from services.scad_deps import DependencyGraph, normalize_path
+
+OPENSCAD_BIN = os.getenv("OPENSCAD_BIN", "openscad")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "8"))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "30"))
+# Export used to check that generated code compiles: "csg" evaluates the CSG tree
+# without CGAL, "ast" only parses; both are far faster than a full STL render
+VALIDATE_FORMAT = os.getenv("VALIDATE_FORMAT", "csg")
+STREAM_CHUNK_BYTES = 1024 * 1024
+# Rendered views waiting for a slow reader; past this the render waits instead of buffering them
+STREAM_QUEUE_ITEMS = 2
+# Streamed zips up to this size are also kept in the render cache's memory tier
+RENDER_CACHE_MEMORY_ITEM_BYTES = int(os.getenv("RENDER_CACHE_MEMORY_ITEM_BYTES", str(8 * 1024 * 1024)))
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+class OpenSCADError(Exception):
+    def __init__(self, stderr: str, usage: dict = None):
+        super().__init__("OpenSCAD failed")
+        self.stderr = stderr
+        self.usage = usage
+
+
+class RenderPool:
+    """
+    Bounded pool of render workers.
+    At most `workers` jobs run at once, at most `queue_size` more may wait;
+    anything beyond that is rejected with RenderQueueFull.
+    """
+
+    def __init__(self, workers: int = RENDER_WORKERS, queue_size: int = RENDER_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._slots = asyncio.Semaphore(workers)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self):
+        """
+        Takes a worker, waiting in the queue if needed. Every successful
+        acquire() must be paired with one release().
+        """
+        if self.waiting >= self.queue_size and self._slots.locked():
+            self.rejected += 1
+            raise RenderQueueFull()
+        self.waiting += 1
+        enqueued = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - enqueued
+        record_span("render_queue", wait)
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.running += 1
+
+    def release(self, error: BaseException = None):
+        # Counts the job's outcome and frees its worker
+        if error is None:
+            self.completed += 1
+        elif isinstance(error, RenderTimeout):
+            self.timeouts += 1
+        elif isinstance(error, asyncio.CancelledError):
+            self.cancelled += 1
+        else:
+            self.failed += 1
+        self.running -= 1
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            self.release(e)
+            raise
+        self.release()
+
+    async def run(self, coro):
+        # Admission happens before the coroutine starts, so a rejected job never runs
+        try:
+            async with self.slot():
+                return await coro
+        finally:
+            coro.close()
+
+    def stats(self):
+        started = self.completed + self.timeouts + self.cancelled + self.failed + self.running
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "avg_wait_seconds": self.total_wait / started if started else 0.0,
+            "max_wait_seconds": self.max_wait,
+        }
+
+
+render_pool = RenderPool()
+register(Gauge("foundry_render_queue_depth", "Renders waiting for a worker.", lambda: render_pool.waiting))
+register(Gauge("foundry_render_running", "Renders holding a worker.", lambda: render_pool.running))
+
+
+async def cancel_on_disconnect(request, coro, poll_interval: float = 0.5):
+    """
+    Runs `coro` as a task and cancels it if the HTTP client goes away,
+    so abandoned renders free their worker (and kill OpenSCAD) early.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    raise asyncio.CancelledError()
+
+
+def write_sources(prefs: PlaygroundPreferences, workdir: str) -> str:
+    # Write all source files to workdir, returns the path of the active file
+    for f in prefs.sources:
+        full_path = workspace_path(workdir, f.path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w", encoding="utf-8") as ff:
+            ff.write(f.content)
+    return workspace_path(workdir, prefs.active_path)
+
+
+async def run_openscad(args, cwd: str, timeout: float = RENDER_TIMEOUT, progress=None) -> str:
+    """
+    Runs the OpenSCAD CLI in the sandbox (memory, CPU time and output size
+    limits) without blocking the event loop.
+    The process is killed on timeout or when the awaiting task is cancelled.
+    `progress`, if given, is called as progress("stderr", {"line": ...}) for each
+    stderr line as OpenSCAD writes it, then progress("usage", usage) at the end.
+    Returns stderr, raises OpenSCADError on a non-zero exit.
+    """
+    on_stderr = None if progress is None else (lambda line: progress("stderr", {"line": line}))
+    with span("openscad") as attrs:
+        try:
+            returncode, stderr, usage = await run_sandboxed([OPENSCAD_BIN, *args], cwd, timeout, on_stderr)
+        except asyncio.TimeoutError:
+            raise RenderTimeout()
+        attrs.update(returncode=returncode, stderr_bytes=len(stderr), **usage)
+    OPENSCAD_STDERR_BYTES.observe(len(stderr))
+    OPENSCAD_CPU_SECONDS.observe(usage["cpu_seconds"])
+    OPENSCAD_MAX_RSS_BYTES.observe(usage["max_rss_bytes"])
+    if progress is not None:
+        progress("usage", usage)
+    stderr = stderr.decode(errors="replace")
+    reason = exit_reason(returncode)
+    if reason is not None:
+        # Stopped by one of the sandbox limits, or crashed
+        stderr += f"{reason}\n"
+    if returncode != 0:
+        raise OpenSCADError(stderr, usage)
+    return stderr
+
+
+async def compile_stl(prefs: PlaygroundPreferences, workdir: str, timeout: float = RENDER_TIMEOUT,
+                      defines=(), progress=None) -> str:
+    # `defines` are extra CLI arguments such as ["-D", "length=20"] overriding top-level variables
+    main_path = write_sources(prefs, workdir)
+    stl_path = os.path.join(workdir, "out.stl")
+    await run_openscad(["-o", stl_path, *defines, main_path], cwd=workdir, timeout=timeout, progress=progress)
+    return stl_path
+
+
+async def check_sources(prefs: PlaygroundPreferences, timeout: float = RENDER_TIMEOUT) -> str:
+    """
+    Checks that a project compiles, through the render pool, without rendering a mesh.
+    Warnings such as unknown modules or variables count as errors.
+    Returns stderr, raises OpenSCADError with the compiler output otherwise.
+    """
+    async with render_pool.slot():
+        async with get_workspace_pool().workspace() as workdir:
+            main_path = write_sources(prefs, workdir)
+            out_path = os.path.join(workdir, f"out.{VALIDATE_FORMAT}")
+            return await run_openscad(["--hardwarnings", "-o", out_path, main_path], cwd=workdir, timeout=timeout)
+
+
+MODULE_NAME_RE = re.compile(r"^[A-Za-z_$][A-Za-z0-9_]*$")
+
+
+def part_key(graph: DependencyGraph, path: str, module: str = None) -> str:
+    # A part only depends on its own dependency closure, not on the rest of the project
+    blob = f"part\0{graph.closure_hash(path)}\0{normalize_path(path)}\0{module or ''}"
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+async def _compile_part_fresh(prefs: PlaygroundPreferences, graph, path, module, key, timeout):
+    cache = get_render_cache()
+    async with get_workspace_pool().workspace() as tmpdirname:
+        part = PlaygroundPreferences(
+            sources=[f for f in prefs.sources if normalize_path(f.path) in graph.closure(path)],
+            active_path=path,
+        )
+        main_path = write_sources(part, tmpdirname)
+        if module:
+            # Instantiate one module of the file with its default parameters
+            main_path = os.path.join(os.path.dirname(main_path), "__part__.scad")
+            with open(main_path, "w", encoding="utf-8") as ff:
+                ff.write(f"use <{os.path.basename(path)}>;\n{module}();\n")
+        stl_path = os.path.join(tmpdirname, "out.stl")
+        await run_openscad(["-o", stl_path, main_path], cwd=tmpdirname, timeout=timeout)
+        await asyncio.to_thread(cache.put_files, key, stl_path, [])
+        # Opened before the workspace is emptied, the new cache entry may already be evicted
+        return open(stl_path, "rb")
+
+
+def _open_cached_stl(cache, key: str):
+    # The STL of a cache entry opened for reading, None on a miss or if it was just evicted
+    files = cache.get_files(key)
+    if files is None:
+        return None
+    try:
+        return open(files[0], "rb")
+    except FileNotFoundError:
+        return None
+
+
+async def compile_part(prefs: PlaygroundPreferences, path: str, module: str = None,
+                       timeout: float = RENDER_TIMEOUT):
+    """
+    Compiles a single file of the project (optionally one of its modules) to STL.
+    The artifact is cached by the hash of the file's dependency closure, so after
+    an edit only parts whose closure contains the edited file are recompiled.
+    Returns (stl_file, cache_status), stl_file being the STL open for reading:
+    it stays readable when the cache evicts the entry, the caller closes it.
+    """
+    if module is not None and not MODULE_NAME_RE.match(module):
+        raise ValueError(f"Invalid module name: {module!r}")
+    graph = DependencyGraph(prefs.sources)
+    path = normalize_path(path)
+    if path not in graph.files:
+        raise ValueError(f"Unknown source file: {path}")
+    cache = get_render_cache()
+    key = part_key(graph, path, module)
+    stl_file = await asyncio.to_thread(_open_cached_stl, cache, key)
+    if stl_file is not None:
+        return stl_file, "hit"
+    stl_file = await render_pool.run(_compile_part_fresh(prefs, graph, path, module, key, timeout))
+    return stl_file, "miss"
+
+
+ANALYSIS_CACHE_ENTRIES = int(os.getenv("ANALYSIS_CACHE_ENTRIES", "256"))
+_analysis_cache = OrderedDict()  # (part key, options) -> report, least recent first
+
+
+def analyze_stl(stl, overhang_angle: float, min_wall: float, resolution: int):
+    # `stl` is a path or an open binary file
+    import trimesh
+    from services.mesh_analysis import analyze_mesh
+    with span("stl_load") as attrs:
+        mesh = trimesh.load_mesh(stl, file_type='stl')
+        attrs["faces"] = len(mesh.faces)
+    with span("analysis", faces=len(mesh.faces), resolution=resolution):
+        return analyze_mesh(mesh, overhang_angle=overhang_angle, min_wall=min_wall, resolution=resolution)
+
+
+async def analyze_project(prefs: PlaygroundPreferences, overhang_angle: float = 45.0, min_wall: float = 0.8,
+                          resolution: int = 64, timeout: float = RENDER_TIMEOUT):
+    """
+    Printability report of the project's active file, see mesh_analysis.analyze_mesh.
+    The STL is the one /rendershots_zip/ cached for the project with its default
+    options or else the one compile_part caches for the active file, so only the
+    first analysis of a project that was not rendered compiles; reports
+    themselves are kept in memory.
+    Returns (report, cache_status) where the status is "hit" for a cached report or STL.
+    """
+    graph = DependencyGraph(prefs.sources)
+    active = normalize_path(prefs.active_path)
+    cache_key = (part_key(graph, active), overhang_angle, min_wall, resolution)
+    report = _analysis_cache.get(cache_key)
+    if report is not None:
+        _analysis_cache.move_to_end(cache_key)
+        return report, "hit"
+    stl_file = None
+    if active in graph.files:
+        shots_key = render_key(prefs, render_options(color=prefs.color))
+        stl_file = await asyncio.to_thread(_open_cached_stl, get_render_cache(), shots_key)
+    if stl_file is not None:
+        status = "hit"
+    else:
+        stl_file, status = await compile_part(prefs, prefs.active_path, timeout=timeout)
+    with stl_file:
+        report = await asyncio.to_thread(analyze_stl, stl_file, overhang_angle, min_wall, resolution)
+    _analysis_cache[cache_key] = report
+    while len(_analysis_cache) > ANALYSIS_CACHE_ENTRIES:
+        _analysis_cache.popitem(last=False)
+    return report, status
+
+
+CUBE_VIEW_DIRS = [
+    [1,0,0], [-1,0,0], [0,1,0], [0,-1,0], [0,0,1], [0,0,-1],
+    [1,1,1], [1,1,-1], [1,-1,1], [1,-1,-1],
+    [-1,1,1], [-1,1,-1], [-1,-1,1], [-1,-1,-1]
+]
+
+
+def get_cube_view_dirs():
+    # NumPy, trimesh and the rasterizer are imported on first render, not at startup
+    import numpy as np
+    return [np.array(v)/np.linalg.norm(v) for v in CUBE_VIEW_DIRS]
+
+
+VIEW_RESOLUTION = 512
+# "software": NumPy rasterizer, works headless; "opengl": trimesh/pyglet, needs a display
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "software")
+
+
+def select_views(views=None):
+    # Sorted, de-duplicated view indices; None means all 14
+    count = len(CUBE_VIEW_DIRS)
+    if views is None:
+        return list(range(count))
+    bad = [v for v in views if not 0 <= v < count]
+    if bad:
+        raise ValueError(f"View indices must be between 0 and {count - 1}, got {bad}")
+    return sorted(set(views))
+
+
+# Faces kept in the mesh the views and preview meshes are made from, 0 keeps the full mesh
+PREVIEW_FACE_BUDGET = int(os.getenv("PREVIEW_FACE_BUDGET", "50000"))
+# "stl" is the full-resolution OpenSCAD output, "glb" and "qmesh" are the reduced preview mesh
+MESH_FORMATS = ("stl", "glb", "qmesh")
+
+
+def select_formats(formats=None):
+    # Sorted, de-duplicated output formats; None means the full STL only
+    formats = sorted(set(formats or ["stl"]))
+    bad = [f for f in formats if f not in MESH_FORMATS]
+    if bad:
+        raise ValueError(f"Mesh formats must be among {', '.join(MESH_FORMATS)}, got {bad}")
+    return formats
+
+
+def render_options(resolution: int = VIEW_RESOLUTION, views=None, color: str = "#f9d72c",
+                   face_budget: int = PREVIEW_FACE_BUDGET, formats=None):
+    # Everything besides the sources that changes the rendered output, part of the cache key
+    if face_budget < 0:
+        raise ValueError(f"Face budget must be 0 (full mesh) or positive, got {face_budget}")
+    return {
+        "resolution": resolution,
+        "views": select_views(views),
+        "color": color.lower(),
+        "backend": RENDER_BACKEND,
+        "face_budget": face_budget,
+        "formats": select_formats(formats),
+    }
+
+
+def load_preview_mesh(stl_path: str, face_budget: int = PREVIEW_FACE_BUDGET):
+    # The STL as loaded by trimesh, reduced to `face_budget` faces for the views and preview meshes
+    import trimesh
+    from services.mesh_lod import make_lod
+    with span("stl_load") as attrs:
+        mesh = trimesh.load_mesh(stl_path, file_type='stl')
+        attrs["faces"] = len(mesh.faces)
+    with span("lod", face_budget=face_budget) as attrs:
+        mesh = make_lod(mesh, face_budget)
+        attrs["faces"] = len(mesh.faces)
+    return mesh
+
+
+def mesh_artifacts(mesh, formats):
+    """
+    [(name, bytes)] of the preview mesh in each requested format besides "stl",
+    which is always the full-resolution OpenSCAD output and is streamed from disk.
+    """
+    from services.mesh_lod import encode_qmesh, export_glb
+    exporters = {"glb": export_glb, "qmesh": encode_qmesh}
+    artifacts = []
+    for fmt in select_formats(formats):
+        if fmt in exporters:
+            with span("mesh_export", format=fmt):
+                artifacts.append((f"model.{fmt}", exporters[fmt](mesh)))
+    return artifacts
+
+
+def render_views(stl_path: str, resolution: int = VIEW_RESOLUTION, views=None, color: str = "#f9d72c",
+                 face_budget: int = PREVIEW_FACE_BUDGET):
+    """
+    Renders cube views of an STL, returns [(name, png_bytes), ...].
+    The mesh is loaded and reduced once and all requested views are drawn from it.
+    """
+    from services.mesh_render import SoftwareRenderer, hex_to_rgb
+    mesh = load_preview_mesh(stl_path, face_budget)
+    indices = select_views(views)
+    directions = get_cube_view_dirs()
+    if RENDER_BACKEND == "opengl":
+        pngs = _render_views_opengl(mesh, [directions[i] for i in indices], resolution)
+    else:
+        renderer = SoftwareRenderer.from_mesh(mesh, color=hex_to_rgb(color))
+        pngs = renderer.render_many_png([directions[i] for i in indices], resolution)
+    return [(f"view_{idx:02d}.png", png) for idx, png in zip(indices, pngs)]
+
+
+def _render_views_opengl(mesh, directions, resolution: int):
+    import numpy as np
+    import trimesh
+    mesh.apply_translation(-mesh.centroid)
+    pngs = []
+    for direction in directions:
+        camera_distance = mesh.extents.max() * 1.5 + 0.01
+        camera_pose = trimesh.scene.cameras.look_at(
+            points=[np.zeros(3)],
+            eye=[direction * camera_distance],
+            up=[0,0,1],
+        )
+        scene = mesh.scene()
+        pngs.append(scene.save_image(
+            resolution=[resolution, resolution],
+            visible=True,
+            camera_transform=camera_pose
+        ))
+    return pngs
+
+
+async def iter_views(stl_path: str, resolution: int = VIEW_RESOLUTION, views=None, color: str = "#f9d72c",
+                     face_budget: int = PREVIEW_FACE_BUDGET, formats=None):
+    """
+    Async generator of (name, bytes), yielding each view as soon as it is
+    rendered. Views render in parallel from the reduced mesh but come out in
+    index order, followed by the preview mesh in the requested formats.
+    """
+    mesh = await asyncio.to_thread(load_preview_mesh, stl_path, face_budget)
+    indices = select_views(views)
+    directions = get_cube_view_dirs()
+    if RENDER_BACKEND == "opengl":
+        # The OpenGL path recenters the mesh it draws, the exported preview keeps OpenSCAD's coordinates
+        drawn = mesh.copy()
+        for idx in indices:
+            pngs = await asyncio.to_thread(_render_views_opengl, drawn, [directions[idx]], resolution)
+            yield f"view_{idx:02d}.png", pngs[0]
+    else:
+        async for view in _iter_software_views(mesh, indices, directions, resolution, color):
+            yield view
+    for artifact in await asyncio.to_thread(mesh_artifacts, mesh, formats):
+        yield artifact
+
+
+async def _iter_software_views(mesh, indices, directions, resolution: int, color: str):
+    from services.mesh_render import RENDER_VIEW_THREADS, SoftwareRenderer, hex_to_rgb
+    renderer = SoftwareRenderer.from_mesh(mesh, color=hex_to_rgb(color))
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=max(1, min(RENDER_VIEW_THREADS, len(indices)))) as pool:
+        # run_in_executor drops contextvars; each view runs in a copy so its span reaches the request
+        futures = [
+            loop.run_in_executor(pool, functools.partial(
+                contextvars.copy_context().run, _render_view, renderer, directions[idx], resolution
+            ))
+            for idx in indices
+        ]
+        try:
+            for idx, future in zip(indices, futures):
+                yield f"view_{idx:02d}.png", await future
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _render_view(renderer, direction, resolution: int) -> bytes:
+    with span("view_render", resolution=resolution):
+        return renderer.render_png(direction, resolution)
+
+
+class _ZipSink:
+    # Write-only file object for zipfile; collects what was written since the last drain()
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class ShotStream:
+    """
+    A rendershots zip that is ready to stream: either a cache hit, or a fresh
+    render whose OpenSCAD compile already succeeded and whose views are still
+    being rendered in the background.
+    chunks() writes the zip as it goes: each view is sent as soon as it is
+    rendered, then the preview meshes, and the full STL (when "stl" is among
+    the formats) is copied from disk in STREAM_CHUNK_BYTES pieces, so memory
+    per request stays bounded whatever the model size.
+    A stream that may not be read to the end is closed with aclose().
+    """
+
+    def __init__(self, key: str, cache_status: str, data: bytes = None, files=None, producer=None,
+                 include_stl: bool = True):
+        self.key = key
+        self.cache_status = cache_status
+        self.data = data
+        self.files = files
+        self.producer = producer
+        self.include_stl = include_stl
+        self.stl_file = None
+        self.views_done = 0
+
+    def _release(self):
+        # Cancels a render still in progress, which frees its worker and workspace, and closes the STL
+        if self.producer is not None:
+            task = self.producer["task"]
+            if not task.done():
+                task.cancel()
+            elif self.stl_file is None and not task.cancelled() and task.exception() is None:
+                # Finished, but nobody read it to the end
+                task.result().close()
+        if self.stl_file is not None:
+            self.stl_file.close()
+
+    async def aclose(self):
+        """
+        Releases what the stream holds if it was not read to the end, e.g. the
+        client left before the response started. Safe to call more than once.
+        """
+        self._release()
+        if self.producer is not None:
+            await asyncio.gather(self.producer["task"], return_exceptions=True)
+            # The render may have finished before the cancellation reached it
+            self._release()
+
+    def __del__(self):
+        try:
+            self._release()
+        except RuntimeError:
+            pass  # the event loop is already closed
+
+    async def chunks(self):
+        if self.data is not None:
+            yield self.data
+            return
+        cache = get_render_cache()
+        sink = _ZipSink()
+        kept = []  # small zips are also promoted to the memory tier
+        kept_size = 0
+        zip_seconds = 0.0  # time spent zipping, recorded as one span at the end
+        try:
+            zipf = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED)
+            async for name, data in self._views():
+                # PNGs and qmesh are already compressed, deflating them again only burns CPU
+                start = time.perf_counter()
+                compress_type = zipfile.ZIP_DEFLATED if name.endswith(".glb") else zipfile.ZIP_STORED
+                zipf.writestr(name, data, compress_type=compress_type)
+                zip_seconds += time.perf_counter() - start
+                if name.endswith(".png"):
+                    self.views_done += 1
+                chunk = sink.drain()
+                kept_size += len(chunk)
+                if kept_size <= RENDER_CACHE_MEMORY_ITEM_BYTES:
+                    kept.append(chunk)
+                yield chunk
+            stl_file = self.stl_file
+            if stl_file is None and self.include_stl:
+                stl_file = await asyncio.to_thread(open, self.files[0], "rb")
+            try:
+                if self.include_stl:
+                    with zipf.open("model.stl", 'w') as dest:
+                        while True:
+                            block = await asyncio.to_thread(stl_file.read, STREAM_CHUNK_BYTES)
+                            if not block:
+                                break
+                            start = time.perf_counter()
+                            dest.write(block)
+                            zip_seconds += time.perf_counter() - start
+                            chunk = sink.drain()
+                            if chunk:
+                                kept_size += len(chunk)
+                                if kept_size <= RENDER_CACHE_MEMORY_ITEM_BYTES:
+                                    kept.append(chunk)
+                                yield chunk
+            finally:
+                if stl_file is not None:
+                    stl_file.close()
+            zipf.close()
+            chunk = sink.drain()
+            kept_size += len(chunk)
+            record_span("zip", zip_seconds, bytes=kept_size)
+            yield chunk
+            if kept_size <= RENDER_CACHE_MEMORY_ITEM_BYTES:
+                cache.put_zip(self.key, b"".join(kept) + chunk)
+        finally:
+            # Stopped before the render finished: the client went away, free the worker
+            self._release()
+
+    async def items(self):
+        """
+        Async generator of (name, bytes) for each view and preview mesh as it
+        becomes available, for clients that show views one by one instead of
+        reading the zip. The full STL is not part of it.
+        """
+        if self.data is not None:
+            with zipfile.ZipFile(io.BytesIO(self.data)) as zipf:
+                for info in zipf.infolist():
+                    if info.filename != "model.stl":
+                        yield info.filename, zipf.read(info)
+            return
+        try:
+            async for name, data in self._views():
+                yield name, data
+        finally:
+            self._release()
+
+    async def _views(self):
+        if self.files is not None:
+            for name, path in self.files[1]:
+                yield name, await asyncio.to_thread(_read_file, path)
+            return
+        queue, task = self.producer["queue"], self.producer["task"]
+        while True:
+            if not queue.empty():
+                yield queue.get_nowait()
+                continue
+            if task.done():
+                # Every view is read; the render's outcome is the open STL or its error
+                if task.cancelled():
+                    raise RenderCancelled()
+                self.stl_file = task.result()
+                return
+            get = asyncio.ensure_future(queue.get())
+            try:
+                await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                # A get cancelled before it ran leaves its item in the queue
+                get.cancel()
+            if get.done() and not get.cancelled():
+                yield get.result()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _produce_views(prefs, key, options, workdir, stl_path, queue, done):
+    """
+    Background half of a fresh render. Each view is written to the cache entry
+    and put in the bounded queue as soon as it is rendered, so a slow reader
+    holds up the render instead of every view piling up in memory.
+    Returns the STL open for reading; it outlives the workspace and any cache eviction.
+    """
+    cache = get_render_cache()
+    entry = None
+    try:
+        entry = await asyncio.to_thread(cache.open_entry, key)
+        async for name, data in iter_views(
+            stl_path, resolution=options["resolution"], views=options["views"], color=options["color"],
+            face_budget=options["face_budget"], formats=options["formats"],
+        ):
+            await asyncio.to_thread(cache.write_entry_file, entry, name, data)
+            await queue.put((name, data))
+        await asyncio.to_thread(cache.commit_entry, key, entry, stl_path)
+        entry = None
+        stl_file = await asyncio.to_thread(open, stl_path, "rb")
+    except BaseException as e:
+        render_pool.release(e)
+        if entry is not None:
+            cache.discard_entry(entry)
+        raise
+    else:
+        render_pool.release()
+        return stl_file
+    finally:
+        _in_flight.pop(key, None)
+        done.set()
+        await asyncio.to_thread(get_workspace_pool().release, workdir)
+
+
+_in_flight = {}  # key -> asyncio.Event set once the running render has finished
+
+
+async def open_shots(prefs: PlaygroundPreferences, timeout: float = RENDER_TIMEOUT,
+                     resolution: int = VIEW_RESOLUTION, views=None,
+                     face_budget: int = PREVIEW_FACE_BUDGET, formats=None, progress=None) -> ShotStream:
+    """
+    Resolves a rendershots request up to the point where streaming can start.
+    Cache hits never take a render worker. A miss takes one, compiles with
+    OpenSCAD (so compile errors and timeouts surface before any byte is sent),
+    then keeps the worker while the views render in the background.
+    Identical concurrent misses wait for the first render and stream its cache entry.
+    Views are rendered from a copy reduced to `face_budget` faces, which is also
+    exported in the requested preview `formats`; "stl" adds the full-resolution mesh.
+    `progress`, if given, is called as progress(event, data) when a miss is
+    "queued" for a worker, "compile_started", for each OpenSCAD "stderr" line,
+    with the compile's resource "usage" and at "compile_finished".
+    """
+    progress = progress or (lambda event, data: None)
+    cache = get_render_cache()
+    options = render_options(resolution, views, prefs.color, face_budget, formats)
+    include_stl = "stl" in options["formats"]
+    key = render_key(prefs, options)
+    while True:
+        data = cache.get_zip(key)
+        if data is not None:
+            return ShotStream(key, "hit", data=data)
+        files = await asyncio.to_thread(cache.get_files, key)
+        if files is not None:
+            return ShotStream(key, "hit", files=files, include_stl=include_stl)
+        running = _in_flight.get(key)
+        if running is None:
+            break
+        await running.wait()
+
+    done = asyncio.Event()
+    _in_flight[key] = done
+    progress("queued", {"waiting": render_pool.waiting, "running": render_pool.running})
+    try:
+        await render_pool.acquire()
+    except BaseException:
+        _in_flight.pop(key, None)
+        done.set()
+        raise
+    workdir = None
+    try:
+        # Inside the try: a full tmpfs must not keep the worker and leave waiters on `done` forever
+        workdir = get_workspace_pool().acquire()
+        progress("compile_started", {})
+        start = time.perf_counter()
+        stl_path = await compile_stl(prefs, workdir, timeout=timeout, progress=progress)
+        progress("compile_finished", {"seconds": time.perf_counter() - start})
+    except BaseException as e:
+        render_pool.release(e)
+        _in_flight.pop(key, None)
+        done.set()
+        if workdir is not None:
+            get_workspace_pool().release(workdir)
+        raise
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_ITEMS)
+    task = asyncio.ensure_future(_produce_views(prefs, key, options, workdir, stl_path, queue, done))
+    return ShotStream(key, "miss", producer={"task": task, "queue": queue}, include_stl=include_stl)
+
+
+async def render_shots(prefs: PlaygroundPreferences, timeout: float = RENDER_TIMEOUT,
+                       resolution: int = VIEW_RESOLUTION, views=None,
+                       face_budget: int = PREVIEW_FACE_BUDGET, formats=None):
+    """
+    Whole-zip convenience wrapper around open_shots, returns (zip_bytes, cache_status).
+    """
+    stream = await open_shots(
+        prefs, timeout=timeout, resolution=resolution, views=views, face_budget=face_budget, formats=formats
+    )
+    try:
+        data = b"".join([chunk async for chunk in stream.chunks()])
+    finally:
+        await stream.aclose()
+    return data, stream.cache_status
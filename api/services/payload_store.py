@@ -0,0 +1,122 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+PAYLOAD_STORE_PATH = os.getenv("PAYLOAD_STORE_PATH", "payloads.sqlite3")
+PAYLOAD_TTL = float(os.getenv("PAYLOAD_TTL", str(30 * 24 * 3600)))
+PAYLOAD_MAX_BYTES = int(os.getenv("PAYLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+# Prefix of the short links handed out, e.g. "https://foundry.example.com"; relative by default
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+PLAYGROUND_URL = "https://ochafik.com/openscad2/#"
+# 12 url-safe base64 chars = 72 bits of sha256, plenty to never collide
+PAYLOAD_ID_CHARS = 12
+
+
+def payload_bytes(payload: dict) -> bytes:
+    # Same compact JSON the playground URL encodes
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def payload_id(data: bytes) -> str:
+    return base64.urlsafe_b64encode(hashlib.sha256(data).digest()).decode('ascii')[:PAYLOAD_ID_CHARS]
+
+
+def short_url(pid: str) -> str:
+    return f"{PUBLIC_BASE_URL}/p/{pid}"
+
+
+class PayloadStore:
+    """
+    Content-addressed store of playground payloads, so responses can carry a
+    short /p/{id} link instead of the whole project in the URL.
+    Payloads are keyed by the hash of their JSON, so identical projects are
+    stored once, and kept gzipped exactly as the playground URL encodes them.
+    Entries unused for `ttl` seconds are dropped, then the least recently
+    used ones while the store is over `max_bytes`.
+    """
+
+    def __init__(self, path: str = PAYLOAD_STORE_PATH, ttl: float = PAYLOAD_TTL, max_bytes: int = PAYLOAD_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS payloads ("
+            " id TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS payloads_accessed ON payloads (accessed_at)")
+        self._db.commit()
+
+    def put(self, payload: dict) -> str:
+        data = payload_bytes(payload)
+        pid = payload_id(data)
+        now = time.time()
+        with self._lock:
+            updated = self._db.execute("UPDATE payloads SET accessed_at = ? WHERE id = ?", (now, pid)).rowcount
+            if not updated:
+                # mtime=0 keeps the gzip bytes identical for identical payloads
+                compressed = gzip.compress(data, mtime=0)
+                self._db.execute(
+                    "INSERT INTO payloads VALUES (?, ?, ?, ?, ?)", (pid, compressed, len(compressed), now, now)
+                )
+                self._evict(now)
+            self._db.commit()
+        return pid
+
+    def get(self, pid: str):
+        """
+        Returns the gzipped payload JSON, or None if it is unknown or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT data, accessed_at FROM payloads WHERE id = ?", (pid,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM payloads WHERE id = ?", (pid,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE payloads SET accessed_at = ? WHERE id = ?", (now, pid))
+            self._db.commit()
+            return row[0]
+
+    def get_payload(self, pid: str):
+        data = self.get(pid)
+        return None if data is None else json.loads(gzip.decompress(data))
+
+    def playground_url(self, pid: str):
+        data = self.get(pid)
+        return None if data is None else PLAYGROUND_URL + base64.b64encode(data).decode('ascii')
+
+    def _evict(self, now: float):
+        self._db.execute("DELETE FROM payloads WHERE accessed_at < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM payloads").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for pid, size in self._db.execute("SELECT id, size FROM payloads ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM payloads WHERE id = ?", (pid,))
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM payloads").fetchone()
+        return {"payloads": count, "bytes": size, "max_bytes": self.max_bytes}
+
+
+_payload_store = None
+
+
+def get_payload_store() -> PayloadStore:
+    global _payload_store
+    if _payload_store is None:
+        _payload_store = PayloadStore()
+    return _payload_store
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+from models.models import PlaygroundPreferences
+from services.scad_deps import DependencyGraph, normalize_path
+
+RENDER_CACHE_DIR = os.getenv(
+    "RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "foundry-render-cache")
+)
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RENDER_CACHE_MEMORY_BYTES = int(os.getenv("RENDER_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+
+STL_NAME = "model.stl"
+
+
+def render_key(prefs: PlaygroundPreferences, options: dict) -> str:
+    """
+    Stable content hash of everything that affects the rendered output:
+    the dependency closure of the active file, the active file and the render
+    options. Files the active file never includes or uses don't change the key.
+    """
+    active_path = normalize_path(prefs.active_path)
+    blob = json.dumps(
+        {
+            "closure": DependencyGraph(prefs.sources).closure_hash(active_path),
+            "active_path": active_path,
+            "options": options,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    Two-tier cache of render results.
+    The disk tier keeps the STL and view PNGs of each key in its own folder,
+    evicting least recently used folders past `max_bytes`.
+    The memory tier keeps the finished zip of hot keys, bounded by `memory_bytes`.
+    """
+
+    def __init__(self, root: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_BYTES,
+                 memory_bytes: int = RENDER_CACHE_MEMORY_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self._lock = threading.Lock()
+        self._disk = OrderedDict()  # key -> size in bytes, least recent first
+        self._disk_total = 0
+        self._memory = OrderedDict()  # key -> zip bytes, least recent first
+        self._memory_total = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        # Rebuild the LRU index from what previous processes left on disk
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                continue
+            if ".tmp-" in name:
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            entries.append((os.path.getmtime(path), name, _dir_size(path)))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_total += size
+        self._evict_disk()
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get_zip(self, key: str):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self.hits_memory += 1
+                return data
+        return None
+
+    def get_files(self, key: str):
+        """
+        Returns (stl_path, [(name, path), ...]) for a disk hit, else None.
+        The views come first in index order, then the preview meshes.
+        """
+        with self._lock:
+            if key not in self._disk:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+            self.hits_disk += 1
+        path = self.entry_dir(key)
+        try:
+            os.utime(path)
+            names = sorted((n for n in os.listdir(path) if n != STL_NAME), key=lambda n: (not n.endswith(".png"), n))
+        except FileNotFoundError:
+            return None
+        return os.path.join(path, STL_NAME), [(n, os.path.join(path, n)) for n in names]
+
+    def put_files(self, key: str, stl_path: str, views):
+        tmp = self.open_entry(key)
+        for name, data in views:
+            self.write_entry_file(tmp, name, data)
+        self.commit_entry(key, tmp, stl_path)
+
+    def open_entry(self, key: str) -> str:
+        # Entries are written into a private folder, then renamed, so readers never see half an entry
+        tmp = os.path.join(self.root, f"{key}.tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        return tmp
+
+    @staticmethod
+    def write_entry_file(tmp: str, name: str, data: bytes):
+        # One view or preview mesh of an entry being written, as soon as it is rendered
+        with open(os.path.join(tmp, name), "wb") as f:
+            f.write(data)
+
+    @staticmethod
+    def discard_entry(tmp: str):
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def commit_entry(self, key: str, tmp: str, stl_path: str):
+        # Adds the STL and publishes the entry opened with open_entry()
+        shutil.copyfile(stl_path, os.path.join(tmp, STL_NAME))
+        size = _dir_size(tmp)
+        with self._lock:
+            final = self.entry_dir(key)
+            if key in self._disk:
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+            os.rename(tmp, final)
+            self._disk[key] = size
+            self._disk_total += size
+            self._evict_disk()
+
+    def put_zip(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = data
+            self._memory_total += len(data)
+            while self._memory_total > self.memory_bytes:
+                _, old = self._memory.popitem(last=False)
+                self._memory_total -= len(old)
+
+    def _evict_disk(self):
+        while self._disk_total > self.max_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_total -= size
+            self.evictions += 1
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_total,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_total,
+            }
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+
+_render_cache = None
+
+
+def get_render_cache() -> RenderCache:
+    # Created on first use so importing the module doesn't touch the filesystem
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = RenderCache()
+    return _render_cache
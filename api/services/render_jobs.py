@@ -0,0 +1,274 @@
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+
+from models.models import PlaygroundPreferences
+from services.openscad_render import (
+    open_shots,
+    OpenSCADError,
+    RenderQueueFull,
+    RenderTimeout,
+    select_views,
+    PREVIEW_FACE_BUDGET,
+    VIEW_RESOLUTION,
+)
+
+RENDER_JOBS_DIR = os.getenv(
+    "RENDER_JOBS_DIR", os.path.join(tempfile.gettempdir(), "foundry-render-jobs")
+)
+RENDER_JOB_WORKERS = int(os.getenv("RENDER_JOB_WORKERS", "1"))
+RENDER_JOB_TIMEOUT = float(os.getenv("RENDER_JOB_TIMEOUT", "600"))
+RENDER_JOB_RETENTION = float(os.getenv("RENDER_JOB_RETENTION", str(24 * 3600)))
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobManager:
+    """
+    Persistent render job queue.
+    Jobs live in a SQLite table next to their artifacts, so queued jobs and
+    finished results survive a restart; jobs that were running when the
+    process died are queued again. `workers` jobs run at once, each through
+    the shared render pool, and finished jobs are deleted after `retention` seconds.
+    """
+
+    def __init__(self, root: str = RENDER_JOBS_DIR, workers: int = RENDER_JOB_WORKERS,
+                 timeout: float = RENDER_JOB_TIMEOUT, retention: float = RENDER_JOB_RETENTION):
+        self.root = root
+        self.workers = workers
+        self.timeout = timeout
+        self.retention = retention
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "jobs.sqlite3"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT, progress REAL NOT NULL,"
+            " prefs TEXT NOT NULL, options TEXT NOT NULL, error TEXT, stderr TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._db.commit()
+        self._wakeup = None
+        self._tasks = []
+        self._running = {}  # job id -> asyncio.Task
+
+    def _execute(self, sql: str, args=()):
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+            self._db.commit()
+            return rows
+
+    def _update(self, job_id: str, **fields) -> bool:
+        # Only changes a running job, so one that finishes after cancel() stays cancelled
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            changed = self._db.execute(
+                f"UPDATE jobs SET {cols} WHERE id = ? AND status = 'running'", (*fields.values(), job_id)
+            ).rowcount
+            self._db.commit()
+        return changed > 0
+
+    def zip_path(self, job_id: str) -> str:
+        return os.path.join(self.root, f"{job_id}.zip")
+
+    async def start(self):
+        # Anything left "running" by a previous process starts over
+        self._execute("UPDATE jobs SET status = 'queued', stage = NULL, progress = 0 WHERE status = 'running'")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._janitor()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Interrupted jobs are requeued by the next start()
+
+    def submit(self, prefs: PlaygroundPreferences, resolution: int = VIEW_RESOLUTION, views=None,
+               face_budget: int = PREVIEW_FACE_BUDGET, formats=None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        options = {"resolution": resolution, "views": views, "face_budget": face_budget, "formats": formats}
+        self._execute(
+            "INSERT INTO jobs (id, status, stage, progress, prefs, options, created_at, updated_at)"
+            " VALUES (?, 'queued', NULL, 0, ?, ?, ?, ?)",
+            (job_id, prefs.model_dump_json(), json.dumps(options), now, now),
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str):
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["options"] = json.loads(job["options"])
+        del job["prefs"]
+        return job
+
+    def artifacts(self, job_id: str):
+        try:
+            with zipfile.ZipFile(self.zip_path(job_id)) as zf:
+                return zf.namelist()
+        except FileNotFoundError:
+            return []
+
+    def iter_artifact(self, job_id: str, name: str, chunk_size: int = 1024 * 1024):
+        # Streams one member of the job's zip, views are stored uncompressed so this is a plain copy
+        with zipfile.ZipFile(self.zip_path(job_id)) as zf:
+            with zf.open(name) as f:
+                while True:
+                    block = f.read(chunk_size)
+                    if not block:
+                        break
+                    yield block
+
+    def cancel(self, job_id: str):
+        """
+        Returns the job after cancelling it, or None if it doesn't exist.
+        Finished jobs are left as they are.
+        """
+        job = self.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        self._execute(
+            "UPDATE jobs SET status = 'cancelled', stage = NULL, updated_at = ?"
+            " WHERE id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id),
+        )
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        return self.get(job_id)
+
+    def _claim(self):
+        # Atomically moves the oldest queued job to running
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, prefs, options FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', stage = 'queued', updated_at = ? WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+            self._db.commit()
+            return row["id"], PlaygroundPreferences.model_validate_json(row["prefs"]), json.loads(row["options"])
+
+    async def _worker(self):
+        while True:
+            claimed = self._claim()
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id = claimed[0]
+            task = asyncio.ensure_future(self._run(*claimed))
+            self._running[job_id] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # The worker itself is stopping, interrupt the job too
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise
+            finally:
+                self._running.pop(job_id, None)
+
+    async def _run(self, job_id: str, prefs: PlaygroundPreferences, options: dict):
+        path = self.zip_path(job_id)
+        tmp = path + ".part"
+        # SQLite commits are made off the event loop
+        update = functools.partial(asyncio.to_thread, self._update, job_id)
+        try:
+            while True:
+                await update(stage="compiling")
+                try:
+                    stream = await open_shots(
+                        prefs, timeout=self.timeout, resolution=options["resolution"], views=options["views"],
+                        # Jobs queued before these options existed render with the defaults
+                        face_budget=options.get("face_budget", PREVIEW_FACE_BUDGET), formats=options.get("formats"),
+                    )
+                    break
+                except RenderQueueFull:
+                    # Jobs wait for a worker instead of being rejected like HTTP requests
+                    await update(stage="waiting for a render worker")
+                    await asyncio.sleep(1)
+            try:
+                total = len(select_views(options["views"]))
+                progress = 0.2
+                await update(stage="rendering", progress=progress)
+                with open(tmp, "wb") as f:
+                    async for chunk in stream.chunks():
+                        await asyncio.to_thread(f.write, chunk)
+                        # Written once per finished view, not for every chunk of the zip
+                        done = 0.2 + 0.8 * min(stream.views_done, total) / (total + 1)
+                        if done != progress:
+                            progress = done
+                            await update(progress=progress)
+            finally:
+                await stream.aclose()
+            os.replace(tmp, path)
+            if not await update(status="done", stage=None, progress=1.0):
+                # Cancelled while it finished: it stays cancelled, without artifacts
+                os.remove(path)
+        except asyncio.CancelledError:
+            if self.get(job_id)["status"] == "cancelled":
+                return
+            raise
+        except OpenSCADError as e:
+            await update(status="failed", stage=None, error="OpenSCAD failed", stderr=e.stderr)
+        except RenderTimeout:
+            await update(status="failed", stage=None, error=f"OpenSCAD did not finish within {self.timeout:g}s")
+        except Exception as e:
+            await update(status="failed", stage=None, error=str(e))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    async def _janitor(self):
+        while True:
+            await asyncio.to_thread(self.purge)
+            await asyncio.sleep(60)
+
+    def purge(self, now: float = None):
+        # Deletes finished jobs and their artifacts once they are older than the retention
+        cutoff = (now or time.time()) - self.retention
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated_at < ?", (cutoff,)
+        )
+        for row in rows:
+            try:
+                os.remove(self.zip_path(row["id"]))
+            except FileNotFoundError:
+                pass
+            self._execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+        return len(rows)
+
+
+_job_manager = None
+
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager()
+    return _job_manager
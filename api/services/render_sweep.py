@@ -0,0 +1,175 @@
+import asyncio
+import base64
+import itertools
+import json
+import os
+
+from models.models import PlaygroundPreferences
+from services.openscad_render import (
+    MODULE_NAME_RE,
+    PREVIEW_FACE_BUDGET,
+    RENDER_BACKEND,
+    RENDER_TIMEOUT,
+    OpenSCADError,
+    RenderQueueFull,
+    RenderTimeout,
+    compile_stl,
+    get_cube_view_dirs,
+    render_pool,
+)
+from services.metrics import span
+from services.render_cache import get_render_cache, render_key
+from services.sandbox import get_workspace_pool
+
+SWEEP_MAX_VARIANTS = int(os.getenv("SWEEP_MAX_VARIANTS", "256"))
+# Isometric view used as the thumbnail of each variant
+THUMBNAIL_VIEW = 6
+THUMBNAIL_RESOLUTION = 256
+
+
+def expand_sweep(grid=None, variants=None):
+    """
+    Configurations of a sweep: every explicit variant combined with every
+    point of the grid, in order. No grid and no variants is one empty configuration.
+    """
+    grid = grid or {}
+    names = sorted(grid)
+    points = [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+    configs = [{**variant, **point} for variant in (variants or [{}]) for point in points]
+    if len(configs) > SWEEP_MAX_VARIANTS:
+        raise ValueError(f"Sweep has {len(configs)} variants, the limit is {SWEEP_MAX_VARIANTS}")
+    for name in {n for config in configs for n in config}:
+        if not MODULE_NAME_RE.match(name):
+            raise ValueError(f"Invalid parameter name: {name!r}")
+    return configs
+
+
+def define_value(value) -> str:
+    # OpenSCAD literal for a JSON value; strings use the same escapes as JSON
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        # 20.0 and 20 are the same configuration
+        return repr(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return json.dumps(value)
+
+
+def define_args(params: dict):
+    # ["-D", "name=value", ...] sorted by name, so equal configurations give equal keys
+    return [arg for name in sorted(params) for arg in ("-D", f"{name}={define_value(params[name])}")]
+
+
+def variant_key(prefs: PlaygroundPreferences, params: dict, resolution: int) -> str:
+    options = {
+        "defines": define_args(params),
+        "thumbnail": resolution,
+        "color": prefs.color.lower(),
+        "backend": RENDER_BACKEND,
+    }
+    return render_key(prefs, {"sweep": options})
+
+
+def variant_artifacts(stl_path: str, resolution: int, color: str):
+    # Geometry stats of the full mesh and a thumbnail rendered from its preview LOD
+    import trimesh
+    from services.mesh_analysis import geometry_stats
+    from services.mesh_lod import make_lod
+    from services.mesh_render import SoftwareRenderer, hex_to_rgb
+    with span("stl_load"):
+        mesh = trimesh.load_mesh(stl_path, file_type='stl')
+    stats = geometry_stats(mesh)
+    with span("lod", face_budget=PREVIEW_FACE_BUDGET):
+        mesh = make_lod(mesh, PREVIEW_FACE_BUDGET)
+    with span("view_render", resolution=resolution):
+        renderer = SoftwareRenderer.from_mesh(mesh, color=hex_to_rgb(color))
+        png = renderer.render_png(get_cube_view_dirs()[THUMBNAIL_VIEW], resolution)
+    return [("thumbnail.png", png), ("stats.json", json.dumps(stats).encode("utf-8"))]
+
+
+async def render_variant(prefs: PlaygroundPreferences, params: dict, resolution: int = THUMBNAIL_RESOLUTION,
+                         timeout: float = RENDER_TIMEOUT):
+    """
+    Compiles one configuration with its -D defines, through the render pool.
+    Returns (files, cache_status) with files as RenderCache.get_files returns them.
+    """
+    cache = get_render_cache()
+    key = variant_key(prefs, params, resolution)
+    files = await asyncio.to_thread(cache.get_files, key)
+    if files is not None:
+        return files, "hit"
+    while True:
+        try:
+            await render_pool.run(_render_variant_fresh(prefs, params, key, resolution, timeout))
+            break
+        except RenderQueueFull:
+            # A sweep waits for a worker instead of failing its remaining variants
+            await asyncio.sleep(1)
+    return await asyncio.to_thread(cache.get_files, key), "miss"
+
+
+async def _render_variant_fresh(prefs, params, key, resolution, timeout):
+    async with get_workspace_pool().workspace() as workdir:
+        stl_path = await compile_stl(prefs, workdir, timeout=timeout, defines=define_args(params))
+        artifacts = await asyncio.to_thread(variant_artifacts, stl_path, resolution, prefs.color)
+        await asyncio.to_thread(get_render_cache().put_files, key, stl_path, artifacts)
+
+
+def variant_result(files, cache_status: str, include_stl: bool):
+    stl_path, others = files
+    paths = dict(others)
+    with open(paths["stats.json"], encoding="utf-8") as f:
+        result = {"status": "done", "cache": cache_status, "stats": json.load(f)}
+    with open(paths["thumbnail.png"], "rb") as f:
+        result["thumbnail"] = base64.b64encode(f.read()).decode("ascii")
+    if include_stl:
+        with open(stl_path, "rb") as f:
+            result["stl"] = base64.b64encode(f.read()).decode("ascii")
+    return result
+
+
+async def run_sweep(prefs: PlaygroundPreferences, configs, resolution: int = THUMBNAIL_RESOLUTION,
+                    include_stl: bool = True, timeout: float = RENDER_TIMEOUT):
+    """
+    Async generator of one result dict per configuration, in completion order.
+    Identical configurations are rendered once; the later ones point at the
+    first with "duplicate_of". At most one variant per render worker is in
+    flight, so a sweep never fills the queue that single renders share.
+    """
+    groups = {}  # key -> indices of the configurations rendering to it
+    for index, params in enumerate(configs):
+        groups.setdefault(variant_key(prefs, params, resolution), []).append(index)
+    limit = asyncio.Semaphore(render_pool.workers)
+
+    async def one(key, index):
+        async with limit:
+            try:
+                files, status = await render_variant(prefs, configs[index], resolution, timeout)
+                if files is None:
+                    return key, {"status": "error", "error": "Evicted from the render cache before it was read"}
+                return key, await asyncio.to_thread(variant_result, files, status, include_stl)
+            except OpenSCADError as e:
+                return key, {"status": "error", "error": "OpenSCAD failed", "stderr": e.stderr}
+            except RenderTimeout:
+                return key, {"status": "error", "error": f"OpenSCAD did not finish within {timeout:g}s"}
+            except ValueError as e:
+                return key, {"status": "error", "error": str(e)}
+            except Exception as e:
+                # One variant failing must not cut off the stream of the others
+                print(f"Sweep variant {index} failed: {e!r}")
+                return key, {"status": "error", "error": f"Render failed: {e}"}
+
+    tasks = [asyncio.ensure_future(one(key, indices[0])) for key, indices in groups.items()]
+    try:
+        for future in asyncio.as_completed(tasks):
+            key, result = await future
+            first, *duplicates = groups[key]
+            yield {"index": first, "params": configs[first], **result}
+            for index in duplicates:
+                yield {"index": index, "params": configs[index], "duplicate_of": first, **result}
+    finally:
+        # The client went away mid-sweep: stop the variants still queued or compiling
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory | sqlite
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+# Jaccard similarity of character trigrams needed for a near-duplicate hit, 0 disables the tier
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+# Hits whose LRU timestamp is written to SQLite together, rather than a commit per hit
+TOUCH_BATCH = 64
+
+# Numbers keep their minus sign (unless it joins two words, as in "m-8") and their
+# decimal point or fraction bar; words are any script, "立方体" as much as "cube"
+_NUMBER = r"-?\d+(?:[./]\d+)*"
+_WORD_RE = re.compile(rf"(?<!\w){_NUMBER}|\w+")
+_NUMBER_RE = re.compile(_NUMBER)
+
+
+def normalize_text(text: str) -> str:
+    # "  Make a CUBE! " and "make a cube" are the same request, "offset -5" and "offset 5" are not
+    return " ".join(_WORD_RE.findall(text.casefold()))
+
+
+def trigrams(text: str):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def jaccard(a, b) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MemoryBackend:
+    """
+    In-process LRU store of key -> (text, value, created_at).
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, text: str, value: str, created_at: float):
+        # Returns the keys evicted to make room
+        with self._lock:
+            self._entries[key] = (text, value, created_at)
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                old, _ = self._entries.popitem(last=False)
+                evicted.append(old)
+            return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def texts(self):
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._entries.items()]
+
+
+class SQLiteBackend:
+    """
+    Same interface as MemoryBackend, persisted in a SQLite file so the cache
+    survives restarts and can be shared by workers on one box.
+    Lookups only read: hits are noted in memory and their access times written
+    in batches of TOUCH_BATCH, or with the next set() before it evicts.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, text TEXT NOT NULL, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._db.commit()
+        self._touched = {}  # key -> access time not written yet
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._touched[key] = time.time()
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._write_touched()
+                    self._db.commit()
+            return row
+
+    def _write_touched(self):
+        # Other workers evict by the times written so far, so their LRU order lags by at most a batch
+        self._db.executemany(
+            "UPDATE responses SET accessed_at = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()]
+        )
+        self._touched.clear()
+
+    def set(self, key: str, text: str, value: str, created_at: float):
+        with self._lock:
+            self._touched.pop(key, None)
+            self._write_touched()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, text, value, created_at, time.time()),
+            )
+            evicted = [row[0] for row in self._db.execute(
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?",
+                (self.max_entries,),
+            )]
+            self._db.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in evicted])
+            self._db.commit()
+            return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._touched.pop(key, None)
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def texts(self):
+        with self._lock:
+            return list(self._db.execute("SELECT key, text FROM responses"))
+
+
+class ResponseCache:
+    """
+    Caches chat responses by request text.
+    Tier 1 is an exact match on the normalized text. Tier 2, when `similarity`
+    is set, returns the closest cached request whose trigram Jaccard similarity
+    reaches it and whose numbers are identical ("gear with 20 teeth" never
+    matches "gear with 21 teeth").
+    Values are JSON strings; entries older than `ttl` seconds are dropped.
+    Request handlers use aget()/aset(), which run the backend in a thread.
+    """
+
+    def __init__(self, backend, ttl: float = RESPONSE_CACHE_TTL, similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.backend = backend
+        self.ttl = ttl
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = {}  # key -> (trigrams, numbers), only used by the similarity tier
+        if similarity > 0:
+            for key, text in backend.texts():
+                self._index[key] = self._features(text)
+
+    @staticmethod
+    def key_for(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _features(text: str):
+        return trigrams(text), tuple(_NUMBER_RE.findall(text))
+
+    def _lookup(self, key: str):
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        _, value, created_at = entry
+        if time.time() - created_at > self.ttl:
+            self.backend.delete(key)
+            with self._lock:
+                self._index.pop(key, None)
+            return None
+        return value
+
+    def get(self, request_text: str):
+        """
+        Returns (value, tier) with tier "exact" or "similar", or (None, None).
+        """
+        text = normalize_text(request_text)
+        value = self._lookup(self.key_for(text))
+        if value is not None:
+            with self._lock:
+                self.exact_hits += 1
+            return json.loads(value), "exact"
+        if self.similarity > 0:
+            grams, numbers = self._features(text)
+            with self._lock:
+                candidates = sorted(
+                    ((jaccard(grams, g), key) for key, (g, n) in self._index.items() if n == numbers),
+                    reverse=True,
+                )
+            for score, key in candidates:
+                if score < self.similarity:
+                    break
+                value = self._lookup(key)
+                if value is not None:
+                    with self._lock:
+                        self.similar_hits += 1
+                    return json.loads(value), "similar"
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    async def aget(self, request_text: str):
+        # get() off the event loop, the backend may be SQLite; hence the counters under the lock
+        return await asyncio.to_thread(self.get, request_text)
+
+    def set(self, request_text: str, value: dict):
+        text = normalize_text(request_text)
+        key = self.key_for(text)
+        evicted = self.backend.set(key, text, json.dumps(value), time.time())
+        if self.similarity > 0:
+            with self._lock:
+                self._index[key] = self._features(text)
+                for old in evicted:
+                    self._index.pop(old, None)
+
+    async def aset(self, request_text: str, value: dict):
+        await asyncio.to_thread(self.set, request_text, value)
+
+    def stats(self):
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+        }
+
+
+def build_response_cache() -> ResponseCache:
+    if RESPONSE_CACHE_BACKEND == "sqlite":
+        backend = SQLiteBackend()
+    else:
+        backend = MemoryBackend()
+    return ResponseCache(backend)
+
+
+_response_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    # FastAPI dependency, created on first use like the chat engine
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = build_response_cache()
+    return _response_cache
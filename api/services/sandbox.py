@@ -0,0 +1,306 @@
+import asyncio
+import atexit
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+
+try:
+    import resource
+except ImportError:  # no rlimits on Windows, OpenSCAD then only has its wall-clock timeout
+    resource = None
+
+# Limits of each OpenSCAD process, 0 disables one. CPU time defaults to the run's timeout.
+OPENSCAD_MEMORY_MB = int(os.getenv("OPENSCAD_MEMORY_MB", "4096"))
+OPENSCAD_CPU_SECONDS = int(os.getenv("OPENSCAD_CPU_SECONDS", "0"))
+OPENSCAD_OUTPUT_MB = int(os.getenv("OPENSCAD_OUTPUT_MB", "512"))
+# Compiler output kept per run (the last part, where the errors are) and streamed as progress
+OPENSCAD_STDERR_KB = int(os.getenv("OPENSCAD_STDERR_KB", "1024"))
+# util-linux prlimit sets the limits and execs OpenSCAD; without it they are set right after the start
+PRLIMIT_BIN = os.getenv("PRLIMIT_BIN", shutil.which("prlimit") or "")
+# Workspaces go on tmpfs when there is one, so sources and meshes never touch the disk
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+WORKSPACE_POOL_SIZE = int(os.getenv("WORKSPACE_POOL_SIZE", "8"))
+PIPE_READ_BYTES = 64 * 1024
+
+# Signals that end a run, by name: the first two are the CPU time and output size limits
+_SIGNAL_REASONS = {
+    "SIGXCPU": "CPU time limit exceeded",
+    "SIGXFSZ": "output file size limit exceeded",
+    "SIGSEGV": "crashed, possibly out of memory",
+    "SIGABRT": "aborted, possibly out of memory",
+}
+
+
+def workspace_path(workdir: str, path: str) -> str:
+    """
+    Where a project file goes inside `workdir`. Paths come from the LLM or the
+    user, so one that would land outside the workspace raises ValueError.
+    """
+    full = os.path.normpath(os.path.join(workdir, path.replace("\\", "/").lstrip("/")))
+    if "\0" in path or full == workdir or os.path.commonpath([workdir, full]) != workdir:
+        raise ValueError(f"Invalid source path: {path!r}")
+    return full
+
+
+def run_limits(timeout: float):
+    # (resource, soft limit) pairs applied to each run
+    if resource is None:
+        return []
+    cpu = OPENSCAD_CPU_SECONDS or max(1, int(timeout + 0.999))
+    limits = [(resource.RLIMIT_CPU, cpu), (resource.RLIMIT_CORE, 0)]
+    if OPENSCAD_MEMORY_MB:
+        limits.append((resource.RLIMIT_AS, OPENSCAD_MEMORY_MB * 1024 * 1024))
+    if OPENSCAD_OUTPUT_MB:
+        limits.append((resource.RLIMIT_FSIZE, OPENSCAD_OUTPUT_MB * 1024 * 1024))
+    return limits
+
+
+def _hard_limit(which, soft: int) -> int:
+    # The hard CPU limit is one second later, SIGXCPU first gives OpenSCAD a chance to exit
+    return soft + 1 if which == resource.RLIMIT_CPU else soft
+
+
+_PRLIMIT_OPTIONS = {
+    resource.RLIMIT_CPU: "--cpu",
+    resource.RLIMIT_CORE: "--core",
+    resource.RLIMIT_AS: "--as",
+    resource.RLIMIT_FSIZE: "--fsize",
+} if resource is not None else {}
+
+
+def limited_command(args, limits):
+    """
+    `args` run through prlimit, so the limits hold from OpenSCAD's first
+    instruction. No Python runs in the child between fork and exec, which is
+    unsafe in a process with threads (preexec_fn can deadlock there).
+    """
+    if not limits or not PRLIMIT_BIN:
+        return list(args)
+    options = [f"{_PRLIMIT_OPTIONS[which]}={soft}:{_hard_limit(which, soft)}" for which, soft in limits]
+    return [PRLIMIT_BIN, *options, "--", *args]
+
+
+def _limit_running(pid: int, limits):
+    # Fallback without prlimit: the limits are set on the child right after it started
+    for which, soft in limits:
+        try:
+            resource.prlimit(pid, which, (soft, _hard_limit(which, soft)))
+        except ProcessLookupError:
+            return
+
+
+def exit_reason(returncode: int):
+    # Why a run that ended on a signal ended, None for a normal exit
+    if returncode >= 0:
+        return None
+    try:
+        name = signal.Signals(-returncode).name
+    except ValueError:
+        name = f"signal {-returncode}"
+    return f"OpenSCAD {_SIGNAL_REASONS.get(name, 'killed')} ({name})"
+
+
+async def run_sandboxed(args, cwd: str, timeout: float, on_stderr=None):
+    """
+    Runs a command under the OpenSCAD limits without blocking the event loop.
+    stderr is passed to `on_stderr` line by line as it is written, stdout is dropped;
+    both the lines passed on and the stderr returned stop at OPENSCAD_STDERR_KB.
+    Returns (returncode, stderr_bytes, usage), usage being the process's own
+    rusage: cpu_seconds (user + system) and max_rss_bytes.
+    Raises asyncio.TimeoutError after `timeout` seconds; on timeout or
+    cancellation the process is killed and reaped before the error propagates.
+    """
+    limits = run_limits(timeout)
+    proc = subprocess.Popen(
+        limited_command(args, limits), cwd=cwd,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    if limits and not PRLIMIT_BIN:
+        _limit_running(proc.pid, limits)
+    try:
+        stderr, (status, usage) = await asyncio.wait_for(
+            _collect(proc, on_stderr), timeout=timeout
+        )
+    except BaseException:
+        await _kill(proc)
+        raise
+    finally:
+        proc.stderr.close()
+    return proc.returncode, stderr, {
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_bytes": usage.ru_maxrss * 1024,
+    }
+
+
+async def _collect(proc, on_stderr):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=PIPE_READ_BYTES)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), proc.stderr)
+    try:
+        stderr = await _read_lines(reader, on_stderr, OPENSCAD_STDERR_KB * 1024)
+        # Shielded: a timeout here leaves the reaper for _kill to await
+        return stderr, await asyncio.shield(_reaper(proc))
+    finally:
+        transport.close()
+
+
+async def _read_lines(stream, on_line, max_bytes: int = 0) -> bytes:
+    """
+    Reads a pipe to the end, passing on each complete line as soon as it arrives.
+    With `max_bytes`, lines are passed on up to that many bytes and only the
+    last `max_bytes` are returned; the pipe is still drained to the end, so
+    the process never blocks writing to it.
+    """
+    data = bytearray()
+    start = 0  # first byte of `data` not passed on yet
+    passed = 0
+    dropped = 0
+    while True:
+        block = await stream.read(PIPE_READ_BYTES)
+        if not block:
+            break
+        data += block
+        if on_line is not None and not (max_bytes and passed >= max_bytes):
+            end = data.rfind(b"\n") + 1
+            for line in bytes(data[start:end]).splitlines(keepends=True):
+                on_line(line.rstrip(b"\r\n").decode(errors="replace"))
+                passed += len(line)
+                if max_bytes and passed >= max_bytes:
+                    on_line(f"[further output not shown, over {max_bytes} bytes]")
+                    break
+            start = max(start, end)
+        if max_bytes and len(data) > 2 * max_bytes:
+            # Trimmed now and then rather than on every block
+            cut = len(data) - max_bytes
+            del data[:cut]
+            dropped += cut
+            start = max(0, start - cut)
+    if on_line is not None and start < len(data) and not (max_bytes and passed >= max_bytes):
+        on_line(bytes(data[start:]).decode(errors="replace"))
+    if max_bytes and len(data) > max_bytes:
+        dropped += len(data) - max_bytes
+        del data[:len(data) - max_bytes]
+    if dropped:
+        return f"[{dropped} bytes of output dropped]\n".encode() + bytes(data)
+    return bytes(data)
+
+
+def _reaper(proc):
+    # The one task reaping the process, started on first use; nothing else calls wait4 on its pid
+    reaper = getattr(proc, "reaper", None)
+    if reaper is None:
+        reaper = proc.reaper = asyncio.ensure_future(_wait4(proc))
+    return reaper
+
+
+async def _wait4(proc):
+    """
+    Reaps the process, returns (wait status, rusage). With a pidfd the wait is
+    on the event loop; elsewhere a thread blocks in waitid until the exit.
+    Either way the process is only reaped by the wait4 on the loop, so until
+    this task is done its pid cannot be reused and _kill may signal it.
+    """
+    try:
+        fd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        fd = None
+    if fd is None:
+        # WNOWAIT leaves the exited process a zombie for the wait4 below
+        await asyncio.to_thread(os.waitid, os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+    else:
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+        loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(fd)
+            os.close(fd)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return status, usage
+
+
+async def _kill(proc):
+    reaper = _reaper(proc)
+    if not reaper.done():
+        # Not reaped yet, so the pid is still this process. Popen.kill() would
+        # poll, i.e. reap, behind the reaper's back.
+        os.kill(proc.pid, signal.SIGKILL)
+    await asyncio.shield(reaper)
+
+
+class WorkspacePool:
+    """
+    Empty directories for OpenSCAD runs, created ahead of time under `root`
+    (tmpfs by default) and emptied after each run for the next one, so a
+    compile never waits on creating and deleting a temporary directory.
+    Up to `size` idle workspaces are kept; busier moments create extra ones,
+    which are removed when released.
+    """
+
+    def __init__(self, root: str = WORKSPACE_ROOT, size: int = WORKSPACE_POOL_SIZE):
+        self.size = size
+        self.root = tempfile.mkdtemp(prefix="foundry-workspaces-", dir=root)
+        self._lock = threading.Lock()
+        self._idle = [tempfile.mkdtemp(dir=self.root) for _ in range(size)]
+        self.created = size
+        self.reused = 0
+
+    def acquire(self) -> str:
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+            self.created += 1
+        return tempfile.mkdtemp(dir=self.root)
+
+    def release(self, path: str):
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.unlink(entry.path)
+        except OSError:
+            # Could not be emptied, never hand it out again
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(path)
+                return
+        os.rmdir(path)
+
+    @asynccontextmanager
+    async def workspace(self):
+        path = self.acquire()
+        try:
+            yield path
+        finally:
+            await asyncio.to_thread(self.release, path)
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {"root": self.root, "idle": len(self._idle), "created": self.created, "reused": self.reused}
+
+
+_workspace_pool = None
+
+
+def get_workspace_pool() -> WorkspacePool:
+    global _workspace_pool
+    if _workspace_pool is None:
+        _workspace_pool = WorkspacePool()
+        # tmpfs is memory, leave nothing behind
+        atexit.register(_workspace_pool.close)
+    return _workspace_pool
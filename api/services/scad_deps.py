@@ -0,0 +1,160 @@
+import hashlib
+import posixpath
+import re
+
+# Matches `include <foo.scad>` and `use <lib/foo.scad>`, capturing the kind and target
+INCLUDE_RE = re.compile(r'\b(include|use)\s*<([^>\n]+)>')
+
+
+def normalize_path(path: str) -> str:
+    # "main.scad", "/main.scad" and "/./main.scad" all name the same file
+    return "/" + posixpath.normpath("/" + path).lstrip("/")
+
+
+def resolve_reference(target: str, from_path: str, known_paths):
+    """
+    Resolves an include/use target the way OpenSCAD does: relative to the
+    including file's folder first, then relative to the project root.
+    Returns the normalized project path, or None for files outside the project
+    (e.g. system libraries like MCAD).
+    """
+    target = target.strip()
+    candidates = []
+    if not target.startswith("/"):
+        candidates.append(normalize_path(posixpath.join(posixpath.dirname(normalize_path(from_path)), target)))
+    candidates.append(normalize_path(target))
+    for candidate in candidates:
+        if candidate in known_paths:
+            return candidate
+    return None
+
+
+def flat_names(paths):
+    """
+    Maps each project path to a unique top-level path, e.g. /utils/foo.scad => /foo.scad.
+    Files already at the root keep their name; when two files share a basename
+    the later ones get their folders folded in (/utils/foo.scad => /utils_foo.scad)
+    instead of overwriting each other.
+    """
+    paths = [normalize_path(p) for p in paths]
+    # Shallow files claim their basename first, ties keep input order
+    ordered = sorted(dict.fromkeys(paths), key=lambda p: p.count("/"))
+    taken = set()
+    names = {}
+    for path in ordered:
+        parts = path.lstrip("/").split("/")
+        flat = "/" + parts[-1]
+        if flat in taken:
+            flat = "/" + "_".join(parts)
+            stem, dot, ext = flat.rpartition(".")
+            n = 2
+            while flat in taken:
+                flat = f"{stem}_{n}{dot}{ext}" if dot else f"{flat}_{n}"
+                n += 1
+        taken.add(flat)
+        names[path] = flat
+    return names
+
+
+def rewrite_references(content: str, from_path: str, path_map) -> str:
+    """
+    Single pass over `content` that points every include/use at its new path
+    in `path_map` (old normalized path -> new path). Targets outside the
+    project are left untouched.
+    """
+    def replace(m):
+        resolved = resolve_reference(m.group(2), from_path, path_map)
+        if resolved is None:
+            return m.group(0)
+        start = m.start(2) - m.start(0)
+        return m.group(0)[:start] + path_map[resolved].lstrip("/") + ">"
+
+    return INCLUDE_RE.sub(replace, content)
+
+
+class DependencyGraph:
+    """
+    include/use graph of a project's SCAD files.
+    Edges point from a file to the files it includes or uses.
+    """
+
+    def __init__(self, sources):
+        self.files = {normalize_path(f.path): f.content for f in sources}
+        self.deps = {path: set() for path in self.files}
+        self.external = {path: set() for path in self.files}
+        self.dependents = {path: set() for path in self.files}
+        for path, content in self.files.items():
+            for _, target in INCLUDE_RE.findall(content):
+                resolved = resolve_reference(target, path, self.files)
+                if resolved is None:
+                    self.external[path].add(target.strip())
+                elif resolved != path:
+                    self.deps[path].add(resolved)
+                    self.dependents[resolved].add(path)
+        self._closure_hashes = {}
+
+    def closure(self, path: str):
+        # The file itself plus everything it transitively includes or uses
+        return self._walk(normalize_path(path), self.deps)
+
+    def affected_by(self, paths):
+        # Every file whose closure contains one of `paths`, i.e. that needs recompiling
+        affected = set()
+        for path in paths:
+            path = normalize_path(path)
+            if path in self.files:
+                affected |= self._walk(path, self.dependents)
+        return affected
+
+    def _walk(self, start: str, edges):
+        if start not in self.files:
+            return set()
+        seen = {start}
+        stack = [start]
+        while stack:
+            for nxt in edges[stack.pop()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
+    def closure_hash(self, path: str) -> str:
+        """
+        Hash of the contents of a file's dependency closure. It changes exactly
+        when something that can affect the file's compiled output changes.
+        """
+        path = normalize_path(path)
+        if path not in self._closure_hashes:
+            h = hashlib.sha256()
+            for p in sorted(self.closure(path)):
+                h.update(p.encode("utf-8") + b"\0")
+                h.update(self.files[p].encode("utf-8") + b"\0")
+                for ext in sorted(self.external[p]):
+                    h.update(b"<" + ext.encode("utf-8") + b">\0")
+            self._closure_hashes[path] = h.hexdigest()
+        return self._closure_hashes[path]
+
+    def topological_order(self):
+        # Dependencies before dependents; files in an include cycle keep input order
+        order = []
+        state = {}
+
+        def visit(path):
+            if state.get(path):
+                return
+            state[path] = "visiting"
+            for dep in sorted(self.deps[path]):
+                visit(dep)
+            state[path] = "done"
+            order.append(path)
+
+        for path in self.files:
+            visit(path)
+        return order
+
+
+def changed_paths(old_sources, new_sources):
+    # Paths added, removed or edited between two versions of a project
+    old = {normalize_path(f.path): f.content for f in old_sources}
+    new = {normalize_path(f.path): f.content for f in new_sources}
+    return {p for p in old.keys() | new.keys() if old.get(p) != new.get(p)}
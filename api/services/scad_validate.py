@@ -0,0 +1,77 @@
+import asyncio
+import os
+
+from models.models import EnrichedChatResponse, PlaygroundPreferences, ValidationReport
+from services.openscad_render import check_sources, OpenSCADError, RenderQueueFull, RenderTimeout
+
+VALIDATE_TIMEOUT = float(os.getenv("VALIDATE_TIMEOUT", "20"))
+# Only the tail of long compiler logs is sent back to the LLM, that's where the errors are
+REPAIR_STDERR_CHARS = 4000
+
+
+async def validate_candidate(engine, request_text: str, prepare, max_repairs: int, timeout: float):
+    """
+    One candidate: asks the LLM, compiles the answer and, while it fails,
+    sends the compiler output back for up to `max_repairs` fixes.
+    `prepare` turns a RawChatResponse into the EnrichedChatResponse the user
+    gets, so the code that is checked is exactly the code that is returned.
+    """
+    raw = await engine.ainvoke(request_text)
+    attempts = 0
+    while True:
+        attempts += 1
+        enriched: EnrichedChatResponse = prepare(raw)
+        prefs = PlaygroundPreferences(
+            sources=enriched.chat_response.sources,
+            active_path=enriched.chat_response.active_path,
+        )
+        try:
+            await check_sources(prefs, timeout=timeout)
+            enriched.validation = ValidationReport(compiled=True, attempts=attempts)
+            return enriched
+        except OpenSCADError as e:
+            errors = e.stderr
+        except (RenderQueueFull, RenderTimeout) as e:
+            # Says nothing about the code, hand it back unchecked
+            reason = "Render queue is full" if isinstance(e, RenderQueueFull) else f"Check timed out after {timeout:g}s"
+            enriched.validation = ValidationReport(compiled=None, attempts=attempts, stderr=reason)
+            return enriched
+        if attempts > max_repairs:
+            enriched.validation = ValidationReport(compiled=False, attempts=attempts, stderr=errors)
+            return enriched
+        raw = await engine.arepair(request_text, enriched.chat_response, errors[-REPAIR_STDERR_CHARS:])
+
+
+async def generate_validated(engine, request_text: str, prepare, candidates: int = 1,
+                             max_repairs: int = 2, timeout: float = VALIDATE_TIMEOUT) -> EnrichedChatResponse:
+    """
+    Runs `candidates` validate_candidate() loops concurrently and returns the
+    first answer that compiles, cancelling the rest. When none compiles, the
+    first unchecked answer is returned, else the last failing one with its errors.
+    """
+    tasks = [
+        asyncio.ensure_future(validate_candidate(engine, request_text, prepare, max_repairs, timeout))
+        for _ in range(candidates)
+    ]
+    fallback = None
+    error = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                enriched = await next_done
+            except Exception as e:
+                # A candidate the LLM botched (e.g. invalid JSON) doesn't sink the others
+                error = e
+                continue
+            enriched.validation.candidates = candidates
+            if enriched.validation.compiled:
+                return enriched
+            if fallback is None or fallback.validation.compiled is False:
+                fallback = enriched
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if fallback is None:
+        raise error
+    return fallback
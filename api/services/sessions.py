@@ -0,0 +1,179 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from models.models import SourceFile
+from services.scad_deps import normalize_path
+
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.sqlite3")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_MEMORY_ENTRIES = int(os.getenv("SESSION_MEMORY_ENTRIES", "256"))
+# Earlier requests shown to the LLM with a follow-up, the project itself is always complete
+SESSION_HISTORY_TURNS = int(os.getenv("SESSION_HISTORY_TURNS", "6"))
+
+
+class EditError(ValueError):
+    pass
+
+
+def apply_edits(sources, edits):
+    """
+    Applies FileEdits to a list of SourceFiles and returns the new list, files
+    in their original order and new ones at the end. A hunk's search text must
+    occur exactly once in its file, so an edit never lands in the wrong place.
+    Raises EditError describing the first edit that does not apply.
+    """
+    files = OrderedDict((normalize_path(f.path), f.content) for f in sources)
+    for edit in edits:
+        path = normalize_path(edit.path)
+        if edit.delete:
+            if path not in files:
+                raise EditError(f"Cannot delete {edit.path}: no such file")
+            del files[path]
+            continue
+        content = edit.content if edit.content is not None else files.get(path)
+        if content is None:
+            raise EditError(f"Cannot edit {edit.path}: no such file, give its full content instead")
+        for hunk in edit.hunks:
+            count = content.count(hunk.search) if hunk.search else 0
+            if count != 1:
+                found = "not found" if count == 0 else f"found {count} times"
+                raise EditError(f"Hunk for {edit.path} {found}: {hunk.search[:200]!r}")
+            content = content.replace(hunk.search, hunk.replace)
+        files[path] = content
+    return [SourceFile(path=path, content=content) for path, content in files.items()]
+
+
+class SessionStore:
+    """
+    Current project of each chat conversation, so follow-ups can send edits
+    instead of regenerating every file.
+    Sessions live in SQLite; the most recently used ones are also kept parsed
+    in memory, checked against the row's version so several workers sharing
+    the file never serve a stale project. Sessions idle for `ttl` seconds are dropped.
+    """
+
+    def __init__(self, path: str = SESSION_STORE_PATH, ttl: float = SESSION_TTL,
+                 memory_entries: int = SESSION_MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # id -> session dict, least recent first
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, version INTEGER NOT NULL, sources TEXT NOT NULL, active_path TEXT NOT NULL,"
+            " history TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+        self._db.commit()
+
+    def create(self, sources, active_path: str, request_text: str, reply_text: str) -> str:
+        sid = secrets.token_urlsafe(12)
+        now = time.time()
+        session = {
+            "id": sid,
+            "version": 1,
+            "sources": [SourceFile.model_validate(f) for f in sources],
+            "active_path": active_path,
+            "history": [{"request_text": request_text, "reply_text": reply_text, "changed_paths": []}],
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+            self._db.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)", self._row(session))
+            self._db.commit()
+            self._remember(session)
+        return sid
+
+    def get(self, sid: str):
+        """
+        Returns the session dict (sources as SourceFiles), or None if it is unknown or expired.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT version, updated_at FROM sessions WHERE id = ?", (sid,)).fetchone()
+            if row is None:
+                self._memory.pop(sid, None)
+                return None
+            if time.time() - row[1] > self.ttl:
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+                self._db.commit()
+                self._memory.pop(sid, None)
+                return None
+            session = self._memory.get(sid)
+            if session is None or session["version"] != row[0]:
+                session = self._load(sid)
+            self._remember(session)
+            return session
+
+    def update(self, sid: str, sources, active_path: str, turn: dict):
+        # Replaces the project and appends the turn to the history, returns the new session
+        with self._lock:
+            # Read and write in one transaction, so a worker sharing the file can't slip
+            # its own update in between; memory only takes the version once it is committed
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                session = self._load(sid)
+                if session is None:
+                    self._db.rollback()
+                    return None
+                session = {
+                    **session,
+                    "version": session["version"] + 1,
+                    "sources": [SourceFile.model_validate(f) for f in sources],
+                    "active_path": active_path,
+                    "history": (session["history"] + [turn])[-SESSION_HISTORY_TURNS:],
+                    "updated_at": time.time(),
+                }
+                self._db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)", self._row(session))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+            self._remember(session)
+            return session
+
+    def _load(self, sid: str):
+        row = self._db.execute(
+            "SELECT version, sources, active_path, history, created_at, updated_at FROM sessions WHERE id = ?", (sid,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": sid,
+            "version": row[0],
+            "sources": [SourceFile.model_validate(f) for f in json.loads(row[1])],
+            "active_path": row[2],
+            "history": json.loads(row[3]),
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+    @staticmethod
+    def _row(session):
+        return (
+            session["id"], session["version"], json.dumps([f.model_dump() for f in session["sources"]]),
+            session["active_path"], json.dumps(session["history"]), session["created_at"], session["updated_at"],
+        )
+
+    def _remember(self, session):
+        self._memory[session["id"]] = session
+        self._memory.move_to_end(session["id"])
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+
+_session_store = None
+
+
+def get_session_store() -> SessionStore:
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore()
+    return _session_store
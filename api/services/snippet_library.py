@@ -0,0 +1,257 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import posixpath
+import re
+import threading
+from collections import Counter
+
+from models.models import SourceFile
+from services.metrics import span
+from services.scad_deps import INCLUDE_RE, normalize_path, resolve_reference
+
+# Vetted .scad files offered to the LLM instead of having it write the same modules again
+SNIPPET_LIBRARY_DIR = os.getenv(
+    "SNIPPET_LIBRARY_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "library")
+)
+SNIPPET_INDEX_PATH = os.getenv("SNIPPET_INDEX_PATH", "snippet_index.json")
+SNIPPET_TOP_K = int(os.getenv("SNIPPET_TOP_K", "3"))
+# BM25 score a module needs to be offered, 0 offers the top k whenever any word matches
+SNIPPET_MIN_SCORE = float(os.getenv("SNIPPET_MIN_SCORE", "1.0"))
+
+# Folder the LLM references library files in, e.g. `use <lib/threads.scad>`; only references
+# there are taken for library files, a project's own "threads.scad" never is
+LIBRARY_PREFIX = "/lib/"
+
+INDEX_VERSION = 2
+BM25_K1 = 1.5
+BM25_B = 0.75
+# The module name and the summary atop its doc say what it is for, their words count more.
+# Parameter descriptions are left out of the index: "cylinder" or "diameter" there says nothing.
+NAME_WEIGHT = 3
+SUMMARY_WEIGHT = 2
+
+# Top-level `module name (` at the start of a line, nested modules are indented
+_MODULE_RE = re.compile(r"^module\s+(\w+)\s*\(", re.M)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Comment lines that are only rulers, e.g. "// -----"
+_RULER_RE = re.compile(r"^[-=*/#\s]*$")
+# First line of the parameter list in a doc, e.g. "diameter - outside diameter"
+_PARAM_RE = re.compile(r"^\w+\s+-", re.M)
+_STOP_WORDS = frozenset(
+    "a an and are as at be by default e for from g i in is it make me of on or the this to "
+    "true false with".split()
+)
+
+
+def stem(word: str) -> str:
+    # Crude suffix stripping, enough for "threaded"/"threads" to find "thread"
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            if suffix == "es" and not word[:-2].endswith(("s", "x", "z", "ch", "sh")):
+                continue
+            if suffix == "s" and word.endswith("ss"):
+                continue
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str):
+    # Bare numbers are left out, "20" in a request has nothing to do with a default of 20
+    return [stem(w) for w in _WORD_RE.findall(text.lower()) if w not in _STOP_WORDS and not w.isdigit()]
+
+
+def parse_modules(content: str):
+    """
+    The documented top-level modules of a SCAD file: [(name, signature, doc)].
+    The doc is the block of `//` comment lines right above the module; modules
+    without one are taken as helpers of the file and left out.
+    """
+    lines = content.splitlines()
+    modules = []
+    for m in _MODULE_RE.finditer(content):
+        # Parameters run to the matching parenthesis, possibly over several lines
+        depth = 0
+        for end in range(m.end() - 1, len(content)):
+            depth += {"(": 1, ")": -1}.get(content[end], 0)
+            if depth == 0:
+                break
+        signature = f"{m.group(1)}({' '.join(content[m.end():end].split())})"
+        line_no = content.count("\n", 0, m.start())
+        doc = []
+        for line in reversed(lines[:line_no]):
+            line = line.strip()
+            if not line.startswith("//") or _RULER_RE.match(line):
+                break
+            text = line[2:].rstrip()
+            doc.append(text[1:] if text.startswith(" ") else text)
+        if doc:
+            modules.append((m.group(1), signature, "\n".join(reversed(doc))))
+    return modules
+
+
+def doc_summary(doc: str) -> str:
+    # What a doc says before it lists the parameters
+    m = _PARAM_RE.search(doc)
+    return doc[:m.start()] if m else doc
+
+
+class SnippetLibrary:
+    """
+    BM25 index over the documented modules of the .scad files in `directory`.
+    search() finds the modules that fit a request, prompt_section() lists them
+    for the LLM, which then `use`s the file instead of writing the code itself;
+    attach() adds the files its answer references to the project.
+    The index is saved to `index_path` and only rebuilt when the files change.
+    """
+
+    def __init__(self, directory: str = SNIPPET_LIBRARY_DIR, index_path: str = SNIPPET_INDEX_PATH,
+                 top_k: int = SNIPPET_TOP_K, min_score: float = SNIPPET_MIN_SCORE):
+        self.top_k = top_k
+        self.min_score = min_score
+        self.files = {}  # "/lib/name.scad" -> content
+        for path in sorted(glob.glob(os.path.join(directory, "*.scad"))):
+            with open(path, encoding="utf-8") as f:
+                self.files[LIBRARY_PREFIX + os.path.basename(path)] = f.read()
+        self._by_content = {content: path for path, content in self.files.items()}
+        fingerprint = hashlib.sha256(json.dumps(self.files, sort_keys=True).encode()).hexdigest()
+        index = self._load(index_path, fingerprint)
+        self.rebuilt = index is None
+        if index is None:
+            index = self._build(fingerprint)
+            if index_path:
+                self._save(index_path, index)
+        self.docs = index["docs"]
+        self.df = index["df"]
+        self.avg_length = index["avg_length"]
+
+    def _build(self, fingerprint: str) -> dict:
+        docs = []
+        for path, content in self.files.items():
+            for name, signature, doc in parse_modules(content):
+                terms = (tokenize(name) * NAME_WEIGHT + tokenize(doc_summary(doc)) * SUMMARY_WEIGHT
+                         + tokenize(f"{signature} {posixpath.basename(path)[:-5]}"))
+                docs.append({
+                    "path": path, "module": name, "signature": signature, "doc": doc,
+                    "tf": dict(Counter(terms)), "length": len(terms),
+                })
+        df = Counter(term for d in docs for term in d["tf"])
+        avg_length = sum(d["length"] for d in docs) / len(docs) if docs else 0.0
+        return {"version": INDEX_VERSION, "fingerprint": fingerprint, "docs": docs, "df": dict(df),
+                "avg_length": avg_length}
+
+    @staticmethod
+    def _load(index_path: str, fingerprint: str):
+        if not index_path:
+            return None
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get("version") != INDEX_VERSION or index.get("fingerprint") != fingerprint:
+            return None
+        return index
+
+    @staticmethod
+    def _save(index_path: str, index: dict):
+        # Written aside and renamed, so a concurrent start never reads half a file
+        tmp = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp, index_path)
+        except OSError as e:
+            print(f"Snippet index not saved to {index_path}: {e}")
+
+    def search(self, text: str, top_k: int = None, min_score: float = None):
+        """
+        [(score, doc)] of the modules matching `text`, best first: at most
+        `top_k`, each scoring at least `min_score` (both default to the library's).
+        """
+        top_k = self.top_k if top_k is None else top_k
+        min_score = self.min_score if min_score is None else min_score
+        n = len(self.docs)
+        terms = set(tokenize(text))
+        scored = []
+        for doc in self.docs:
+            score = 0.0
+            for term in terms:
+                tf = doc["tf"].get(term)
+                if not tf:
+                    continue
+                df = self.df[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / self.avg_length)
+                score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            if score > 0 and score >= min_score:
+                scored.append((score, doc))
+        scored.sort(key=lambda s: -s[0])
+        return scored[:top_k]
+
+    def prompt_section(self, text: str) -> str:
+        # The prompt's LIBRARY block for a request, empty when nothing fits
+        with span("retrieve") as attrs:
+            hits = self.search(text)
+            attrs["snippets"] = len(hits)
+        if not hits:
+            return ""
+        entries = "\n".join(
+            f"- {doc['path']} provides {doc['signature']}\n" + "\n".join(f"    {line}" for line in doc["doc"].splitlines())
+            for _, doc in hits
+        )
+        return (
+            "\n"
+            "LIBRARY MODULES (tested, they compile) that fit this request:\n"
+            f"{entries}\n"
+            f"- Where one of these does the job, call it instead of writing your own: add e.g. 'use <{hits[0][1]['path'][1:]}>;' to the file that calls it.\n"
+            "- Do NOT put library files in 'sources', the server adds them to the project.\n"
+        )
+
+    def is_library_file(self, source) -> bool:
+        # Projects are flattened once answered, /lib/threads.scad is then /threads.scad
+        path = self._by_content.get(source.content)
+        return path is not None and posixpath.basename(path) == posixpath.basename(normalize_path(source.path))
+
+    def describe(self, source) -> str:
+        # Stands in for a library file's content in prompts about an existing project
+        names = ", ".join(name for name, _, _ in parse_modules(source.content))
+        return f"(library file, added by the server; do not edit or copy it. Modules: {names})"
+
+    def attach(self, sources):
+        """
+        `sources` plus the library files they include or use under LIBRARY_PREFIX
+        but don't provide, and in turn the library files those include, in order.
+        References resolve as OpenSCAD resolves them; one that reaches a file
+        of the project, or a path outside the prefix, is left alone.
+        """
+        sources = list(sources)
+        present = {normalize_path(f.path) for f in sources}
+        i = 0
+        while i < len(sources):
+            for m in INCLUDE_RE.finditer(sources[i].content):
+                path = resolve_reference(m.group(2).replace("\\", "/"), sources[i].path, present | self.files.keys())
+                if path is not None and path not in present:
+                    present.add(path)
+                    sources.append(SourceFile(path=path, content=self.files[path]))
+            i += 1
+        return sources
+
+    def stats(self):
+        return {"files": len(self.files), "modules": len(self.docs), "rebuilt": self.rebuilt}
+
+
+_snippet_library = None
+_snippet_library_lock = threading.Lock()
+
+
+def get_snippet_library() -> SnippetLibrary:
+    # Built with the chat engine during the startup warmup, shared by all requests
+    global _snippet_library
+    if _snippet_library is None:
+        with _snippet_library_lock:
+            if _snippet_library is None:
+                _snippet_library = SnippetLibrary()
+    return _snippet_library
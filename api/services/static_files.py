@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import os
+import re
+from mimetypes import guess_type
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+# Vite names bundled files assets/<name>-<8 char hash>.<ext>, their content never changes
+IMMUTABLE_PATH_RE = re.compile(r"(^|/)assets/[^/]+-[A-Za-z0-9_-]{8}\.\w+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else may change with a deploy: cached, but checked with the ETag on every use
+REVALIDATE = "no-cache"
+# Preferred first; the files are built next to each asset, e.g. index-1a2b3c4d.js.br
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepted_encodings(header: str):
+    # Content codings an Accept-Encoding header allows, leaving out those with q=0
+    accepted = set()
+    for item in header.split(","):
+        name, *params = item.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0 and name.strip():
+            accepted.add(name.strip().lower())
+    if "*" in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return accepted
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles serving the .br or .gz file built next to an asset when the
+    client accepts it, so nothing is compressed per request. ETags are strong,
+    hashed from the content of what is sent, and conditional requests get a 304.
+    Hashed bundle files are cached as immutable for a year, the rest (index.html)
+    is revalidated on each use.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._etags = {}  # (path, mtime_ns, size) -> ETag
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = os.fspath(full_path)
+        path, stat_result, encoding = self._variant(full_path, stat_result, request_headers)
+        response = FileResponse(
+            path, status_code=status_code, stat_result=stat_result,
+            media_type=guess_type(full_path)[0] or "text/plain",
+        )
+        response.headers["etag"] = self._etag(path, stat_result)
+        immutable = IMMUTABLE_PATH_RE.search(full_path.replace(os.sep, "/"))
+        response.headers["cache-control"] = IMMUTABLE if immutable else REVALIDATE
+        response.headers["vary"] = "Accept-Encoding"
+        if encoding is not None:
+            response.headers["content-encoding"] = encoding
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _variant(self, full_path: str, stat_result, request_headers):
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted:
+                try:
+                    return full_path + suffix, os.stat(full_path + suffix), encoding
+                except OSError:
+                    continue
+        return full_path, stat_result, None
+
+    def _etag(self, path: str, stat_result) -> str:
+        key = (path, stat_result.st_mtime_ns, stat_result.st_size)
+        etag = self._etags.get(key)
+        if etag is None:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            etag = self._etags[key] = f'"{digest.hexdigest()[:32]}"'
+        return etag
+
+
+class StaticPage:
+    """
+    A small file served from memory: read and gzipped once at startup, with a
+    strong ETag per encoding so repeat visits get a 304.
+    """
+
+    def __init__(self, path: str, media_type: str = "text/html; charset=utf-8"):
+        with open(path, "rb") as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.media_type = media_type
+        self.variants = {
+            None: (body, f'"{digest}"'),
+            "gzip": (gzip.compress(body, 9, mtime=0), f'"{digest}-gzip"'),
+        }
+
+    def response(self, request) -> Response:
+        encoding = "gzip" if "gzip" in accepted_encodings(request.headers.get("accept-encoding", "")) else None
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE, "Vary": "Accept-Encoding"}
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type=self.media_type, headers=headers)
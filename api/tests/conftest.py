@@ -0,0 +1,53 @@
+import os
+import stat
+import sys
+
+import pytest
+
+# Tests import the app modules the same way uvicorn does, from the api/ folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKE_OPENSCAD = """#!{python}
+# Stand-in for the OpenSCAD CLI: writes a unit cube STL to the -o path.
+# A source containing "sleep(<seconds>)" makes it hang, "error" makes it fail.
+import re, sys, time
+args = sys.argv[1:]
+out = args[args.index("-o") + 1]
+src = open(args[-1]).read()
+m = re.search(r"sleep\\(([0-9.]+)\\)", src)
+if m:
+    time.sleep(float(m.group(1)))
+if "error" in src:
+    sys.stderr.write("ERROR: Parser error in file " + args[-1] + "\\n")
+    sys.exit(1)
+v = [(0,0,0),(1,0,0),(1,1,0),(0,1,0),(0,0,1),(1,0,1),(1,1,1),(0,1,1)]
+f = [(0,2,1),(0,3,2),(4,5,6),(4,6,7),(0,1,5),(0,5,4),(1,2,6),(1,6,5),(2,3,7),(2,7,6),(3,0,4),(3,4,7)]
+with open(out, "w") as fh:
+    fh.write("solid cube\\n")
+    for a, b, c in f:
+        fh.write("facet normal 0 0 0\\nouter loop\\n")
+        for i in (a, b, c):
+            fh.write("vertex %g %g %g\\n" % v[i])
+        fh.write("endloop\\nendfacet\\n")
+    fh.write("endsolid cube\\n")
+sys.stderr.write("Total rendering time: 0:00:00.001\\n")
+"""
+
+
+@pytest.fixture
+def fake_openscad(tmp_path, monkeypatch):
+    path = tmp_path / "openscad"
+    path.write_text(FAKE_OPENSCAD.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    import services.openscad_render as render
+    monkeypatch.setattr(render, "OPENSCAD_BIN", str(path))
+    return str(path)
+
+
+@pytest.fixture
+def render_cache(tmp_path, monkeypatch):
+    import services.render_cache as cache_module
+    cache = cache_module.RenderCache(root=str(tmp_path / "render-cache"))
+    monkeypatch.setattr(cache_module, "_render_cache", cache)
+    return cache
+
@@ -0,0 +1,29 @@
+import json
+
+import services.openscad_render as render
+from benchmarks.bench_pipeline import flatten_metrics, run
+from benchmarks.corpus import corpus, load_fixtures
+
+
+def test_corpus_grows_and_fixtures_parse():
+    assert {"cube", "fork", "bolt"} <= set(load_fixtures())
+    projects = corpus(synthetic_sizes=(5,))
+    sizes = [sum(len(f.content) for f in p.sources) for _, p in projects]
+    assert sizes == sorted(sizes)
+    bolt = dict(projects)["bolt"]
+    assert any(f.path == "/threads.scad" and "module metric_thread" in f.content for f in bolt.sources)
+
+
+def test_pipeline_benchmark_runs_offline(fake_openscad, render_cache, monkeypatch):
+    # One worker, so renders queue up at every client count
+    monkeypatch.setattr(render, "render_pool", render.RenderPool(workers=1))
+    results = run(repeat=1, resolution=32, clients=(1, 3, 4), per_client=2, llm_latency=0, synthetic_sizes=(5,))
+    json.dumps(results)
+    assert results["meta"]["openscad"] is True
+    fork = results["stages"]["fork"]
+    assert fork["mesh"] == "compiled" and fork["faces"] == 12
+    assert fork["compile"]["runs"] == 1
+    for scenario in ("chat", "render"):
+        assert [row["clients"] for row in results["throughput"][scenario]] == [1, 3, 4]
+        assert all(row["errors"] == 0 and row["requests"] == row["clients"] * 2 for row in results["throughput"][scenario])
+    assert "throughput.render.4_clients.req_per_s" in flatten_metrics(results)
@@ -0,0 +1,73 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import routers.chat as chat
+import services.chat as chat_service
+from services.chat import ChatEngine, IncrementalResponseParser, get_chat_engine
+from services.payload_store import PayloadStore, get_payload_store
+from services.response_cache import MemoryBackend, ResponseCache, get_response_cache
+from services.sessions import SessionStore, get_session_store
+
+REPLY = json.dumps({
+    "sources": [
+        {"path": "/main.scad", "content": "include <common.scad>\nmy_cube();\n"},
+        {"path": "/common.scad", "content": "module my_cube() { cube([10,10,10]); } // \"}]"},
+    ],
+    "active_path": "/main.scad",
+    "reply_text": "A cube split into {main} and [helper] files.",
+}, indent=2)
+
+
+def test_incremental_parser_reports_each_file_once_in_order():
+    scanner = IncrementalResponseParser()
+    events = []
+    text = "```json\n" + REPLY + "\n```"
+    for i in range(0, len(text), 7):
+        events += scanner.feed(text[i:i + 7])
+    assert [e[0] for e in events] == ["source", "source", "field", "field"]
+    assert events[1][1]["path"] == "/common.scad"
+    assert events[3][1] == ("reply_text", "A cube split into {main} and [helper] files.")
+
+
+def make_client(responses, cache=None, store=None, sessions=None):
+    app = FastAPI()
+    app.include_router(chat.router)
+    engine = ChatEngine(llm=FakeListChatModel(responses=responses))
+    cache = cache or ResponseCache(MemoryBackend())
+    store = store or PayloadStore(":memory:")
+    sessions = sessions or SessionStore(":memory:")
+    app.dependency_overrides[get_chat_engine] = lambda: engine
+    app.dependency_overrides[get_response_cache] = lambda: cache
+    app.dependency_overrides[get_payload_store] = lambda: store
+    app.dependency_overrides[get_session_store] = lambda: sessions
+    return TestClient(app)
+
+
+def test_engine_is_built_once_and_shared(monkeypatch):
+    built = []
+    monkeypatch.setattr(chat_service, "_chat_engine", None)
+    monkeypatch.setattr(chat_service, "build_chat_engine", lambda: built.append(1) or object())
+    assert get_chat_engine() is get_chat_engine()
+    assert len(built) == 1
+
+
+def test_ask_for_object_uses_shared_engine():
+    client = make_client([REPLY, REPLY])
+    for _ in range(2):
+        resp = client.post("/chat/ask_for_object", json={"request_text": "a cube", "use_cache": False})
+        assert resp.status_code == 200
+        assert resp.json()["chat_response"]["active_path"] == "/main.scad"
+
+
+def test_stream_endpoint_emits_sources_then_reply_then_done():
+    with make_client([REPLY]).stream("POST", "/chat/ask_for_object_stream", json={"request_text": "a cube"}) as resp:
+        body = "".join(resp.iter_text())
+    events = [block.split("\n")[0][len("event: "):] for block in body.split("\n\n") if block.startswith("event:")]
+    assert events == ["source", "source", "reply_text", "done"]
+    done = json.loads(body.split("event: done\ndata: ")[1].split("\n")[0])
+    assert [f["path"] for f in done["chat_response"]["sources"]] == ["/main.scad", "/common.scad"]
+    assert done["encoded_url"].startswith("https://ochafik.com/openscad2/#")
+
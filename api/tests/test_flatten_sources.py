@@ -0,0 +1,43 @@
+from models.models import RawChatResponse, SourceFile
+from routers.chat import enrich_response, flatten_sources
+
+
+def test_flattens_subfolders_and_rewrites_includes():
+    sources = [
+        SourceFile(path="/main.scad", content="include <utils/helpers.scad>;\nuse </parts/handle.scad>\nhandle();"),
+        SourceFile(path="/utils/helpers.scad", content="use <../parts/handle.scad>;\ninclude <MCAD/units.scad>;"),
+        SourceFile(path="/parts/handle.scad", content="include <grip.scad>\nmodule handle() { grip(); }"),
+        SourceFile(path="/parts/grip.scad", content="module grip() { cube(1); }"),
+    ]
+    flat = {f.path: f.content for f in flatten_sources(sources)}
+    assert flat == {
+        "/main.scad": "include <helpers.scad>;\nuse <handle.scad>\nhandle();",
+        "/helpers.scad": "use <handle.scad>;\ninclude <MCAD/units.scad>;",
+        "/handle.scad": "include <grip.scad>\nmodule handle() { grip(); }",
+        "/grip.scad": "module grip() { cube(1); }",
+    }
+
+
+def test_basename_collisions_get_distinct_names():
+    sources = [
+        SourceFile(path="/main.scad", content="use <a/shape.scad>\nuse <b/shape.scad>\nuse <shape.scad>"),
+        SourceFile(path="/a/shape.scad", content="module a() {}"),
+        SourceFile(path="/b/shape.scad", content="module b() {}"),
+        SourceFile(path="/shape.scad", content="module root() {}"),
+    ]
+    flat = flatten_sources(sources)
+    assert [f.path for f in flat] == ["/main.scad", "/a_shape.scad", "/b_shape.scad", "/shape.scad"]
+    assert flat[0].content == "use <a_shape.scad>\nuse <b_shape.scad>\nuse <shape.scad>"
+
+
+def test_enrich_response_follows_renamed_active_path():
+    raw = RawChatResponse(
+        sources=[
+            SourceFile(path="/shape.scad", content="cube(1);"),
+            SourceFile(path="/src/shape.scad", content="include <../shape.scad>"),
+        ],
+        active_path="/src/shape.scad",
+    )
+    enriched = enrich_response(raw)
+    assert enriched.chat_response.active_path == "/src_shape.scad"
+    assert enriched.chat_response.sources[1].content == "include <shape.scad>"
@@ -0,0 +1,159 @@
+import base64
+import struct
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import services.openscad_render as render
+from models.models import PlaygroundPreferences, SourceFile
+import routers.live as live
+from routers.live import router
+from routers.openscad_render import router as render_router
+from services.chat import ChatEngine, get_chat_engine
+from services.payload_store import PayloadStore, get_payload_store
+from services.response_cache import MemoryBackend, ResponseCache, get_response_cache
+from services.sessions import SessionStore, get_session_store
+from test_chat_stream import REPLY
+from test_render_cache import fork_prefs
+
+
+def make_client(responses=()):
+    app = FastAPI()
+    app.include_router(router)
+    engine = ChatEngine(llm=FakeListChatModel(responses=list(responses) or [REPLY]))
+    cache = ResponseCache(MemoryBackend())
+    store = PayloadStore(":memory:")
+    sessions = SessionStore(":memory:")
+    app.dependency_overrides[get_chat_engine] = lambda: engine
+    app.dependency_overrides[get_response_cache] = lambda: cache
+    app.dependency_overrides[get_payload_store] = lambda: store
+    app.dependency_overrides[get_session_store] = lambda: sessions
+    return TestClient(app)
+
+
+def receive_until_end(ws, op_id):
+    # Events of one request, up to and including the one that ends it
+    events = []
+    while True:
+        msg = ws.receive_json()
+        if msg["id"] != op_id:
+            continue
+        events.append(msg)
+        if msg["event"] in ("done", "error", "cancelled"):
+            return events
+
+
+def test_chat_streams_tokens_files_and_answer():
+    with make_client().websocket_connect("/live/ws") as ws:
+        ws.send_json({"type": "chat", "id": "c1", "request_text": "a cube"})
+        events = receive_until_end(ws, "c1")
+    kinds = [e["event"] for e in events]
+    assert kinds[0] == "started" and kinds[-1] == "done"
+    assert "".join(e["data"]["text"] for e in events if e["event"] == "token") == REPLY
+    assert [e["data"]["path"] for e in events if e["event"] == "source"] == ["/main.scad", "/common.scad"]
+    # Files are announced while the reply is still coming in
+    assert kinds.index("source") < len(kinds) - kinds[::-1].index("token") - 1
+    done = events[-1]["data"]
+    assert done["session_id"] and done["chat_response"]["active_path"] == "/main.scad"
+
+
+def test_render_reports_compile_and_each_view(fake_openscad, render_cache):
+    request = {"type": "render", "prefs": fork_prefs().model_dump(), "resolution": 64, "views": [0, 3], "formats": ["glb"]}
+    with make_client().websocket_connect("/live/ws") as ws:
+        ws.send_json({**request, "id": "r1"})
+        events = receive_until_end(ws, "r1")
+        kinds = [e["event"] for e in events]
+        assert kinds == [
+            "queued", "compile_started", "stderr", "usage", "compile_finished", "started", "view", "view", "mesh", "done"
+        ]
+        assert events[2]["data"]["line"].startswith("Total rendering time")
+        assert events[3]["data"]["cpu_seconds"] > 0 and events[3]["data"]["max_rss_bytes"] > 0
+        assert [e["data"]["index"] for e in events if e["event"] == "view"] == [0, 3]
+        assert base64.b64decode(events[6]["data"]["png"]).startswith(b"\x89PNG")
+        assert events[8]["data"]["format"] == "glb"
+        assert events[-1]["data"] == {"cache": "miss", "views": 2}
+
+        # The same render again comes from the cache, without compiling
+        ws.send_json({**request, "id": "r2"})
+        kinds = [e["event"] for e in receive_until_end(ws, "r2")]
+        assert kinds == ["started", "view", "view", "mesh", "done"]
+
+
+def test_render_only_node_without_chat_engine(fake_openscad, render_cache):
+    client = make_client()
+
+    def no_api_key():
+        raise RuntimeError("The api_key client option must be set")
+
+    client.app.dependency_overrides[get_chat_engine] = no_api_key
+    with client.websocket_connect("/live/ws") as ws:
+        ws.send_json({"type": "chat", "id": "c1", "request_text": "a cube"})
+        error = receive_until_end(ws, "c1")[-1]
+        assert error["event"] == "error" and error["data"]["status"] == 503
+        ws.send_json({"type": "render", "id": "r1", "prefs": fork_prefs().model_dump(), "resolution": 64, "views": [0]})
+        assert receive_until_end(ws, "r1")[-1]["event"] == "done"
+
+
+def test_render_errors_carry_stderr(fake_openscad, render_cache):
+    prefs = PlaygroundPreferences(sources=[SourceFile(path="/main.scad", content="error")])
+    with make_client().websocket_connect("/live/ws") as ws:
+        ws.send_json({"type": "render", "id": "r1", "prefs": prefs.model_dump()})
+        events = receive_until_end(ws, "r1")
+        assert [e["event"] for e in events] == ["queued", "compile_started", "stderr", "usage", "error"]
+        assert "Parser error" in events[-1]["data"]["stderr"]
+        ws.send_json({"type": "render", "id": "r2", "prefs": prefs.model_dump(), "views": [99]})
+        assert receive_until_end(ws, "r2")[-1]["data"]["status"] == 400
+        ws.send_json({"type": "chat", "id": "c1", "request_text": "x", "session_id": "nope"})
+        assert receive_until_end(ws, "c1")[-1]["data"]["status"] == 404
+        ws.send_json({"type": "bogus", "id": "x"})
+        assert ws.receive_json()["event"] == "error"
+
+
+def test_render_failure_matches_the_http_endpoint(fake_openscad, render_cache):
+    prefs = PlaygroundPreferences(sources=[SourceFile(path="/main.scad", content="error")]).model_dump()
+    client = make_client()
+    client.app.include_router(render_router)
+    resp = client.post("/openscad_render/rendershots_zip/", json=prefs)
+    with client.websocket_connect("/live/ws") as ws:
+        ws.send_json({"type": "render", "id": "r1", "prefs": prefs})
+        error = receive_until_end(ws, "r1")[-1]["data"]
+    assert error == {"status": resp.status_code, **resp.json()}
+
+
+def test_render_defaults_to_the_http_resolution(fake_openscad, render_cache, monkeypatch):
+    monkeypatch.setattr(live, "VIEW_RESOLUTION", 64)
+    with make_client().websocket_connect("/live/ws") as ws:
+        ws.send_json({"type": "render", "id": "r1", "prefs": fork_prefs().model_dump(), "views": [0]})
+        view = next(e for e in receive_until_end(ws, "r1") if e["event"] == "view")
+    # PNG width and height sit right after the signature and the IHDR chunk header
+    assert struct.unpack(">II", base64.b64decode(view["data"]["png"])[16:24]) == (64, 64)
+
+
+def wait_for_compile(ws, op_id):
+    while ws.receive_json() != {"id": op_id, "event": "compile_started", "data": {}}:
+        pass
+
+
+def test_cancel_and_disconnect_stop_the_render(fake_openscad, render_cache):
+    slow = {"type": "render", "prefs": PlaygroundPreferences(
+        sources=[SourceFile(path="/main.scad", content="sleep(10)")]
+    ).model_dump()}
+    client = make_client()
+    start = time.monotonic()
+    with client.websocket_connect("/live/ws") as ws:
+        ws.send_json({**slow, "id": "r1"})
+        wait_for_compile(ws, "r1")
+        ws.send_json({"type": "cancel", "id": "r1"})
+        assert receive_until_end(ws, "r1")[-1]["event"] == "cancelled"
+        assert render.render_pool.running == 0
+
+        # Closing the socket drops whatever it still had running
+        ws.send_json({**slow, "id": "r2"})
+        wait_for_compile(ws, "r2")
+        ws.close()
+        while render.render_pool.running and time.monotonic() - start < 5:
+            time.sleep(0.05)
+    assert render.render_pool.running == 0
+    assert time.monotonic() - start < 5
@@ -0,0 +1,102 @@
+import io
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+import trimesh
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.openscad_render as render
+from routers.openscad_render import router
+from services.mesh_analysis import analyze_mesh, is_watertight, voxelize
+from test_render_cache import fork_prefs
+
+
+def test_box_measures():
+    report = analyze_mesh(trimesh.creation.box((10, 20, 5)))
+    assert report["volume"] == pytest.approx(1000)
+    assert report["surface_area"] == pytest.approx(700)
+    assert report["bounding_box"]["size"] == pytest.approx([10, 20, 5])
+    assert report["watertight"]
+    # The bottom face rests on the plate, the sides are vertical
+    assert report["overhang"]["area"] == 0
+    assert report["voxels"]["material_volume"] == pytest.approx(1000, rel=0.02)
+
+
+def test_overhang_follows_the_angle():
+    # A cube standing on one edge: its two lower faces slope at 45 degrees
+    cube = trimesh.creation.box((10, 10, 10))
+    cube.apply_transform(trimesh.transformations.rotation_matrix(np.pi / 4, [1, 0, 0]))
+    assert analyze_mesh(cube, overhang_angle=40)["overhang"]["area"] == pytest.approx(200)
+    assert analyze_mesh(cube, overhang_angle=50)["overhang"]["area"] == 0
+
+
+def test_thin_walls_are_found():
+    tube = trimesh.creation.annulus(r_min=9.5, r_max=10, height=20)
+    thin = analyze_mesh(tube, min_wall=1.0)["thin_walls"]
+    assert thin["reliable"] and thin["fraction"] > 0.8
+    solid = analyze_mesh(trimesh.creation.cylinder(radius=10, height=20), min_wall=1.0)["thin_walls"]
+    assert solid["fraction"] < 0.1
+
+
+def test_voxel_volume_tracks_the_exact_volume():
+    sphere = trimesh.creation.icosphere(subdivisions=4, radius=10)
+    vertices = np.asarray(sphere.vertices)
+    grid = voxelize(vertices[sphere.faces], vertices.min(axis=0), vertices.max(axis=0), 0.5)
+    assert grid.sum() * 0.125 == pytest.approx(sphere.volume, rel=0.03)
+
+
+def test_open_mesh_is_not_watertight():
+    faces = trimesh.creation.box().faces
+    assert is_watertight(faces)
+    assert not is_watertight(faces[:-1])
+    assert not is_watertight(np.concatenate([faces, faces[:1]]))
+
+
+def test_endpoint_reuses_the_compiled_mesh(fake_openscad, render_cache, monkeypatch):
+    monkeypatch.setattr(render, "_analysis_cache", OrderedDict())
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    body = fork_prefs().model_dump()
+
+    resp = client.post("/openscad_render/analysis/", json=body)
+    assert resp.status_code == 200
+    assert resp.headers["X-Render-Cache"] == "miss"
+    assert resp.json()["volume"] == pytest.approx(1)
+    assert resp.json()["watertight"]
+
+    # Other settings reuse the cached STL, the same settings the cached report
+    monkeypatch.setattr(render, "OPENSCAD_BIN", "/nonexistent/openscad")
+    resp = client.post("/openscad_render/analysis/?overhang_angle=30&resolution=16", json=body)
+    assert resp.headers["X-Render-Cache"] == "hit"
+    assert resp.json()["voxels"]["shape"] == [16, 16, 16]
+    render_cache._disk.clear()
+    resp = client.post("/openscad_render/analysis/", json=body)
+    assert resp.headers["X-Render-Cache"] == "hit"
+
+    assert client.post("/openscad_render/analysis/?overhang_angle=120", json=body).status_code == 422
+
+
+def test_endpoint_reuses_the_rendered_stl(fake_openscad, render_cache, monkeypatch):
+    monkeypatch.setattr(render, "_analysis_cache", OrderedDict())
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    body = fork_prefs().model_dump()
+    assert client.post("/openscad_render/rendershots_zip/", json=body).status_code == 200
+
+    monkeypatch.setattr(render, "OPENSCAD_BIN", "/nonexistent/openscad")
+    resp = client.post("/openscad_render/analysis/", json=body)
+    assert resp.status_code == 200 and resp.headers["X-Render-Cache"] == "hit"
+    assert resp.json()["volume"] == pytest.approx(1)
+
+
+def test_empty_mesh_reports_zeros():
+    # A model that renders to nothing loads as a mesh without faces
+    empty = trimesh.load_mesh(io.BytesIO(bytes(80) + (0).to_bytes(4, "little")), file_type="stl")
+    report = analyze_mesh(empty)
+    assert report["faces"] == 0 and not report["watertight"]
+    assert report["volume"] == 0 and report["bounding_box"]["size"] == [0.0, 0.0, 0.0]
+    assert report["overhang"]["area"] == 0 and report["voxels"]["filled"] == 0
@@ -0,0 +1,81 @@
+import asyncio
+import io
+import zipfile
+
+import numpy as np
+import pytest
+import trimesh
+
+from services.mesh_lod import cluster_decimate, decode_qmesh, encode_qmesh, make_lod
+from services.openscad_render import render_shots, select_formats
+from test_render_cache import fork_prefs
+
+
+def test_lod_fits_budget_and_keeps_shape():
+    sphere = trimesh.creation.icosphere(subdivisions=5, radius=10)
+    lod = make_lod(sphere.copy(), 2000)
+    assert 0 < len(lod.faces) <= 2000
+    assert np.allclose(lod.extents, sphere.extents, rtol=0.05)
+    assert abs(lod.volume / sphere.volume - 1) < 0.05
+
+
+def test_lod_leaves_small_meshes_alone():
+    box = trimesh.creation.box((1, 2, 3))
+    assert len(make_lod(box, 50000).faces) == 12
+    assert len(make_lod(box, 0).faces) == 12
+
+
+def test_clustering_drops_collapsed_faces():
+    sphere = trimesh.creation.icosphere(subdivisions=4)
+    vertices, faces = cluster_decimate(sphere.vertices, sphere.faces, 300)
+    assert len(faces) <= 300
+    assert (faces[:, 0] != faces[:, 1]).all() and (faces[:, 1] != faces[:, 2]).all()
+    assert len(np.unique(np.sort(faces, axis=1), axis=0)) == len(faces)
+    assert faces.max() < len(vertices)
+
+
+def test_qmesh_roundtrip_within_quantization_step():
+    mesh = trimesh.creation.icosphere(subdivisions=3, radius=25)
+    data = encode_qmesh(mesh)
+    vertices, faces = decode_qmesh(data)
+    assert np.array_equal(faces, mesh.faces)
+    assert np.abs(vertices - mesh.vertices).max() <= 50 / 65535
+    assert len(data) < len(trimesh.exchange.stl.export_stl(mesh)) / 5
+    with pytest.raises(ValueError):
+        decode_qmesh(b"STL!" + data[4:])
+
+
+def test_qmesh_bits_pick_the_position_type():
+    mesh = trimesh.creation.icosphere(subdivisions=3, radius=25)
+    vertices, faces = decode_qmesh(encode_qmesh(mesh, bits=8))
+    assert np.array_equal(faces, mesh.faces)
+    assert np.abs(vertices - mesh.vertices).max() <= 50 / 255
+    for bits in (0, 17, 32):
+        with pytest.raises(ValueError):
+            encode_qmesh(mesh, bits=bits)
+
+
+def test_unknown_format_is_rejected():
+    assert select_formats(None) == ["stl"]
+    assert select_formats(["qmesh", "glb", "qmesh"]) == ["glb", "qmesh"]
+    with pytest.raises(ValueError):
+        select_formats(["obj"])
+
+
+def test_preview_formats_without_full_stl(fake_openscad, render_cache):
+    data, status = asyncio.run(render_shots(fork_prefs(), views=[0, 3], resolution=64, formats=["glb", "qmesh"]))
+    assert status == "miss"
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    assert zf.namelist() == ["view_00.png", "view_03.png", "model.glb", "model.qmesh"]
+    vertices, faces = decode_qmesh(zf.read("model.qmesh"))
+    assert len(faces) == 12 and np.allclose(vertices.min(axis=0), 0, atol=1e-4)
+    assert trimesh.load(io.BytesIO(zf.read("model.glb")), file_type="glb", force="mesh").faces.shape == (12, 3)
+
+    # The disk tier lists the preview meshes too, and the full STL only when asked for
+    render_cache._memory.clear()
+    render_cache._memory_total = 0
+    data, status = asyncio.run(render_shots(fork_prefs(), views=[0, 3], resolution=64, formats=["glb", "qmesh"]))
+    assert status == "hit"
+    assert zipfile.ZipFile(io.BytesIO(data)).namelist() == ["view_00.png", "view_03.png", "model.glb", "model.qmesh"]
+    data, _ = asyncio.run(render_shots(fork_prefs(), views=[0], resolution=64, formats=["stl", "qmesh"]))
+    assert zipfile.ZipFile(io.BytesIO(data)).namelist() == ["view_00.png", "model.qmesh", "model.stl"]
@@ -0,0 +1,42 @@
+import struct
+import zlib
+
+import numpy as np
+import trimesh
+
+from services.mesh_render import SoftwareRenderer, encode_png
+from services.openscad_render import get_cube_view_dirs, render_views
+
+
+def decode_png(data):
+    # Just enough of a PNG reader for the files encode_png writes
+    width, height = struct.unpack(">II", data[16:24])
+    idat = data[data.index(b"IDAT") + 4:data.index(b"IEND") - 8]
+    raw = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, width * 3 + 1)
+    return raw[:, 1:].reshape(height, width, 3)
+
+
+def test_png_roundtrip():
+    img = np.random.randint(0, 255, (7, 5, 3), dtype=np.uint8)
+    assert np.array_equal(decode_png(encode_png(img)), img)
+
+
+def test_box_silhouette_matches_its_shape():
+    renderer = SoftwareRenderer.from_mesh(trimesh.creation.box((10, 20, 5)))
+    top = renderer.render([0, 0, 1], resolution=128)
+    covered = (top != 255).any(axis=2)
+    rows, cols = np.nonzero(covered)
+    # Looking down z with y up on screen, the box is twice as tall as it is wide
+    height, width = np.ptp(rows) + 1, np.ptp(cols) + 1
+    assert abs(height / width - 2) < 0.1
+    # The far side of a closed box is hidden by the near side
+    assert len(np.unique(top[covered].reshape(-1, 3), axis=0)) == 1
+
+
+def test_renders_requested_views_only(tmp_path):
+    stl = tmp_path / "cube.stl"
+    trimesh.creation.box((1, 1, 1)).export(str(stl))
+    views = render_views(str(stl), resolution=64, views=[6, 0, 6])
+    assert [name for name, _ in views] == ["view_00.png", "view_06.png"]
+    assert decode_png(views[1][1]).shape == (64, 64, 3)
+    assert len(render_views(str(stl), resolution=32)) == len(get_cube_view_dirs())
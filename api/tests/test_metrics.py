@@ -0,0 +1,114 @@
+import asyncio
+import json
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routers.metrics as metrics_router
+import services.metrics as metrics
+from routers.openscad_render import router as render_router
+from services.metrics import Histogram, ServerTimingMiddleware, server_timing, span
+from test_chat_stream import REPLY, make_client
+from test_render_cache import fork_prefs
+
+
+def stage_count(text: str, stage: str) -> int:
+    m = re.search(rf'^foundry_stage_duration_seconds_count{{stage="{stage}"}} (\d+)$', text, re.M)
+    return int(m.group(1)) if m else 0
+
+
+def test_histogram_exposition_is_cumulative():
+    h = Histogram("test_seconds", "Test.", labels=("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        h.observe(value, "a")
+    lines = h.exposition()
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="1"} 3' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="a"} 4' in lines
+
+
+def test_hooks_get_spans_and_cannot_break_requests():
+    seen = []
+
+    def broken(stage, seconds, attrs):
+        raise RuntimeError("exporter down")
+
+    def good(stage, seconds, attrs):
+        seen.append((stage, attrs))
+
+    metrics.add_hook(broken)
+    metrics.add_hook(good)
+    try:
+        with span("unit_test", answer=42) as attrs:
+            attrs["extra"] = True
+    finally:
+        metrics.remove_hook(broken)
+        metrics.remove_hook(good)
+    assert seen == [("unit_test", {"answer": 42, "extra": True})]
+
+
+def test_server_timing_sums_repeated_stages():
+    header = server_timing([("llm", 1.2), ("view_render", 0.01), ("view_render", 0.03)])
+    assert header == "llm;dur=1200.0, view_render;dur=40.0;desc=x2"
+
+
+def test_chat_request_gets_server_timing_and_metrics():
+    client = make_client([REPLY])
+    client.app.add_middleware(ServerTimingMiddleware)
+    client.app.include_router(metrics_router.router)
+    resp = client.post("/chat/ask_for_object", json={"request_text": "a cube", "use_cache": False})
+    stages = [entry.split(";")[0] for entry in resp.headers["Server-Timing"].split(", ")]
+    assert stages[:6] == ["retrieve", "llm", "parse", "attach_library", "flatten", "encode"] and stages[-1] == "total"
+    text = client.get("/metrics").text
+    assert stage_count(text, "llm") >= 1
+    assert re.search(r'foundry_http_request_duration_seconds_count\{method="POST",route="/chat/ask_for_object",status="200"\} \d+', text)
+
+
+def test_render_stages_are_recorded(fake_openscad, render_cache):
+    app = FastAPI()
+    app.include_router(render_router)
+    app.include_router(metrics_router.router)
+    app.add_middleware(ServerTimingMiddleware)
+    client = TestClient(app)
+    before = client.get("/metrics").text
+    resp = client.post("/openscad_render/rendershots_zip/?views=0&views=1&resolution=64", json=fork_prefs().model_dump())
+    assert resp.status_code == 200
+    assert "openscad;dur=" in resp.headers["Server-Timing"]
+    after = client.get("/metrics").text
+    for stage, runs in (("openscad", 1), ("stl_load", 1), ("view_render", 2), ("zip", 1), ("render_queue", 1)):
+        assert stage_count(after, stage) - stage_count(before, stage) == runs, stage
+    assert "foundry_openscad_stderr_bytes_count" in after
+    assert "foundry_render_queue_depth 0" in after
+
+
+def test_streamed_views_follow_in_a_trailer(fake_openscad, render_cache):
+    # The zip streams while views render, so their spans can only arrive after the headers
+    app = FastAPI()
+    app.include_router(render_router)
+    app = ServerTimingMiddleware(app)
+    body = json.dumps(fork_prefs().model_dump()).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/openscad_render/rendershots_zip/", "raw_path": b"/openscad_render/rendershots_zip/",
+        "query_string": b"views=0&views=1&resolution=64", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("test", 1), "server": ("test", 80), "extensions": {"http.response.trailers": {}},
+    }
+    messages = []
+
+    async def receive():
+        if not messages:
+            messages.append(None)
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # the client never disconnects
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, trailers = messages[1], messages[-1]
+    assert start["trailers"] and (b"trailer", b"server-timing") in start["headers"]
+    assert trailers["type"] == "http.response.trailers"
+    assert "view_render;dur=" in dict(trailers["headers"])[b"server-timing"].decode()
@@ -0,0 +1,109 @@
+import asyncio
+import base64
+import gzip
+import json
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routers.payloads import router
+from services.payload_store import PayloadStore, get_payload_store
+from test_chat_stream import REPLY, make_client
+from test_render_cache import fork_prefs
+
+
+def test_identical_payloads_are_stored_once():
+    store = PayloadStore(":memory:")
+    payload = fork_prefs().to_payload()
+    pid = store.put(payload)
+    assert len(pid) == 12
+    assert store.put(json.loads(json.dumps(payload))) == pid
+    assert store.stats()["payloads"] == 1
+    assert store.get_payload(pid) == payload
+    other = fork_prefs()
+    other.color = "#ff0000"
+    assert store.put(other.to_payload()) != pid
+
+
+def test_redirect_and_json_endpoints():
+    store = PayloadStore(":memory:")
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_payload_store] = lambda: store
+    client = TestClient(app)
+    prefs = fork_prefs()
+    link = client.post("/p", json=prefs.model_dump()).json()
+    assert link["short_url"] == f"/p/{link['id']}"
+    resp = client.get(link["short_url"], follow_redirects=False)
+    assert resp.status_code == 302
+    location = resp.headers["location"]
+    assert location.startswith("https://ochafik.com/openscad2/#")
+    encoded = location.split("#", 1)[1]
+    assert json.loads(gzip.decompress(base64.b64decode(encoded))) == prefs.to_payload()
+    assert client.get(f"/p/{link['id']}/json").json() == prefs.to_payload()
+    assert client.get("/p/doesnotexist").status_code == 404
+
+
+def test_eviction_by_age_and_size(tmp_path):
+    store = PayloadStore(str(tmp_path / "p.sqlite3"), ttl=60)
+    old = store.put({"n": 0})
+    store._db.execute("UPDATE payloads SET accessed_at = ? WHERE id = ?", (time.time() - 120, old))
+    assert store.get(old) is None
+
+    size = len(gzip.compress(json.dumps({"n": 1}).encode()))
+    store = PayloadStore(str(tmp_path / "q.sqlite3"), max_bytes=size * 2 + 10)
+    first = store.put({"n": 1})
+    second = store.put({"n": 2})
+    store._db.execute("UPDATE payloads SET accessed_at = accessed_at - 10 WHERE id = ?", (first,))
+    store.put({"n": 3})
+    assert store.get(first) is None
+    assert store.get(second) is not None
+
+
+def test_chat_response_carries_short_link():
+    store = PayloadStore(":memory:")
+    client = make_client([REPLY, REPLY], store=store)
+    full = client.post("/chat/ask_for_object", json={"request_text": "a cube"}).json()
+    assert full["encoded_url"].startswith("https://ochafik.com/openscad2/#")
+    assert full["short_url"].startswith("/p/")
+    short = client.post("/chat/ask_for_object", json={"request_text": "a cube", "inline_url": False}).json()
+    assert short["encoded_url"] == short["short_url"] == full["short_url"]
+    assert store.stats()["payloads"] == 1
+
+
+def on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class RecordingStore(PayloadStore):
+    # Notes whether each SQLite call ran on the event loop
+    def __init__(self):
+        super().__init__(":memory:")
+        self.calls = []
+
+    def put(self, payload):
+        self.calls.append(("put", on_event_loop()))
+        return super().put(payload)
+
+    def get(self, pid):
+        self.calls.append(("get", on_event_loop()))
+        return super().get(pid)
+
+
+def test_store_calls_stay_off_the_event_loop():
+    store = RecordingStore()
+    client = make_client([REPLY], store=store)
+    pid = client.post("/chat/ask_for_object", json={"request_text": "a cube"}).json()["short_url"].split("/")[-1]
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_payload_store] = lambda: store
+    client = TestClient(app)
+    client.post("/p", json=fork_prefs().model_dump())
+    client.get(f"/p/{pid}", follow_redirects=False)
+    client.get(f"/p/{pid}/json")
+    assert store.calls == [("put", False), ("put", False), ("get", False), ("get", False)]
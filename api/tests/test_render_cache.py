@@ -0,0 +1,53 @@
+import asyncio
+import io
+import zipfile
+
+from models.models import PlaygroundPreferences, SourceFile
+from services.openscad_render import render_shots
+from services.render_cache import RenderCache, render_key
+import services.openscad_render as render
+
+
+def fork_prefs(order=1):
+    files = [
+        SourceFile(path="/main.scad", content="use <handle.scad>;\nhandle();"),
+        SourceFile(path="handle.scad", content="module handle() { cube(1); }"),
+    ]
+    return PlaygroundPreferences(sources=files[::order], active_path="main.scad")
+
+
+def test_key_ignores_source_order_and_path_spelling():
+    assert render_key(fork_prefs(), {"r": 1}) == render_key(fork_prefs(-1), {"r": 1})
+    assert render_key(fork_prefs(), {"r": 1}) != render_key(fork_prefs(), {"r": 2})
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    stl = tmp_path / "in.stl"
+    stl.write_bytes(b"x" * 100)
+    cache = RenderCache(root=str(tmp_path / "c"), max_bytes=250, memory_bytes=0)
+    cache.put_files("a", str(stl), [])
+    cache.put_files("b", str(stl), [])
+    assert cache.get_files("a") is not None  # a is now more recent than b
+    cache.put_files("c", str(stl), [])
+    assert cache.get_files("b") is None
+    assert cache.get_files("a") is not None
+    assert cache.stats()["evictions"] == 1
+    # A fresh process picks the surviving entries back up
+    assert RenderCache(root=str(tmp_path / "c"), max_bytes=250).stats()["disk_entries"] == 2
+
+
+def test_hit_skips_openscad(fake_openscad, render_cache, monkeypatch):
+    data, status = asyncio.run(render_shots(fork_prefs(), views=[0]))
+    assert status == "miss"
+    assert sorted(zipfile.ZipFile(io.BytesIO(data)).namelist()) == ["model.stl", "view_00.png"]
+
+    monkeypatch.setattr(render, "OPENSCAD_BIN", "/nonexistent/openscad")
+    _, status = asyncio.run(render_shots(fork_prefs(-1), views=[0]))
+    assert status == "hit"
+
+    render_cache._memory.clear()
+    render_cache._memory_total = 0
+    data, status = asyncio.run(render_shots(fork_prefs(), views=[0]))
+    assert status == "hit"
+    assert render_cache.stats()["hits_disk"] == 1
+    assert "model.stl" in zipfile.ZipFile(io.BytesIO(data)).namelist()
@@ -0,0 +1,133 @@
+import asyncio
+import io
+import time
+import zipfile
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from models.models import SourceFile
+from routers.openscad_render import router
+from services.render_jobs import JobManager, get_job_manager
+from test_render_cache import fork_prefs
+
+
+def make_client(jobs: JobManager) -> TestClient:
+    @asynccontextmanager
+    async def lifespan(app):
+        await jobs.start()
+        yield
+        await jobs.stop()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    app.dependency_overrides[get_job_manager] = lambda: jobs
+    return TestClient(app)
+
+
+def wait_for(client, job_id, statuses=("done", "failed", "cancelled"), timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/openscad_render/jobs/{job_id}").json()
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job stuck in {job['status']}")
+
+
+def test_job_runs_and_serves_artifacts(fake_openscad, render_cache, tmp_path):
+    jobs = JobManager(root=str(tmp_path / "jobs"))
+    with make_client(jobs) as client:
+        resp = client.post("/openscad_render/jobs?views=0&views=5&resolution=64", json=fork_prefs().model_dump())
+        assert resp.status_code == 202
+        job = wait_for(client, resp.json()["job_id"])
+        assert job["status"] == "done" and job["progress"] == 1.0
+        assert job["artifacts"] == ["view_00.png", "view_05.png", "model.stl"]
+        base = f"/openscad_render/jobs/{job['job_id']}"
+        assert client.get(f"{base}/stl").content.startswith(b"solid cube")
+        assert client.get(f"{base}/views/5").content.startswith(b"\x89PNG")
+        assert client.get(f"{base}/views/1").status_code == 404
+        zf = zipfile.ZipFile(io.BytesIO(client.get(f"{base}/zip").content))
+        assert zf.namelist() == job["artifacts"]
+        assert client.get("/openscad_render/jobs/nope").status_code == 404
+
+
+def test_failed_compile_keeps_stderr(fake_openscad, render_cache, tmp_path):
+    jobs = JobManager(root=str(tmp_path / "jobs"))
+    prefs = fork_prefs()
+    prefs.sources[0] = SourceFile(path="/main.scad", content="error();")
+    with make_client(jobs) as client:
+        job_id = client.post("/openscad_render/jobs", json=prefs.model_dump()).json()["job_id"]
+        job = wait_for(client, job_id)
+        assert job["status"] == "failed" and job["error"] == "OpenSCAD failed"
+        assert job["stderr"]
+        assert client.get(f"/openscad_render/jobs/{job_id}/stl").status_code == 409
+
+
+def test_cancel_running_job(fake_openscad, render_cache, tmp_path):
+    jobs = JobManager(root=str(tmp_path / "jobs"))
+    prefs = fork_prefs()
+    prefs.sources[0] = SourceFile(path="/main.scad", content="sleep(5);")
+    with make_client(jobs) as client:
+        job_id = client.post("/openscad_render/jobs", json=prefs.model_dump()).json()["job_id"]
+        wait_for(client, job_id, statuses=("running",))
+        started = time.time()
+        assert client.delete(f"/openscad_render/jobs/{job_id}").json()["status"] == "cancelled"
+        time.sleep(0.2)
+        assert wait_for(client, job_id)["status"] == "cancelled"
+        assert time.time() - started < 3
+
+
+def test_job_finishing_after_cancel_stays_cancelled(fake_openscad, render_cache, tmp_path):
+    jobs = JobManager(root=str(tmp_path / "jobs"))
+    job_id = jobs.submit(fork_prefs(), resolution=64, views=[0])
+    claimed = jobs._claim()
+    # Cancelled while its task was past the point where cancelling it interrupts anything
+    assert jobs.cancel(job_id)["status"] == "cancelled"
+    asyncio.run(jobs._run(*claimed))
+    assert jobs.get(job_id)["status"] == "cancelled"
+    assert jobs.artifacts(job_id) == []
+
+
+def test_job_takes_the_rendershots_options(fake_openscad, render_cache, tmp_path):
+    jobs = JobManager(root=str(tmp_path / "jobs"))
+    with make_client(jobs) as client:
+        prefs = fork_prefs().model_dump()
+        resp = client.post("/openscad_render/jobs?views=0&resolution=64&face_budget=0&formats=glb", json=prefs)
+        job = wait_for(client, resp.json()["job_id"])
+        assert job["status"] == "done" and job["artifacts"] == ["view_00.png", "model.glb"]
+        assert jobs.get(job["job_id"])["options"]["face_budget"] == 0
+        assert client.post("/openscad_render/jobs?formats=obj", json=prefs).status_code == 400
+
+
+def test_jobs_survive_a_restart(fake_openscad, render_cache, tmp_path):
+    root = str(tmp_path / "jobs")
+    before = JobManager(root=root)
+    interrupted = before.submit(fork_prefs(), resolution=64, views=[0])
+    queued = before.submit(fork_prefs(), resolution=64, views=[1])
+    before._claim()  # the process died while the first job was running
+    assert before.get(interrupted)["status"] == "running"
+
+    jobs = JobManager(root=root)
+    with make_client(jobs) as client:
+        assert wait_for(client, interrupted)["status"] == "done"
+        assert wait_for(client, queued)["status"] == "done"
+
+
+def test_purge_drops_old_finished_jobs(fake_openscad, render_cache, tmp_path):
+    jobs = JobManager(root=str(tmp_path / "jobs"), retention=60)
+
+    async def scenario():
+        await jobs.start()
+        job_id = jobs.submit(fork_prefs(), resolution=64, views=[0])
+        while jobs.get(job_id)["status"] != "done":
+            await asyncio.sleep(0.05)
+        await jobs.stop()
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    assert jobs.purge() == 0
+    assert jobs.purge(now=time.time() + 120) == 1
+    assert jobs.get(job_id) is None
+    assert jobs.artifacts(job_id) == []
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from models.models import PlaygroundPreferences, SourceFile
+from services.openscad_render import (
+    RenderPool,
+    RenderQueueFull,
+    RenderTimeout,
+    OpenSCADError,
+    compile_stl,
+)
+
+
+def prefs_for(content):
+    return PlaygroundPreferences(sources=[SourceFile(path="/main.scad", content=content)])
+
+
+def test_pool_rejects_when_queue_full():
+    async def scenario():
+        pool = RenderPool(workers=1, queue_size=1)
+        release = asyncio.Event()
+
+        async def job():
+            await release.wait()
+            return "done"
+
+        running = asyncio.ensure_future(pool.run(job()))
+        queued = asyncio.ensure_future(pool.run(job()))
+        await asyncio.sleep(0)
+        assert pool.stats()["running"] == 1
+        assert pool.stats()["queue_depth"] == 1
+        with pytest.raises(RenderQueueFull):
+            await pool.run(job())
+        release.set()
+        assert await running == "done"
+        assert await queued == "done"
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["completed"] == 2
+    assert stats["rejected"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_compile_timeout_kills_openscad(fake_openscad, tmp_path):
+    with pytest.raises(RenderTimeout):
+        asyncio.run(compile_stl(prefs_for("sleep(5);"), str(tmp_path), timeout=0.3))
+
+
+def test_compile_error_carries_stderr(fake_openscad, tmp_path):
+    with pytest.raises(OpenSCADError) as exc:
+        asyncio.run(compile_stl(prefs_for("error();"), str(tmp_path)))
+    assert "Parser error" in exc.value.stderr
+
+
+def test_event_loop_stays_responsive_during_compile(fake_openscad, tmp_path):
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        t = asyncio.ensure_future(ticker())
+        await compile_stl(prefs_for("sleep(0.3); cube(1);"), str(tmp_path))
+        t.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) > 5
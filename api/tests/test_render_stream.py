@@ -0,0 +1,100 @@
+import asyncio
+import io
+import os
+import zipfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.openscad_render as render
+from routers.openscad_render import router
+from services.openscad_render import open_shots, render_pool, render_shots
+from test_render_cache import fork_prefs
+
+
+def test_endpoint_streams_a_valid_zip(fake_openscad, render_cache):
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    body = fork_prefs().model_dump()
+    with client.stream("POST", "/openscad_render/rendershots_zip/?views=0&views=3&resolution=64", json=body) as resp:
+        assert resp.headers["X-Render-Cache"] == "miss"
+        data = b"".join(resp.iter_bytes())
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    assert zf.namelist() == ["view_00.png", "view_03.png", "model.stl"]
+    assert zf.getinfo("view_00.png").compress_type == zipfile.ZIP_STORED
+    assert zf.read("model.stl").startswith(b"solid cube")
+    again = client.post("/openscad_render/rendershots_zip/?views=0&views=3&resolution=64", json=body)
+    assert again.headers["X-Render-Cache"] == "hit"
+    assert again.content == data
+
+
+def test_stl_is_read_in_chunks(fake_openscad, render_cache, monkeypatch):
+    monkeypatch.setattr(render, "STREAM_CHUNK_BYTES", 256)
+    reads = []
+
+    async def scenario():
+        stream = await open_shots(fork_prefs(), views=[0], resolution=32)
+        chunks = []
+        async for chunk in stream.chunks():
+            if stream.stl_file is not None and not reads:
+                original = stream.stl_file.read
+                stream.stl_file.read = lambda n: reads.append(n) or original(n)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    data = asyncio.run(scenario())
+    assert len(reads) > 3 and set(reads) == {256}
+    assert zipfile.ZipFile(io.BytesIO(data)).read("model.stl").startswith(b"solid cube")
+
+
+def test_identical_concurrent_misses_compile_once(fake_openscad, render_cache):
+    async def scenario():
+        before = render_pool.stats()["completed"]
+        results = await asyncio.gather(*[render_shots(fork_prefs(), views=[1], resolution=32) for _ in range(3)])
+        return results, render_pool.stats()["completed"] - before
+
+    results, compiles = asyncio.run(scenario())
+    assert compiles == 1
+    assert [status for _, status in results] == ["miss", "hit", "hit"]
+    assert len({data for data, _ in results}) == 1
+
+
+def test_unread_stream_holds_back_the_render_and_is_released(fake_openscad, render_cache):
+    async def scenario():
+        stream = await open_shots(fork_prefs(), views=list(range(8)), resolution=32)
+        # Nobody reads: the render stops once the queue is full, each view already in the cache entry
+        await asyncio.sleep(1)
+        task = stream.producer["task"]
+        [entry] = [name for name in os.listdir(render_cache.root) if ".tmp-" in name]
+        written = len(os.listdir(os.path.join(render_cache.root, entry)))
+        assert not task.done() and written <= render.STREAM_QUEUE_ITEMS + 1
+        assert stream.producer["queue"].qsize() == render.STREAM_QUEUE_ITEMS
+        await stream.aclose()
+        assert task.cancelled() and render_pool.running == 0 and not render._in_flight
+        return os.listdir(render_cache.root)
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_failed_workspace_frees_the_worker(fake_openscad, render_cache, monkeypatch):
+    pool = render.get_workspace_pool()
+    acquire = pool.acquire
+
+    def full():
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(pool, "acquire", full)
+
+    async def scenario():
+        try:
+            await open_shots(fork_prefs(), views=[2], resolution=32)
+        except OSError:
+            pass
+        assert render_pool.running == 0 and not render._in_flight
+        monkeypatch.setattr(pool, "acquire", acquire)
+        # The next request for the same key neither waits forever nor finds the worker taken
+        return await asyncio.wait_for(render_shots(fork_prefs(), views=[2], resolution=32), timeout=10)
+
+    _, status = asyncio.run(scenario())
+    assert status == "miss"
@@ -0,0 +1,107 @@
+import base64
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.openscad_render as render
+from models.models import PlaygroundPreferences, SourceFile
+from routers.openscad_render import router
+from services.render_sweep import define_args, expand_sweep
+from test_render_cache import fork_prefs
+
+
+def test_grid_times_variants():
+    configs = expand_sweep({"w": [1, 2], "h": [5]}, [{"label": "a"}, {"label": "b"}])
+    assert configs == [
+        {"label": "a", "h": 5, "w": 1}, {"label": "a", "h": 5, "w": 2},
+        {"label": "b", "h": 5, "w": 1}, {"label": "b", "h": 5, "w": 2},
+    ]
+    assert expand_sweep() == [{}]
+    with pytest.raises(ValueError):
+        expand_sweep({"x; y": [1]})
+    with pytest.raises(ValueError):
+        expand_sweep({"n": list(range(1000))})
+
+
+def test_defines_are_openscad_literals():
+    assert define_args({"w": 20.0, "on": True, "name": 'a "b"', "r": 1.5}) == [
+        "-D", 'name="a \\"b\\""', "-D", "on=true", "-D", "r=1.5", "-D", "w=20",
+    ]
+    assert define_args({"w": 20}) == define_args({"w": 20.0})
+
+
+def read_lines(resp):
+    return [json.loads(line) for line in resp.iter_lines() if line]
+
+
+def test_sweep_streams_deduplicated_variants(fake_openscad, render_cache, monkeypatch):
+    compiles = []
+    original = render.run_openscad
+
+    async def recording(args, cwd, timeout=render.RENDER_TIMEOUT, progress=None):
+        compiles.append([a for a in args if "=" in a])
+        return await original(args, cwd, timeout, progress)
+
+    monkeypatch.setattr(render, "run_openscad", recording)
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    body = {
+        "prefs": fork_prefs().model_dump(),
+        "grid": {"length": [10, 20]},
+        "variants": [{"holes": 2}, {"holes": 2.0}],
+    }
+    with client.stream("POST", "/openscad_render/sweep/?resolution=64", json=body) as resp:
+        assert resp.headers["content-type"] == "application/x-ndjson"
+        assert resp.headers["X-Sweep-Variants"] == "4"
+        results = read_lines(resp)
+
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3]
+    assert sorted(compiles) == [["holes=2", "length=10"], ["holes=2", "length=20"]]
+    by_index = {r["index"]: r for r in results}
+    assert by_index[2]["duplicate_of"] == 0 and by_index[3]["duplicate_of"] == 1
+    first = by_index[0]
+    assert first["status"] == "done" and first["cache"] == "miss"
+    assert first["stats"]["volume"] == pytest.approx(1)
+    assert base64.b64decode(first["thumbnail"]).startswith(b"\x89PNG")
+    assert base64.b64decode(first["stl"]).startswith(b"solid cube")
+
+    # A second sweep is served from the render cache
+    resp = client.post("/openscad_render/sweep/?resolution=64&include_stl=false", json=body)
+    results = [json.loads(line) for line in resp.text.splitlines()]
+    assert {r["cache"] for r in results} == {"hit"} and len(compiles) == 2
+    assert "stl" not in results[0]
+
+
+def test_failed_variants_report_stderr(fake_openscad, render_cache):
+    app = FastAPI()
+    app.include_router(router)
+    prefs = PlaygroundPreferences(sources=[SourceFile(path="/main.scad", content="error")])
+    resp = TestClient(app).post(
+        "/openscad_render/sweep/", json={"prefs": prefs.model_dump(), "grid": {"n": [1, 2]}}
+    )
+    results = [json.loads(line) for line in resp.text.splitlines()]
+    assert [r["status"] for r in results] == ["error", "error"]
+    assert "Parser error" in results[0]["stderr"]
+
+
+def test_every_variant_gets_a_line_whatever_fails(fake_openscad, render_cache, monkeypatch):
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    prefs = PlaygroundPreferences(sources=[SourceFile(path="/../main.scad", content="cube(1);")],
+                                  active_path="/../main.scad")
+    resp = client.post("/openscad_render/sweep/", json={"prefs": prefs.model_dump(), "grid": {"n": [1, 2]}})
+    results = [json.loads(line) for line in resp.text.splitlines()]
+    assert sorted(r["index"] for r in results) == [0, 1]
+    assert all(r["status"] == "error" and "Invalid source path" in r["error"] for r in results)
+
+    def broken(stl_path, resolution, color):
+        raise RuntimeError("mesh is empty")
+
+    monkeypatch.setattr("services.render_sweep.variant_artifacts", broken)
+    resp = client.post("/openscad_render/sweep/", json={"prefs": fork_prefs().model_dump(), "grid": {"n": [1, 2]}})
+    results = [json.loads(line) for line in resp.text.splitlines()]
+    assert len(results) == 2 and {r["error"] for r in results} == {"Render failed: mesh is empty"}
@@ -0,0 +1,96 @@
+import time
+
+from services.response_cache import MemoryBackend, ResponseCache, SQLiteBackend
+from test_chat_stream import REPLY, make_client
+
+
+def test_exact_tier_normalizes_case_whitespace_and_punctuation():
+    cache = ResponseCache(MemoryBackend())
+    cache.set("Make a cube", {"v": 1})
+    assert cache.get("  make a CUBE!! ") == ({"v": 1}, "exact")
+    assert cache.get("make a sphere") == (None, None)
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_exact_tier_keeps_other_scripts_signs_and_fractions():
+    cache = ResponseCache(MemoryBackend())
+    cache.set("做一个立方体", {"v": "cube"})
+    cache.set("offset 5 mm", {"v": 5})
+    cache.set("a 1 2 inch bolt", {"v": "1 2"})
+    assert cache.get("做一个立方体！") == ({"v": "cube"}, "exact")
+    assert cache.get("做一个球") == (None, None)
+    assert cache.get("Offset 5 mm.") == ({"v": 5}, "exact")
+    assert cache.get("offset -5 mm") == (None, None)
+    assert cache.get("a 1/2 inch bolt") == (None, None)
+
+
+def test_similar_tier_requires_identical_numbers():
+    cache = ResponseCache(MemoryBackend(), similarity=0.7)
+    cache.set("simple gear with 20 teeth", {"teeth": 20})
+    assert cache.get("a simple gear with 20 teeth") == ({"teeth": 20}, "similar")
+    assert cache.get("a simple gear with 21 teeth") == (None, None)
+    assert cache.get("simple gear with 20 teeth") == ({"teeth": 20}, "exact")
+    cache.set("shift the gear by 5 mm", {"shift": 5})
+    assert cache.get("shift the gear by -5 mm") == (None, None)
+
+
+def test_ttl_and_lru_eviction():
+    cache = ResponseCache(MemoryBackend(max_entries=2), ttl=60)
+    cache.set("a", {"v": "a"})
+    cache.set("b", {"v": "b"})
+    cache.get("a")
+    cache.set("c", {"v": "c"})
+    assert cache.get("b") == (None, None)
+    assert cache.get("a")[0] == {"v": "a"}
+    cache.ttl = -1
+    assert cache.get("a") == (None, None)
+
+
+def test_sqlite_backend_persists_and_evicts(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(SQLiteBackend(path, max_entries=2))
+    cache.set("a", {"v": "a"})
+    time.sleep(0.01)
+    cache.set("b", {"v": "b"})
+    time.sleep(0.01)
+    cache.set("c", {"v": "c"})
+    reopened = ResponseCache(SQLiteBackend(path, max_entries=2), similarity=0.5)
+    assert reopened.get("a") == (None, None)
+    assert reopened.get("c") == ({"v": "c"}, "exact")
+    assert reopened.get("b!") == ({"v": "b"}, "exact")
+
+
+def test_sqlite_lookups_batch_their_lru_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr("services.response_cache.TOUCH_BATCH", 2)
+    backend = SQLiteBackend(str(tmp_path / "responses.sqlite3"), max_entries=2)
+    cache = ResponseCache(backend)
+    cache.set("a", {"v": "a"})
+    time.sleep(0.01)
+    cache.set("b", {"v": "b"})
+    changes = backend._db.total_changes
+    # Misses and the first hits write nothing
+    assert cache.get("nothing") == (None, None)
+    assert cache.get("a")[0] == {"v": "a"}
+    assert backend._db.total_changes == changes
+    # ...but the next set() writes them before it evicts, so "a" is kept as recently used
+    cache.set("c", {"v": "c"})
+    assert cache.get("b") == (None, None) and cache.get("a")[0] == {"v": "a"}
+    # A batch of distinct keys is written at once
+    changes = backend._db.total_changes
+    cache.get("c")
+    assert not backend._touched and backend._db.total_changes == changes + 2
+
+
+def test_endpoint_serves_hits_and_honours_opt_out():
+    # Only two LLM answers are scripted, so a third LLM call would fail
+    client = make_client([REPLY, REPLY])
+    first = client.post("/chat/ask_for_object", json={"request_text": "a cube"})
+    second = client.post("/chat/ask_for_object", json={"request_text": "A cube."})
+    bypass = client.post("/chat/ask_for_object", json={"request_text": "a cube", "use_cache": False})
+    assert [r.headers["X-Response-Cache"] for r in (first, second, bypass)] == ["miss", "exact", "bypass"]
+    # Same answer, but each one starts its own edit session
+    a, b = first.json(), second.json()
+    assert a.pop("session_id") != b.pop("session_id")
+    assert a == b
+    stats = client.get("/chat/cache_stats").json()
+    assert stats["exact_hits"] == 1 and stats["misses"] == 1
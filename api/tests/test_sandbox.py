@@ -0,0 +1,127 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.openscad_render as render
+import services.sandbox as sandbox
+from models.models import PlaygroundPreferences, SourceFile
+from routers.openscad_render import router
+from services.sandbox import WorkspacePool, exit_reason, run_sandboxed, workspace_path
+
+
+@pytest.mark.parametrize("path", ["../evil.scad", "/lib/../../evil.scad", "/", "a\0.scad"])
+def test_paths_outside_the_workspace_are_rejected(tmp_path, path):
+    with pytest.raises(ValueError):
+        workspace_path(str(tmp_path), path)
+
+
+def test_paths_inside_the_workspace(tmp_path):
+    root = str(tmp_path)
+    assert workspace_path(root, "/lib/gear.scad") == os.path.join(root, "lib", "gear.scad")
+    assert workspace_path(root, "lib/../main.scad") == os.path.join(root, "main.scad")
+
+
+def test_render_rejects_escaping_paths(fake_openscad, render_cache):
+    app = FastAPI()
+    app.include_router(router)
+    prefs = PlaygroundPreferences(sources=[SourceFile(path="/../../main.scad", content="cube(1);")],
+                                  active_path="/../../main.scad")
+    resp = TestClient(app).post("/openscad_render/rendershots_zip/", json=prefs.model_dump())
+    assert resp.status_code == 400 and "Invalid source path" in resp.json()["detail"]
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_usage_of_each_run(tmp_path):
+    lines = []
+    code, stderr, usage = asyncio.run(run_sandboxed(
+        python("import sys\nx = bytearray(64 * 1024 * 1024)\nsys.stderr.write('a\\nb')"), str(tmp_path), 10, lines.append
+    ))
+    assert code == 0 and stderr == b"a\nb" and lines == ["a", "b"]
+    assert usage["max_rss_bytes"] > 64 * 1024 * 1024 and usage["cpu_seconds"] > 0
+
+
+@pytest.mark.parametrize("prlimit", [sandbox.PRLIMIT_BIN, ""])
+def test_memory_limit(tmp_path, monkeypatch, prlimit):
+    # Through the prlimit tool, or set on the running child where it is missing
+    monkeypatch.setattr(sandbox, "PRLIMIT_BIN", prlimit)
+    monkeypatch.setattr(sandbox, "OPENSCAD_MEMORY_MB", 256)
+    code, stderr, _ = asyncio.run(run_sandboxed(python("x = bytearray(512 * 1024 * 1024)"), str(tmp_path), 10))
+    assert code != 0 and b"MemoryError" in stderr
+
+
+def test_output_size_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(sandbox, "OPENSCAD_OUTPUT_MB", 1)
+    code, stderr, _ = asyncio.run(run_sandboxed(
+        python("open('out.stl', 'wb').write(bytes(2 * 1024 * 1024))"), str(tmp_path), 10
+    ))
+    assert code != 0 and b"File too large" in stderr
+    assert os.path.getsize(tmp_path / "out.stl") <= 1024 * 1024
+
+
+def test_cpu_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(sandbox, "OPENSCAD_CPU_SECONDS", 1)
+    code, _, usage = asyncio.run(run_sandboxed(python("while True: pass"), str(tmp_path), 10))
+    assert "CPU time limit exceeded" in exit_reason(code)
+    assert 0.9 < usage["cpu_seconds"] < 3
+
+
+def test_stderr_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(sandbox, "OPENSCAD_STDERR_KB", 1)
+    lines = []
+    code, stderr, _ = asyncio.run(run_sandboxed(
+        python("import sys\nfor i in range(20000): sys.stderr.write(f'line {i}\\n')"), str(tmp_path), 10, lines.append
+    ))
+    # The whole output was drained, only its end is kept and only its start passed on
+    assert code == 0 and stderr.endswith(b"line 19999\n") and len(stderr) < 1100
+    assert stderr.startswith(b"[") and b"bytes of output dropped]" in stderr
+    assert lines[0] == "line 0" and len(lines) < 200 and "further output not shown" in lines[-1]
+
+
+def test_timeout_kills_and_reaps(tmp_path):
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run_sandboxed(python("import time; time.sleep(10)"), str(tmp_path), 0.2))
+    with pytest.raises(ChildProcessError):
+        os.waitpid(-1, os.WNOHANG)
+
+
+def test_timeout_without_pidfd(tmp_path, monkeypatch):
+    # The reaper thread outlives the timeout; the kill must not wait on the pid a second time
+    monkeypatch.delattr(os, "pidfd_open", raising=False)
+    waits = []
+    wait4 = os.wait4
+
+    def counting_wait4(pid, options):
+        waits.append(pid)
+        return wait4(pid, options)
+
+    monkeypatch.setattr(os, "wait4", counting_wait4)
+    # stderr closed, so the run is already waiting for the exit when it times out
+    monkeypatch.setattr(render, "OPENSCAD_BIN", sys.executable)
+    with pytest.raises(render.RenderTimeout):
+        asyncio.run(render.run_openscad(["-c", "import os, time; os.close(2); time.sleep(10)"], str(tmp_path), 0.3))
+    assert len(waits) == 1
+    with pytest.raises(ChildProcessError):
+        os.waitpid(-1, os.WNOHANG)
+
+
+def test_workspaces_are_emptied_and_reused(tmp_path):
+    pool = WorkspacePool(root=str(tmp_path), size=1)
+    first = pool.acquire()
+    extra = pool.acquire()
+    os.makedirs(os.path.join(first, "lib"))
+    open(os.path.join(first, "lib", "a.scad"), "w").close()
+    pool.release(first)
+    pool.release(extra)
+    # Only `size` workspaces are kept, the extra one is gone
+    assert not os.path.exists(extra)
+    assert pool.acquire() == first and os.listdir(first) == []
+    assert pool.stats()["created"] == 2 and pool.stats()["reused"] == 2
+    pool.close()
+    assert not os.path.exists(pool.root)
@@ -0,0 +1,74 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.render_cache as render_cache_module
+from models.models import PlaygroundPreferences, SourceFile
+from routers.openscad_render import router
+from services.openscad_render import compile_part, render_options
+from services.render_cache import RenderCache, render_key
+from services.scad_deps import DependencyGraph, changed_paths
+
+
+def fork_sources(tines="module tines() { cube([3,1,35]); }"):
+    return [
+        SourceFile(path="/main.scad", content="use <handle.scad>;\nuse <neck.scad>;\nuse <parts/tines.scad>;\nfork();"),
+        SourceFile(path="/handle.scad", content="include <round_cylinder.scad>;\nmodule handle() { round_cylinder(h=100, r=10); }"),
+        SourceFile(path="/round_cylinder.scad", content="module round_cylinder(h, r) { cylinder(h=h, r=r); }"),
+        SourceFile(path="/neck.scad", content="include <MCAD/units.scad>\nmodule neck() { cylinder(h=15, r=6.5); }"),
+        SourceFile(path="/parts/tines.scad", content=tines),
+        SourceFile(path="/unused.scad", content="cube(1);"),
+    ]
+
+
+def test_graph_edges_and_closures():
+    graph = DependencyGraph(fork_sources())
+    assert graph.deps["/main.scad"] == {"/handle.scad", "/neck.scad", "/parts/tines.scad"}
+    assert graph.closure("/handle.scad") == {"/handle.scad", "/round_cylinder.scad"}
+    assert graph.external["/neck.scad"] == {"MCAD/units.scad"}
+    assert graph.affected_by(["/round_cylinder.scad"]) == {"/round_cylinder.scad", "/handle.scad", "/main.scad"}
+    order = graph.topological_order()
+    assert order.index("/round_cylinder.scad") < order.index("/handle.scad") < order.index("/main.scad")
+
+
+def test_closure_hash_only_changes_for_affected_files():
+    old, new = DependencyGraph(fork_sources()), DependencyGraph(fork_sources(tines="module tines() {}"))
+    assert changed_paths(fork_sources(), fork_sources(tines="")) == {"/parts/tines.scad"}
+    for path in ("/handle.scad", "/neck.scad", "/round_cylinder.scad"):
+        assert old.closure_hash(path) == new.closure_hash(path)
+    for path in ("/parts/tines.scad", "/main.scad"):
+        assert old.closure_hash(path) != new.closure_hash(path)
+
+
+def test_render_key_ignores_files_outside_the_closure():
+    a = PlaygroundPreferences(sources=fork_sources())
+    b = PlaygroundPreferences(sources=fork_sources()[:-1] + [SourceFile(path="/unused.scad", content="sphere(2);")])
+    assert render_key(a, render_options()) == render_key(b, render_options())
+
+
+def test_compile_part_reuses_unaffected_artifacts(fake_openscad, render_cache):
+    async def scenario():
+        before = PlaygroundPreferences(sources=fork_sources())
+        after = PlaygroundPreferences(sources=fork_sources(tines="module tines() { cube(2); }"))
+        statuses = []
+        for prefs in (before, after):
+            for path, module in (("/handle.scad", "handle"), ("/neck.scad", "neck"), ("/parts/tines.scad", "tines")):
+                stl_file, status = await compile_part(prefs, path, module)
+                stl_file.close()
+                statuses.append(status)
+        return statuses
+
+    assert asyncio.run(scenario()) == ["miss", "miss", "miss", "hit", "hit", "miss"]
+
+
+def test_parts_larger_than_the_cache_are_still_served(fake_openscad, tmp_path, monkeypatch):
+    # The new entry is evicted right away, the compiled STL is returned anyway
+    monkeypatch.setattr(render_cache_module, "_render_cache", RenderCache(root=str(tmp_path / "cache"), max_bytes=100))
+    app = FastAPI()
+    app.include_router(router)
+    resp = TestClient(app).post("/openscad_render/part_stl/?path=/handle.scad&module=handle",
+                                json=PlaygroundPreferences(sources=fork_sources()).model_dump())
+    assert resp.status_code == 200 and resp.headers["x-render-cache"] == "miss"
+    assert resp.content.startswith(b"solid") and resp.headers["content-length"] == str(len(resp.content))
+    assert "handle.stl" in resp.headers["content-disposition"]
@@ -0,0 +1,69 @@
+import json
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from models.models import RawChatResponse
+from services.chat import ChatEngine
+from services.response_cache import MemoryBackend, ResponseCache
+from test_chat_stream import REPLY, make_client
+
+BROKEN = json.dumps({
+    "sources": [{"path": "/main.scad", "content": "error_cube();\n"}],
+    "active_path": "/main.scad",
+    "reply_text": "Oops.",
+})
+
+
+def ask(client, **options):
+    return client.post("/chat/ask_for_object", json={"request_text": "a cube", "validate_code": True, **options})
+
+
+def test_compile_errors_are_repaired(fake_openscad):
+    resp = ask(make_client([BROKEN, REPLY]), max_repairs=1)
+    assert resp.status_code == 200
+    assert resp.json()["validation"] == {"compiled": True, "attempts": 2, "candidates": 1, "stderr": None}
+    assert resp.json()["chat_response"]["sources"][1]["path"] == "/common.scad"
+
+
+def test_repairs_are_bounded_and_failures_not_cached(fake_openscad):
+    cache = ResponseCache(MemoryBackend())
+    resp = ask(make_client([BROKEN, BROKEN, REPLY], cache=cache), max_repairs=1)
+    validation = resp.json()["validation"]
+    assert validation["compiled"] is False and validation["attempts"] == 2
+    assert "Parser error" in validation["stderr"]
+    assert cache.get("a cube") == (None, None)
+
+
+def test_first_candidate_that_compiles_wins(fake_openscad):
+    resp = ask(make_client([BROKEN, REPLY, BROKEN]), candidates=2, max_repairs=0)
+    assert resp.json()["validation"]["compiled"] is True
+    assert resp.json()["validation"]["candidates"] == 2
+    assert resp.json()["chat_response"]["reply_text"].startswith("A cube")
+
+
+def test_repair_prompt_carries_previous_answer_and_errors():
+    engine = ChatEngine(llm=FakeListChatModel(responses=[REPLY]))
+    previous = RawChatResponse.model_validate_json(BROKEN)
+    text = engine.repair_prompt.format(input="a cube", library="", previous=previous.model_dump_json(),
+                                       errors="ERROR: line 1")
+    assert "error_cube();" in text and "ERROR: line 1" in text and "USER REQUEST:\na cube" in text
+
+
+def stream_events(client, **options):
+    body = {"request_text": "a cube", **options}
+    with client.stream("POST", "/chat/ask_for_object_stream", json=body) as resp:
+        text = "".join(resp.iter_text())
+    events = [block.split("\n", 1) for block in text.split("\n\n") if block.startswith("event:")]
+    return resp.headers["x-response-cache"], [(e[len("event: "):], json.loads(d[len("data: "):])) for e, d in events]
+
+
+def test_stream_validates_and_only_replays_compiled_answers(fake_openscad):
+    client = make_client([REPLY, BROKEN, REPLY])
+    # An unvalidated answer is cached, a validated request does not take it
+    assert stream_events(client)[0] == "miss"
+    tier, events = stream_events(client, validate_code=True, max_repairs=1)
+    assert tier == "miss" and [e for e, _ in events] == ["source", "source", "reply_text", "done"]
+    assert events[-1][1]["validation"]["compiled"] is True and events[-1][1]["validation"]["attempts"] == 2
+    # The validated answer replaced it and is replayed from now on
+    tier, events = stream_events(client, validate_code=True)
+    assert tier == "exact" and events[-1][1]["validation"]["compiled"] is True
@@ -0,0 +1,153 @@
+import json
+
+import pytest
+
+from models.models import FileEdit, SourceFile, SourceHunk
+from services.sessions import EditError, SessionStore, apply_edits
+from test_chat_stream import REPLY, make_client
+from test_payload_store import on_event_loop
+
+SOURCES = [
+    SourceFile(path="/main.scad", content="include <handle.scad>\nlength = 80;\nhandle(length);\n"),
+    SourceFile(path="/handle.scad", content="module handle(l) { cube([l, 10, 5]); }\n"),
+]
+
+BAD_EDIT = json.dumps({
+    "edits": [{"path": "/main.scad", "hunks": [{"search": "length = 90;", "replace": "length = 120;"}]}],
+    "reply_text": "Oops.",
+})
+
+
+def test_hunks_new_files_and_deletes():
+    sources = apply_edits(SOURCES, [
+        FileEdit(path="main.scad", hunks=[SourceHunk(search="80", replace="100")]),
+        FileEdit(path="/blade.scad", content="module blade() {}\n"),
+        FileEdit(path="/handle.scad", delete=True),
+    ])
+    assert [f.path for f in sources] == ["/main.scad", "/blade.scad"]
+    assert "length = 100;" in sources[0].content
+
+
+@pytest.mark.parametrize("edit", [
+    FileEdit(path="/main.scad", hunks=[SourceHunk(search="length = 90;", replace="")]),
+    FileEdit(path="/main.scad", hunks=[SourceHunk(search="l", replace="L")]),
+    FileEdit(path="/missing.scad", hunks=[SourceHunk(search="a", replace="b")]),
+    FileEdit(path="/missing.scad", delete=True),
+])
+def test_edits_that_do_not_apply_are_rejected(edit):
+    with pytest.raises(EditError):
+        apply_edits(SOURCES, [edit])
+
+
+def test_store_persists_and_tracks_versions(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SessionStore(path)
+    sid = store.create(SOURCES, "/main.scad", "a fork", "Here is a fork")
+    other = SessionStore(path)
+    assert other.get(sid)["sources"] == SOURCES
+    # An update through one worker is seen by the other, whose memory copy is now stale
+    store.update(sid, SOURCES[:1], "/main.scad", {"request_text": "drop the handle", "reply_text": "", "changed_paths": []})
+    session = other.get(sid)
+    assert session["version"] == 2 and len(session["sources"]) == 1
+    assert [t["request_text"] for t in session["history"]] == ["a fork", "drop the handle"]
+    assert other.get("nope") is None
+    assert SessionStore(path, ttl=0).get(sid) is None
+
+
+def test_failed_update_changes_neither_file_nor_memory(tmp_path, monkeypatch):
+    store = SessionStore(str(tmp_path / "sessions.sqlite3"))
+    sid = store.create(SOURCES, "/main.scad", "a fork", "Here is a fork")
+
+    def broken(session):
+        raise ValueError("disk full")
+
+    monkeypatch.setattr(store, "_row", broken)
+    with pytest.raises(ValueError):
+        store.update(sid, SOURCES[:1], "/main.scad", {"request_text": "x", "reply_text": "", "changed_paths": []})
+    monkeypatch.undo()
+    assert store.get(sid)["version"] == 1 and store.get(sid)["sources"] == SOURCES
+    # No transaction was left open
+    assert store.update(sid, SOURCES[:1], "/main.scad", {"request_text": "x", "reply_text": "", "changed_paths": []})
+
+
+class RecordingSessions(SessionStore):
+    # Notes whether each SQLite call ran on the event loop
+    def __init__(self):
+        super().__init__(":memory:")
+        self.calls = []
+
+    def create(self, *args):
+        self.calls.append(("create", on_event_loop()))
+        return super().create(*args)
+
+    def get(self, sid):
+        self.calls.append(("get", on_event_loop()))
+        return super().get(sid)
+
+    def update(self, *args):
+        self.calls.append(("update", on_event_loop()))
+        return super().update(*args)
+
+
+def test_session_calls_stay_off_the_event_loop():
+    sessions = RecordingSessions()
+    client = make_client([REPLY, json.dumps({
+        "edits": [{"path": "/common.scad", "hunks": [{"search": "10,10,10", "replace": "20,20,20"}]}],
+        "reply_text": "Twice as big.",
+    })], sessions=sessions)
+    sid = client.post("/chat/ask_for_object", json={"request_text": "a cube"}).json()["session_id"]
+    client.post("/chat/ask_for_object", json={"request_text": "bigger", "session_id": sid})
+    client.get(f"/chat/sessions/{sid}")
+    assert sessions.calls == [("create", False), ("get", False), ("update", False), ("get", False)]
+
+
+def test_follow_up_only_sends_the_changes():
+    client = make_client([REPLY, json.dumps({
+        "edits": [{"path": "/common.scad", "hunks": [{"search": "10,10,10", "replace": "20,20,20"}]}],
+        "reply_text": "Twice as big.",
+    })])
+    sid = client.post("/chat/ask_for_object", json={"request_text": "a cube"}).json()["session_id"]
+    resp = client.post("/chat/ask_for_object", json={"request_text": "bigger", "session_id": sid})
+    assert resp.headers["X-Response-Cache"] == "bypass"
+    body = resp.json()
+    assert body["session_id"] == sid and body["chat_response"]["reply_text"] == "Twice as big."
+    assert body["changed_paths"] == ["/common.scad"]
+    # main.scad includes common.scad, so both need recompiling
+    assert body["recompile_paths"] == ["/common.scad", "/main.scad"]
+    sources = {f["path"]: f["content"] for f in body["chat_response"]["sources"]}
+    assert "cube([20,20,20])" in sources["/common.scad"]
+    assert sources["/main.scad"] == "include <common.scad>\nmy_cube();\n"
+    session = client.get(f"/chat/sessions/{sid}").json()
+    assert [t["request_text"] for t in session["history"]] == ["a cube", "bigger"]
+
+
+def test_edits_that_fail_are_retried_once():
+    retry = json.dumps({
+        "edits": [{"path": "/common.scad", "content": "module my_cube() { sphere(5); }"}],
+        "reply_text": "A sphere now.",
+    })
+    client = make_client([REPLY, BAD_EDIT, retry])
+    sid = client.post("/chat/ask_for_object", json={"request_text": "a cube"}).json()["session_id"]
+    body = client.post("/chat/ask_for_object", json={"request_text": "round", "session_id": sid}).json()
+    assert body["chat_response"]["reply_text"] == "A sphere now."
+
+    client = make_client([REPLY, BAD_EDIT, BAD_EDIT])
+    sid = client.post("/chat/ask_for_object", json={"request_text": "a cube"}).json()["session_id"]
+    resp = client.post("/chat/ask_for_object", json={"request_text": "round", "session_id": sid})
+    assert resp.status_code == 500 and "not found" in resp.json()["detail"]
+    # The failed follow-up left the project as it was
+    assert client.get(f"/chat/sessions/{sid}").json()["sources"][1]["content"].startswith("module my_cube() { cube")
+
+
+def test_stream_follow_up_emits_changed_files_only():
+    client = make_client([REPLY, json.dumps({
+        "edits": [{"path": "/common.scad", "hunks": [{"search": "10,10,10", "replace": "5,5,5"}]}],
+        "reply_text": "Smaller.",
+    })])
+    sid = client.post("/chat/ask_for_object", json={"request_text": "a cube"}).json()["session_id"]
+    with client.stream("POST", "/chat/ask_for_object_stream", json={"request_text": "smaller", "session_id": sid}) as resp:
+        text = "".join(resp.iter_text())
+    events = [block.split("\n") for block in text.split("\n\n") if block.startswith("event:")]
+    assert [e[0] for e in events] == ["event: source", "event: reply_text", "event: done"]
+    assert json.loads(events[0][1][len("data: "):])["path"] == "/common.scad"
+    assert client.post("/chat/ask_for_object_stream", json={"request_text": "x", "session_id": "nope"}).status_code == 404
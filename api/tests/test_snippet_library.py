@@ -0,0 +1,119 @@
+import asyncio
+import json
+import shutil
+
+import pytest
+
+from models.models import PlaygroundPreferences, SourceFile
+from routers.chat import flatten_sources
+from services.chat import format_project
+from services.openscad_render import OPENSCAD_BIN, check_sources
+from services.snippet_library import SnippetLibrary, get_snippet_library, parse_modules
+from test_chat_stream import make_client
+
+BOLT = json.dumps({
+    "sources": [{"path": "/main.scad", "content": "use <lib/threads.scad>;\nmetric_thread(diameter=8, pitch=1.25, length=20);\n"}],
+    "active_path": "/main.scad",
+    "reply_text": "An M8 threaded rod.",
+})
+
+GEARS = """
+// ----------------------------------------------------------------------------
+// Spur gear, the teeth
+// are involute.
+module spur_gear (teeth=20,
+                  module_size=1)
+{
+   gear_tooth ();
+}
+
+// ----------------------------------------------------------------------------
+module gear_tooth ()
+{
+   square (1);
+}
+"""
+
+
+def test_only_documented_modules_are_indexed():
+    assert parse_modules(GEARS) == [
+        ("spur_gear", "spur_gear(teeth=20, module_size=1)", "Spur gear, the teeth\nare involute."),
+    ]
+    library = get_snippet_library()
+    modules = {doc["module"]: doc["path"] for doc in library.docs}
+    assert modules["metric_thread"] == "/lib/threads.scad"
+    assert "thread_polyhedron" not in modules
+
+
+def test_search_finds_the_module_that_fits():
+    library = get_snippet_library()
+    assert library.search("a jar lid that screws on with a thread")[0][1]["module"] == "metric_thread"
+    assert library.search("mounting standoffs for a PCB")[0][1]["module"] == "standoff"
+    assert library.search("a cube") == []
+    section = library.prompt_section("an M8 threaded rod")
+    assert "metric_thread(diameter=8, pitch=1" in section and "use <lib/threads.scad>;" in section
+    assert library.prompt_section("a phone stand") == ""
+
+
+def test_index_is_saved_and_rebuilt_when_the_library_changes(tmp_path):
+    (tmp_path / "gears.scad").write_text(GEARS)
+    index_path = str(tmp_path / "index.json")
+    assert SnippetLibrary(str(tmp_path), index_path).rebuilt
+    library = SnippetLibrary(str(tmp_path), index_path)
+    assert not library.rebuilt and library.search("gear with 30 teeth")[0][1]["module"] == "spur_gear"
+    (tmp_path / "gears.scad").write_text(GEARS.replace("Spur gear", "Helical gear"))
+    library = SnippetLibrary(str(tmp_path), index_path)
+    assert library.rebuilt and "Helical" in library.docs[0]["doc"]
+
+
+def test_referenced_library_files_are_attached(tmp_path):
+    (tmp_path / "gears.scad").write_text("include <teeth.scad>\n" + GEARS)
+    (tmp_path / "teeth.scad").write_text("module tooth() { square(1); }\n")
+    (tmp_path / "box.scad").write_text("module box() { cube(1); }\n")
+    (tmp_path / "lid.scad").write_text("module lid() { cube(1); }\n")
+    library = SnippetLibrary(str(tmp_path), "")
+    sources = [
+        SourceFile(path="/main.scad", content="use <lib/gears.scad>;\ninclude <MCAD/involute_gears.scad>\nspur_gear();\n"),
+        SourceFile(path="/lib/box.scad", content="module box() { cube(2); }\n"),
+        SourceFile(path="/part.scad", content="use <lib/box.scad>\nuse <lid.scad>\n"),
+    ]
+    attached = library.attach(sources)
+    # The LLM's own lib/box.scad is kept, library files used by library files come along,
+    # and lid.scad is the project's business: it is not under lib/
+    assert [f.path for f in attached] == ["/main.scad", "/lib/box.scad", "/part.scad", "/lib/gears.scad", "/lib/teeth.scad"]
+    assert attached[1].content == sources[1].content
+    assert [library.is_library_file(f) for f in attached] == [False, False, False, True, True]
+
+
+def test_answers_get_library_files_and_prompts_leave_them_out():
+    client = make_client([BOLT])
+    resp = client.post("/chat/ask_for_object", json={"request_text": "an M8 threaded rod", "use_cache": False})
+    sources = resp.json()["chat_response"]["sources"]
+    assert [f["path"] for f in sources] == ["/main.scad", "/threads.scad"]
+    assert sources[0]["content"].startswith("use <threads.scad>;")
+    assert sources[1]["content"] == get_snippet_library().files["/lib/threads.scad"]
+    # Follow-ups only name the library file instead of sending its 400 lines back
+    project = format_project([SourceFile.model_validate(f) for f in sources], get_snippet_library())
+    assert "=== /threads.scad ===\n(library file" in project and "module metric_thread" not in project
+
+
+def library_project(path: str) -> PlaygroundPreferences:
+    # What an answer calling every documented module of a library file with its defaults compiles to
+    library = get_snippet_library()
+    calls = "".join(f"{name}();\n" for name, _, _ in parse_modules(library.files[path]))
+    main = SourceFile(path="/main.scad", content=f"use <{path[1:]}>;\n{calls}")
+    return PlaygroundPreferences(sources=flatten_sources(library.attach([main])), active_path="/main.scad")
+
+
+@pytest.mark.parametrize("path", sorted(get_snippet_library().files))
+def test_shipped_library_files_are_documented_and_attach(path):
+    assert parse_modules(get_snippet_library().files[path])
+    prefs = library_project(path)
+    assert [f.path for f in prefs.sources] == ["/main.scad", "/" + path.rsplit("/", 1)[-1]]
+
+
+@pytest.mark.skipif(shutil.which(OPENSCAD_BIN) is None, reason="OpenSCAD is not installed")
+@pytest.mark.parametrize("path", sorted(get_snippet_library().files))
+def test_shipped_library_files_compile(path):
+    # Offered to the LLM as tested building blocks: each module must compile without warnings
+    asyncio.run(check_sources(library_project(path)))
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+# Each test imports the app in a fresh interpreter, so the modules loaded by other tests don't count
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["numpy", "trimesh", "langchain_core", "langchain_openai", "openai"]
+
+
+def loaded_after_import(env=None):
+    script = f"import sys, main; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    proc = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=API_DIR, capture_output=True, text=True, env={**os.environ, **(env or {})},
+    )
+    assert proc.returncode == 0, proc.stderr
+    return proc.stdout.strip()
+
+
+def test_app_import_skips_heavy_dependencies():
+    assert loaded_after_import() == ""
+
+
+def test_routers_can_be_disabled():
+    script = "import main; print(sorted({p.split('/')[1] for p in main.app.openapi()['paths']}))"
+    proc = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=API_DIR, capture_output=True, text=True, env={**os.environ, "ENABLED_ROUTERS": "chat,payloads"},
+    )
+    assert proc.returncode == 0, proc.stderr
+    paths = proc.stdout
+    assert "'chat'" in paths and "'p'" in paths and "openscad_render" not in paths
@@ -0,0 +1,75 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from services.static_files import PrecompressedStaticFiles, StaticPage, accepted_encodings
+
+BUNDLE = b"console.log('parts maker');\n" * 200
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_text("<script src='assets/index-Ab1_cD2e.js'></script>")
+    (tmp_path / "assets" / "index-Ab1_cD2e.js").write_bytes(BUNDLE)
+    (tmp_path / "assets" / "index-Ab1_cD2e.js.gz").write_bytes(gzip.compress(BUNDLE))
+    (tmp_path / "assets" / "index-Ab1_cD2e.js.br").write_bytes(b"not really brotli")
+    app = FastAPI()
+    app.mount("/ui", PrecompressedStaticFiles(directory=str(tmp_path), html=True))
+    page = StaticPage(str(tmp_path / "index.html"))
+
+    @app.get("/")
+    def root(request: Request):
+        return page.response(request)
+
+    return TestClient(app)
+
+
+def raw_get(client, url, **headers):
+    # Body as sent, without the client decoding it
+    with client.stream("GET", url, headers=headers) as resp:
+        return resp, b"".join(resp.iter_raw())
+
+
+def test_precompressed_variants_are_negotiated(client):
+    resp, body = raw_get(client, "/ui/assets/index-Ab1_cD2e.js", **{"Accept-Encoding": "gzip, br"})
+    assert resp.headers["content-encoding"] == "br" and body == b"not really brotli"
+    assert resp.headers["content-type"].startswith("text/javascript")
+    resp, body = raw_get(client, "/ui/assets/index-Ab1_cD2e.js", **{"Accept-Encoding": "gzip, br;q=0"})
+    assert resp.headers["content-encoding"] == "gzip" and gzip.decompress(body) == BUNDLE
+    resp, body = raw_get(client, "/ui/assets/index-Ab1_cD2e.js", **{"Accept-Encoding": "identity"})
+    assert "content-encoding" not in resp.headers and body == BUNDLE
+    assert resp.headers["vary"] == "Accept-Encoding"
+
+
+def test_hashed_assets_are_immutable_and_revalidate_with_304(client):
+    resp, _ = raw_get(client, "/ui/assets/index-Ab1_cD2e.js", **{"Accept-Encoding": "gzip"})
+    assert resp.headers["cache-control"] == "public, max-age=31536000, immutable"
+    etag = resp.headers["etag"]
+    # Each encoding is its own representation, with its own strong ETag
+    other, _ = raw_get(client, "/ui/assets/index-Ab1_cD2e.js", **{"Accept-Encoding": "identity"})
+    assert not etag.startswith("W/") and other.headers["etag"] != etag
+    again = client.get("/ui/assets/index-Ab1_cD2e.js", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+
+    index = client.get("/ui/", headers={"Accept-Encoding": "identity"})
+    assert index.headers["cache-control"] == "no-cache"
+    assert client.get("/ui/", headers={"If-None-Match": index.headers["etag"]}).status_code == 304
+
+
+def test_static_page_is_served_from_memory(client, tmp_path):
+    resp, body = raw_get(client, "/", **{"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip" and b"index-Ab1_cD2e.js" in gzip.decompress(body)
+    # The file is read once, changes on disk need a restart
+    (tmp_path / "index.html").write_text("changed")
+    assert b"index-Ab1_cD2e.js" in client.get("/", headers={"Accept-Encoding": "identity"}).content
+    resp = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": f'W/{resp.headers["etag"]}'})
+    assert resp.status_code == 304
+
+
+def test_accept_encoding_parsing():
+    assert accepted_encodings("gzip;q=0.5, br;q=0, deflate") == {"gzip", "deflate"}
+    assert accepted_encodings("*") == {"*", "br", "gzip"}
+    assert accepted_encodings("") == set()
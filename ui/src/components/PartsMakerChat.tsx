@@ -1,4 +1,5 @@
 import React, { useState, useRef, useEffect } from "react";
+import { LiveSocket } from "../liveSocket";
 
 type Message = { role: "user" | "bot"; content: string };
 
@@ -47,7 +48,12 @@ export default function PartsMakerChat() {
     "https://ochafik.com/openscad2/#H4sIAAAAAAAAE61XC3PbNhL+K1s0nkgZSpTsuJ7IVXOxfU0zrfuQe/FlLM8NSC5JKCDAA0A9rLq//WZBUrZkK3c3dxzNiAR2v31isbtmJTe8sGy0Zjx2Yo6/cpezEQtLyVeZ0ZVK+jbmCQuY1ZWJ0bLRzZqVe6lirRwqR5uvpgrgB5RSg8vR4FdTRSsfUljp6qVBULgAp+GXEtXV+buLAEqJ3CJI5EYRD0TcitgCcY+IN3eutKMw1CUqEtjXJgsTHVcFKsed0Kqfu0LWgn4nNuAGQWpnQafAC34nVAZSRIYbgRZELadVATDWdmUdFgTQsYjgcmFBCutGz0vfYHnJ3X4t+0oXSBJdjmTQRh5pE1UqkZjAQri8hn9wYyOWmziHVBuYsgQLPWXg33HJi1LilLV6p0Ii4LKU2qABHuk5dgmCqwRiriBCECqWVYIJJMJg7OQKUqMLCoGBQicobaPyO7WCqMosdLxOwgJX8E6WOf+qS+JFgtx7MUXuKoP27eOIZMLlVdSPdbFxz+al92BfKKyt0IYKF1P1KiTJTjiJMIYpa6MwZae0EWupTWfKMsNXU+btAjDacYedmzeDAOh326zT4wxXVvrtQQAJRlUGb6H3zQBG0DvcpaZHCoXc/AOXzlQJdoY72x4Ul67jdQyebtKTcykyNZ6yGJVDM2V76Oa7dF1vZRjCJ135aKVCJT6s2ohMKC59Cvg4ayn1glK3SYEvJEDgMSuVoIE2AhC2jBZCOKNTBSGcX73vFTqpJFp/fBt1dpeh13BUlmc+q5vdAEQagA9TAC9SG75IeYuRc5U1h8dpSLm0SC8GCz1Hr3qOskQDGeoCnVlNVR2wMThTYeua91JHXIJBq2VF53uqXqR2/KI0OBe4gLcwhBEM+sNTgDCEC61eOshQoeEOwRZcSjSQ8hidBZdzRbRQFATDt2COYQTHpxSopziSm4zcqzJyoIc5hgQzg2gbRS+5UI9tEWmKBlWMnS6s64QQFHaLMZnxsEpPpJNVh9KhXdiQarNZv6//ci3R+sX7RvQP3pF2qkQKHe/EbuPcmq4OiDbY6idiKI0oBNV7Ov1hSLXSYlsyCp2IVGBCAYsNkgfm3AhfX21T1ShZuQQdzTB2JKPOicaU1rj2CJ/JCqesC7akmtwZDjb6N2xbBu9yTzAh5riKsDM8DqA+QGPKk10c8s4vXqenMD+JwisRr6Sg09HJx1QUzHgPZBjCR26Ermyb8P48zoWtuBT+IvFqF5gI8lGsi1IrVM4+Zxgm/89M2LX5Xae7KY2D4M0gGNx2t5xxukV+9oiciP8N+Xnnye7Wvn0wolJPbGr0O91eOXuycr7XwDaZW9QwhA9KoWniAlaoGEG4lxa0kitQiHTjCWVFsmGvWRsOKvyd7qP85PHnrdww42EA+Xg4eJIbNY6NucTOoH+8ZeqjG6h3RH7tvSbPrrdvhK2cON3ee4wwPCaEo+Pb7tO82KF9RPpcxjyHftL3PMOTPnE9JM9RnQ21h/bz72Pv7eO/f9ZN+730UOj2+mewMfppju06aJv27Eu0R9u051+i3eOEw//Mib3/KQTDPcJfH/83EfC6Br3Dwx2YfSiPWPdwPqtAe6YxznVnjsYKrcbNf6dLVGEI10Y4hwqiFVxyIyoLP1I6S/i28J9/+ew/+wrdd8RQ311+vgBc0uABpbZWRBKbDkjyReC3eeVybTq2CzmfIySYiJg7TIBL6WFiXa6MyHLnu2eDst5VCSgUWR5pQxXfU/iexvc2VqduQU29X0APVFaRFDEkuqCeYKGNTBYiwT78vsUhLCTCOiOiyjXTgK5I+MqjLLgxXLlVf2MntYk215VMahMMxijmpKPXvb2Yz88H8GutwoVXwTNf1PYKrYBLrbJH00erUd0JfEhBaRcAzT7fUnc/CkPfBIg5xrootLJ+7qmtrI0M79DocNgfhN/1p4rd3wasHRLY6IZJfrfq+YuB3QYMl6U27nttCu4OL9iI2XnGtpeP/LKT7D5g1J/ReCr5SleO3mhqYSNWVNIJYkyE04aNfI9Z06NhIyrXAYsr63Qh7rAluKcRVRI9+zp9k5wcxjTa5nrxbknKEtd9wJq+kKRFsjI5tzTu/vHj1ad1uYz+/KdeX4jlBzdxn+3Iltdn7rdldLmezJaVTiez3jg9uDhAs5xHZvZJXf38/iC1p5PfLtfLaln9/P1kZk/dyfXZZOZO3MnHm8s//v56WR1cXn+cCDtaRpODhkLPbvRPfHX9V77Wsb6cBO6b2Vt3wvPJTKM7uf44eTWZzW7cyfXfJjOd6rvrs+szdn//L4Qs1EjXDwAA"
   );
   const [justCopied, setJustCopied] = useState(false);
+  // Set once the first part is designed; later messages edit that project instead of starting over
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
+  // Chat requests go over one WebSocket; the id of the one in flight lets "Stop" cancel it
+  const liveRef = useRef<LiveSocket | null>(null);
+  const requestRef = useRef<string | null>(null);
 
   const pageSidePad = 32;
   const pageInnerPad = 24;
@@ -57,6 +63,12 @@ export default function PartsMakerChat() {
     chatRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages, panels.chat]);
 
+  useEffect(() => {
+    const live = new LiveSocket();
+    liveRef.current = live;
+    return () => live.close();
+  }, []);
+
   function ensureAtLeastOne(panel: "chat" | "viewer") {
     if (panels.chat && panels.viewer) setPanels({ ...panels, [panel]: !panels[panel] });
     else { if (!panels[panel]) setPanels({ ...panels, [panel]: true }); }
@@ -68,31 +80,56 @@ export default function PartsMakerChat() {
     setMessages((prev) => [...prev, { role: "user", content: input }]);
     setLoading(true);
 
+    // Placeholder bot message, updated as the streamed reply comes in
+    setMessages((prev) => [...prev, { role: "bot", content: "Designing your part" }]);
+    const updateBotMessage = (content: string) =>
+      setMessages((prev) => [...prev.slice(0, -1), { role: "bot", content }]);
+
     try {
-      const response = await fetch("/chat/ask_for_object", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ request_text: input })
+      const files: string[] = [];
+      let tokens = 0;
+      await new Promise<void>((resolve, reject) => {
+        const onEvent = (event: string, data: any) => {
+          if (event === "token") {
+            tokens += 1;
+            if (!files.length) updateBotMessage(`Designing your part (${tokens} tokens)`);
+          } else if (event === "source") {
+            files.push(data.path);
+            updateBotMessage(`Writing ${files.join(", ")}`);
+          } else if (event === "reply_text") {
+            updateBotMessage(data.reply_text);
+          } else if (event === "done") {
+            updateBotMessage(data?.chat_response?.reply_text ?? "Bot error (missing reply_text)");
+            const url = data?.short_url ?? data?.encoded_url;
+            setViewerUrl(url ? new URL(url, window.location.href).href : viewerUrl);
+            if (data?.session_id) setSessionId(data.session_id);
+            resolve();
+          } else if (event === "cancelled") {
+            updateBotMessage("Stopped.");
+            resolve();
+          } else if (event === "error") {
+            // The session expired: the next message starts a new project
+            if (data?.status === 404) setSessionId(null);
+            reject(new Error(data?.detail));
+          }
+        };
+        liveRef.current!
+          // Short /p/ links keep the reply and the copied link small
+          .request("chat", { request_text: input, inline_url: false, session_id: sessionId }, onEvent)
+          .then((id) => { requestRef.current = id; }, reject);
       });
-      if (!response.ok) {
-        throw new Error("API error");
-      }
-      const data = await response.json();
-      // Get reply text and encoded viewer url:
-      const reply = data?.chat_response?.reply_text ?? "Bot error (missing reply_text)";
-      const url = data?.encoded_url ?? viewerUrl;
-      setMessages((prev) => [...prev, { role: "bot", content: reply }]);
-      setViewerUrl(url);
     } catch (err) {
-      setMessages((prev) => [
-        ...prev,
-        { role: "bot", content: "Sorry, there was an error fetching from the server." }
-      ]);
+      updateBotMessage("Sorry, there was an error fetching from the server.");
     }
+    requestRef.current = null;
     setLoading(false);
     setInput("");
   }
 
+  function stopMessage() {
+    if (requestRef.current) liveRef.current?.cancel(requestRef.current);
+  }
+
   function copyViewerUrl() {
     navigator.clipboard.writeText(viewerUrl);
     setJustCopied(true);
@@ -317,6 +354,24 @@ export default function PartsMakerChat() {
               >
                 {loading ? "Sending…" : "Send"}
               </button>
+              {loading && (
+                <button
+                  type="button"
+                  onClick={stopMessage}
+                  style={{
+                    background: "var(--card-bg)",
+                    color: "var(--primary)",
+                    borderRadius: 7,
+                    fontWeight: 700,
+                    border: "1.5px solid var(--border)",
+                    fontSize: 16,
+                    padding: "0 16px",
+                    cursor: "pointer",
+                  }}
+                >
+                  Stop
+                </button>
+              )}
             </form>
           </div>
         )}
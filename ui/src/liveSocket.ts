@@ -0,0 +1,70 @@
+// One WebSocket to /live/ws for the whole page; chat and render requests are
+// multiplexed over it by id and can be cancelled while they run.
+type Handler = (event: string, data: any) => void;
+
+const FINAL_EVENTS = new Set(["done", "error", "cancelled"]);
+
+function liveUrl() {
+  const { protocol, host } = window.location;
+  return `${protocol === "https:" ? "wss:" : "ws:"}//${host}/live/ws`;
+}
+
+export class LiveSocket {
+  private socket: WebSocket | null = null;
+  private opening: Promise<WebSocket> | null = null;
+  private handlers = new Map<string, Handler>();
+  private nextId = 1;
+  private url: string;
+
+  constructor(url: string = liveUrl()) {
+    this.url = url;
+  }
+
+  private connect(): Promise<WebSocket> {
+    if (this.socket?.readyState === WebSocket.OPEN) return Promise.resolve(this.socket);
+    if (this.opening) return this.opening;
+    this.opening = new Promise((resolve, reject) => {
+      const socket = new WebSocket(this.url);
+      socket.onopen = () => {
+        this.socket = socket;
+        this.opening = null;
+        resolve(socket);
+      };
+      socket.onerror = () => {
+        this.opening = null;
+        reject(new Error("Could not connect to the server"));
+      };
+      socket.onmessage = (msg) => {
+        const { id, event, data } = JSON.parse(msg.data);
+        const handler = this.handlers.get(id);
+        if (!handler) return;
+        if (FINAL_EVENTS.has(event)) this.handlers.delete(id);
+        handler(event, data);
+      };
+      socket.onclose = () => {
+        this.socket = null;
+        // The server cancels whatever was running, tell the callers
+        for (const handler of this.handlers.values()) handler("error", { detail: "Connection closed" });
+        this.handlers.clear();
+      };
+    });
+    return this.opening;
+  }
+
+  // Sends a request, onEvent gets each of its events until "done", "error" or "cancelled"
+  async request(type: "chat" | "render", body: object, onEvent: Handler): Promise<string> {
+    const socket = await this.connect();
+    const id = String(this.nextId++);
+    this.handlers.set(id, onEvent);
+    socket.send(JSON.stringify({ ...body, type, id }));
+    return id;
+  }
+
+  cancel(id: string) {
+    this.socket?.send(JSON.stringify({ type: "cancel", id }));
+  }
+
+  close() {
+    this.socket?.close();
+  }
+}
@@ -11,6 +11,16 @@ export default defineConfig({
         changeOrigin: true,
         // Handles /chat and any /chat/*
       },
+      '/live': {
+        target: 'ws://api:8000',
+        ws: true,
+        // Handles the /live/ws WebSocket
+      },
+      // Short links (/p/{id}); a plain '/p' key would also match every path starting with "p"
+      '^/p(/|$)': {
+        target: 'http://api:8000',
+        changeOrigin: true,
+      },
       '/openscad_playground': {
         target: 'http://api:8000',
         changeOrigin: true,